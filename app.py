@@ -1,131 +1,150 @@
-from flask import Flask, render_template, session, redirect, url_for, request, jsonify
+from flask import Flask, Request, render_template, session, redirect, url_for, request, jsonify, Response, stream_with_context, g
+import io
 import os
+import json
+import time
 import uuid
-import csv
-from datetime import datetime
-import pandas as pd
-import requests # For making requests to external APIs (like Gemini, or a real translation API)
 
-from utils.gemini_api import ask_gemini
-from utils.auth import auth_blueprint, USER_CSV # Import USER_CSV from auth
+from utils.gemini_api import ask_gemini, ask_gemini_stream, is_error_reply
+from utils.response_cache import response_cache, make_cache_key
+from utils.image_pipeline import ImageUpload, IMAGE_MAX_UPLOAD_BYTES
+from utils.image_processor import food_classifier # Lazy, micro-batched local food CNN
+from utils.nutrition_facts import nutrition_facts # Local table for single-food questions
+from utils.filter import route_query, OFF_TOPIC, SINGLE_FOOD, GENERAL_QUESTION, OFF_TOPIC_REPLY
+from utils.single_flight import single_flight
+from utils.message_store import create_message_store
+from utils.meal_plans import meal_planner, MEAL_PLAN_MAX_DAYS
+from utils.intake_store import intake_store, extract_nutrition, daily_targets, summarize_intake
+from utils.conversation_store import create_conversation_store, new_conversation, add_exchange, history_contents, history_tokens
+from utils.auth import auth_blueprint
+from utils.email_outbox import email_outbox
+from utils.password_hasher import password_hasher
+from utils.feedback_manager import FeedbackManager, format_preference_context, FEEDBACK_TYPES
+from utils.user_repository import user_repo # Cached, indexed user lookups (replaces pd.read_csv per request)
+from utils.translator import create_translation_service
+from utils.language_detect import language_detector # Offline n-gram language identification
+from utils.migrations import warn_if_pending
+from utils.metrics import metrics, registry, stage, start_request_timing, server_timing_header, record_request
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from secrets_config import GEMINI_API_KEY
+from secrets_config import GEMINI_API_KEY, FLASK_SECRET_KEY
+
+
+class UploadRequest(Request):
+    """
+    Keeps uploaded files in memory. werkzeug spools file parts of bodies over 500 KB to a temp
+    file; MAX_CONTENT_LENGTH already bounds the body, so a BytesIO is safe for any size allowed.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
 
 
 app = Flask(__name__)
-app.secret_key = FLASK_SECRET_KEY # Use the secret key from config.py
+app.request_class = UploadRequest
+app.secret_key = FLASK_SECRET_KEY # Use the secret key from secrets_config.py
+app.config['MAX_CONTENT_LENGTH'] = IMAGE_MAX_UPLOAD_BYTES # Larger requests are rejected with 413 before parsing
 
 # --- Config ---
-UPLOAD_FOLDER = 'static/uploads'
 DATA_DIR = 'data'
 FEEDBACK_DIR = os.path.join(DATA_DIR, 'feedback')
 MEALS_DIR = os.path.join(DATA_DIR, 'meals')
 FEEDBACK_CSV_FILE = os.path.join(FEEDBACK_DIR, 'user_feedback.csv')
 
 # Ensure required directories exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(FEEDBACK_DIR, exist_ok=True)
 os.makedirs(MEALS_DIR, exist_ok=True)
 
+# Schema changes are applied by `python -m utils.migrations`, not at import; only warn here
+warn_if_pending()
+
 # Register authentication blueprint
 app.register_blueprint(auth_blueprint)
 
-# Store recent bot responses (in-memory)
-recent_bot_responses = {}
+# Store recent bot responses until the user rates them (bounded, TTL-evicting, shared by workers)
+recent_bot_responses = create_message_store()
 
-# --- Feedback Manager ---
-class FeedbackManager:
-    def __init__(self, csv_file_path):
-        self.csv_file_path = csv_file_path
-        self._initialize_csv()
-
-    def _initialize_csv(self):
-        if not os.path.exists(self.csv_file_path):
-            with open(self.csv_file_path, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(['timestamp', 'user_id', 'message_id', 'bot_response_content', 'feedback_type'])
-
-    def load_user_feedback(self, user_id):
-        feedback_data = []
-        if os.path.exists(self.csv_file_path):
-            with open(self.csv_file_path, 'r', newline='', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    if row.get('user_id') == str(user_id):
-                        feedback_data.append(row)
-        return feedback_data
-
-    def store_feedback(self, user_id, message_id, feedback_type, message_content=''):
-        try:
-            self.ensure_feedback_file(user_id) # Ensure file exists before writing
-            filename = self.get_feedback_filename(user_id) # Get user-specific feedback file
-
-            with open(filename, 'a', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow([datetime.now().isoformat(), user_id, message_id, message_content, feedback_type])
-            return True
-        except Exception as e:
-            print(f"Error storing feedback: {e}")
-            return False
-
-    def analyze_feedback(self, user_id):
-        feedback_history = self.load_user_feedback(user_id)
-        preferences = {
-            'liked_items': [],
-            'disliked_items': [],
-            'general_sentiment': {}
-        }
-
-        for entry in feedback_history:
-            content = entry.get('bot_response_content', '').strip()
-            feedback_type = entry.get('feedback_type')
-
-            if content:
-                if feedback_type == 'like':
-                    preferences['liked_items'].append(content)
-                elif feedback_type == 'dislike':
-                    preferences['disliked_items'].append(content)
-
-        preferences['liked_items'] = list(set(preferences['liked_items']))[:5] # Limit to 5 recent liked
-        preferences['disliked_items'] = list(set(preferences['disliked_items']))[:5] # Limit to 5 recent disliked
-
-        return preferences
+# Chat conversations: earlier turns within a token budget, compacted when it is exceeded
+# (see utils/conversation_store.py); shared by workers, forgotten after CONVERSATION_TTL idle
+conversations = create_conversation_store()
 
+# --- Feedback Manager ---
+# Feedback is partitioned per user with a precomputed preference summary (see utils/feedback_manager.py).
+# The old shared user_feedback.csv is split into per-user files once, on first start.
 # Instantiate feedback manager
-feedback_manager = FeedbackManager(FEEDBACK_CSV_FILE)
+feedback_manager = FeedbackManager(FEEDBACK_DIR) # The legacy shared CSV is split by utils.migrations
 
-# --- Simulated Translation Functions (PLACEHOLDERS) ---
-# In a real application, you would integrate with a service like Google Cloud Translation API.
-# Example: https://cloud.google.com/translate/docs/reference/rest/v2/translate
-# You would need to install google-cloud-translate library and set up authentication.
+# --- Translation ---
+# Chat replies are generated directly in the user's language, so translation is only needed for
+# the few fixed English replies and the /api/translate endpoint. The backend is pluggable
+# (Google Cloud Translation with GOOGLE_TRANSLATE_API_KEY, or an offline stand-in), batches
+# strings per request and caches results on (text hash, source, target). See utils/translator.py.
+translation_service = create_translation_service()
 
 def google_translate_text(text, target_language, source_language=None):
-    """
-    Simulates text translation using a placeholder.
-    In a real app, this would call a translation API.
-    """
-    print(f"SIMULATING TRANSLATION: '{text}' from {source_language or 'auto'} to {target_language}")
-    # This is where you'd integrate with Google Cloud Translation API
-    # from google.cloud import translate_v2 as translate
-    # client = translate.Client()
-    # result = client.translate(text, target_language=target_language, source_language=source_language)
-    # return result['translatedText']
-    return text # For now, just return the original text
+    """Translates text into target_language; returns the original text if translation fails."""
+    try:
+        with stage("translate"):
+            return translation_service.translate(text, target_language, source_language)
+    except Exception as e:
+        print(f"Translation to {target_language} failed: {e}")
+        return text
 
 def google_detect_language(text):
+    """Detects the language of text (e.g. 'en', 'hi') in-process, without a network call."""
+    return language_detector.detect(text)
+
+def resolve_target_language(requested, user_text, user_id):
     """
-    Simulates language detection using a placeholder.
-    In a real app, this would call a language detection API.
+    The reply language: the one the frontend asked for, or for 'auto' (or none) the language
+    the message is written in, keeping the user's regional variant (es-MX) when it matches.
     """
-    print(f"SIMULATING LANGUAGE DETECTION for: '{text}'")
-    # This is where you'd integrate with Google Cloud Translation API for detection
-    # from google.cloud import translate_v2 as translate
-    # client = translate.Client()
-    # result = client.detect_language(text)
-    # return result['language']
-    return 'en' # Default to English for placeholder
+    if requested and requested != 'auto':
+        return requested
+    with stage("language"):
+        preferred = (user_repo.get_by_id(user_id) or {}).get('preferred_language')
+        return language_detector.detect_locale(user_text or '', preferred)
+
+# --- Metrics ---
+# Stage timers (utils.metrics.stage) feed both the Prometheus histograms behind /metrics and
+# each response's Server-Timing header; component counters are read from their stats() at flush time.
+def collect_component_metrics():
+    cache = response_cache.stats()
+    translation = translation_service.stats()
+    hasher = password_hasher.stats()
+    outbox = dict(email_outbox.counters) # stats() would also count the queue in SQLite
+    samples = [("response_cache_lookups_total", {'result': result}, cache[key])
+               for result, key in (('memory_hit', 'memory_hits'), ('disk_hit', 'disk_hits'), ('miss', 'misses'))]
+    samples += [("translation_strings_total", {'source': 'cache'}, translation['cache_hits']),
+                ("translation_strings_total", {'source': 'backend'}, translation['backend_strings'])]
+    samples += [("password_operations_total", {'operation': name}, hasher[name])
+                for name in ('checks', 'hashes', 'upgrades', 'rejected', 'timeouts')]
+    samples += [("emails_total", {'outcome': name}, outbox[name]) for name in ('enqueued', 'sent', 'retried', 'failed')]
+    return samples
+
+registry.register_collector(collect_component_metrics)
+metrics.start_flusher()
+
+@app.before_request
+def start_timing():
+    g.request_started = time.perf_counter()
+    start_request_timing()
+
+@app.after_request
+def add_server_timing(response):
+    """Records the request in /metrics and adds the per-stage breakdown for browser devtools."""
+    elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    record_request(route, request.method, response.status_code, elapsed,
+                   None if response.is_streamed else response.content_length)
+    response.headers['Server-Timing'] = server_timing_header(elapsed)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text format, summed over every worker of this instance."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # --- Routes ---
 
@@ -135,74 +154,210 @@ def home():
         return redirect(url_for('auth.login'))
     
     user_id = session['user_id']
-    df_users = pd.read_csv(USER_CSV)
-    user_data = df_users[df_users['user_id'] == user_id].iloc[0].to_dict()
+    user_data = user_repo.get_by_id(user_id) or {}
     
     # Pass preferred_language to the frontend
     preferred_language = user_data.get('preferred_language', 'en-US')
     
     return render_template('index.html', session=session, preferred_language=preferred_language)
 
+def read_uploaded_image(image):
+    """Reads an uploaded food photo into memory (no temp file); None if no image was sent."""
+    with stage("image"):
+        return ImageUpload.from_upload(image)
+
+def load_conversation(conversation_id, user_id):
+    """
+    The user's ongoing conversation, or a new one. A new conversation looks up the profile and
+    feedback preferences once; every later message of it reuses them.
+    """
+    conversation = conversations.get(conversation_id, user_id) if conversation_id else None
+    if conversation is None:
+        with stage("feedback"):
+            user_preferences = feedback_manager.analyze_feedback(user_id)
+        with stage("user_lookup"):
+            user_profile_data = user_repo.get_by_id(user_id) or {}
+        conversation = new_conversation(user_id, user_profile_data, user_preferences)
+    return conversation
+
+def format_user_context(user_profile_data, user_preferences):
+    """
+    The user's profile and feedback preferences as prompt text, constructed in English for the
+    Gemini model. The name is left out so identical profiles share cached responses.
+    """
+    context = f"User Profile: Age={user_profile_data.get('age')}, Gender={user_profile_data.get('gender')}, Diet={user_profile_data.get('diet')}, Goal={user_profile_data.get('goal')}, Height={user_profile_data.get('height_cm')}cm, Weight={user_profile_data.get('weight_kg')}kg, BMI={user_profile_data.get('bmi')}, Medical Conditions={user_profile_data.get('medical_conditions')}.\n"
+    # Compact liked/disliked foods and meal titles, capped at PREFERENCE_TOKEN_BUDGET tokens
+    return context + format_preference_context(user_preferences)
+
+def build_chat_prompt(conversation, user_text, generation_language, image=None, pre_label=None, intent=None):
+    """
+    Builds the Gemini request for a message in `conversation`: the message itself, the user
+    context for the system instruction (profile and feedback preferences) and the earlier turns.
+    pre_label is the local classifier's guess for the photo, passed on as a hint.
+    Returns (message, context, history, cache_key). Only the first message of a conversation is
+    cached (the key uses the language Gemini answers in); follow-ups depend on what came before.
+    """
+    history = history_contents(conversation)
+    registry.observe("conversation_history_tokens", history_tokens(conversation))
+    user_profile_data = conversation['profile']
+    # Liked/disliked meals only matter for suggestions, so a general question opening a conversation
+    # skips them: a shorter prompt, and a cache key shared by more users.
+    user_preferences = conversation['preferences'] if history or intent != GENERAL_QUESTION else {}
+
+    # Stays the same for the whole conversation
+    context = format_user_context(user_profile_data, user_preferences)
+
+    message = user_text or ''
+    if pre_label:
+        # The label is derived from the image alone, so the image hash in the cache key already covers it
+        message += f"\n\nLocal classifier pre-label for the photo: {pre_label['label']} (confidence {pre_label['confidence']:.0%}). Use it to identify the dish unless the photo clearly shows something else."
+
+    # Responses are cached on (normalized query, profile/preference fingerprint, language, image hash)
+    cache_key = None if history else make_cache_key(user_text, user_profile_data, user_preferences, generation_language,
+                                                    image_hash=image.sha256 if image else None)
+    return message, context, history, cache_key
+
+def record_exchange(conversation, user_text, image, pre_label, reply, count_intake=True):
+    """
+    Adds the message and reply to the conversation and, for Gemini replies (count_intake), the
+    reply's nutrition values to the user's intake records. Local lookups such as "calories in
+    banana" share the Nutritional Info layout but aren't meals. Error messages are left out so
+    a retry starts clean.
+    """
+    if is_error_reply(reply):
+        return
+    if count_intake:
+        with stage("intake"):
+            intake_store.append(conversation['user_id'], extract_nutrition(reply))
+    if image is not None: # Photos are not resent with later messages; keep what was recognised
+        label = f": {pre_label['label']}" if pre_label else ""
+        user_text = f"{user_text or ''}\n[Food photo{label}]".strip()
+    add_exchange(conversation, user_text or '', reply)
+    with stage("conversation"):
+        conversations.save(conversation)
+
+def answer_locally(user_text, image=None):
+    """
+    Routes the message (see utils/filter.py) and answers it without Gemini when possible:
+    single-food questions from the local nutrition table, off-topic messages with a fixed reply.
+    Returns (intent, reply); reply is None when the message needs Gemini.
+    """
+    with stage("route"):
+        intent, food = route_query(user_text, has_image=image is not None)
+    if intent == SINGLE_FOOD:
+        return intent, nutrition_facts.format_answer(food)
+    if intent == OFF_TOPIC:
+        return intent, OFF_TOPIC_REPLY
+    return intent, None
+
+def sse_event(data, event=None):
+    """Formats one Server-Sent Event carrying a JSON payload."""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.route('/chat', methods=['POST'])
 def chat():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
 
     user_text = request.form.get('user_text')
-    image = request.files.get('food_image')
-    target_language = request.form.get('target_language', 'en-US') # Get target language from frontend
-    image_path = None
-
-    if image and image.filename:
-        filename = f"{uuid.uuid4()}.jpg"
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        image.save(image_path)
+    # Get target language from frontend ('auto' replies in the language the message is written in)
+    target_language = resolve_target_language(request.form.get('target_language'), user_text, session['user_id'])
+    image = read_uploaded_image(request.files.get('food_image'))
 
     try:
         user_id = session['user_id']
-        
-      
-        # Fetch user preferences
-        user_preferences = feedback_manager.analyze_feedback(user_id)
-        
-        # Fetch full user profile data
-        df_users = pd.read_csv(USER_CSV)
-        user_profile_data = df_users[df_users['user_id'] == user_id].iloc[0].to_dict()
-
-        # Combine user text, preferences, and profile for a richer prompt
-        # The prompt itself is still constructed in English for the Gemini model
-        full_prompt_context = f"User Query: {user_text}\n\n"
-        full_prompt_context += f"User Profile: Name={user_profile_data.get('name')}, Age={user_profile_data.get('age')}, Gender={user_profile_data.get('gender')}, Diet={user_profile_data.get('diet')}, Goal={user_profile_data.get('goal')}, Height={user_profile_data.get('height_cm')}cm, Weight={user_profile_data.get('weight_kg')}kg, BMI={user_profile_data.get('bmi')}, Medical Conditions={user_profile_data.get('medical_conditions')}.\n"
-        
-        if user_preferences.get('liked_items'):
-            full_prompt_context += f"User previously liked: {', '.join(user_preferences['liked_items'])}.\n"
-        if user_preferences.get('disliked_items'):
-            full_prompt_context += f"User previously disliked: {', '.join(user_preferences['disliked_items'])}. Please avoid recommending similar items.\n"
-
-        # Pass the combined context to ask_gemini
-        # Gemini will receive this English prompt
-        bot_response_content_english = ask_gemini(user_text=full_prompt_context, image_path=image_path)
-        
-        # --- Translate Bot Response to Target Language ---
-        bot_response_content = google_translate_text(bot_response_content_english, target_language)
+        pre_label = None
+        with stage("conversation"):
+            conversation = load_conversation(request.form.get('conversation_id'), user_id)
+        intent, local_reply = answer_locally(user_text, image) # e.g. "nutritional info for apple"
+        if local_reply is not None:
+            # Fixed English replies are translated (and cached) instead of generated
+            bot_response_content = google_translate_text(local_reply, target_language, source_language='en')
+        else:
+            with stage("classifier"):
+                pre_label = food_classifier.pre_label(image)
+            message, context, history, cache_key = build_chat_prompt(conversation, user_text, target_language, image, pre_label, intent)
+
+            # The prompt is English; Gemini answers directly in target_language (one round trip, no translation)
+            with stage("gemini"):
+                bot_response_content = ask_gemini(user_text=message, image=image, target_language=target_language,
+                                                  cache_key=cache_key, context=context, history=history)
+        record_exchange(conversation, user_text, image, pre_label, bot_response_content,
+                        count_intake=local_reply is None)
 
         message_id = str(uuid.uuid4())
-        recent_bot_responses[message_id] = bot_response_content # Store the translated content
+        recent_bot_responses.put(message_id, bot_response_content)
 
         return jsonify({
             'response': bot_response_content,
-            'message_id': message_id
+            'message_id': message_id,
+            'pre_label': pre_label,
+            'conversation_id': conversation['id']
         })
     except Exception as e:
         print(f"❌ Error in /chat: {e}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        if image_path and os.path.exists(image_path):
-            os.remove(image_path)
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming variant of /chat. Sends the message_id and conversation_id first ('meta' event), then the reply
+    as 'data' events with text chunks while Gemini generates it, then a 'done' event.
+    The reply is generated directly in target_language, since chunks can't be translated.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    user_text = request.form.get('user_text')
+    target_language = resolve_target_language(request.form.get('target_language'), user_text, session['user_id'])
+    image = read_uploaded_image(request.files.get('food_image'))
+    message_id = str(uuid.uuid4())
+    with stage("conversation"):
+        conversation = load_conversation(request.form.get('conversation_id'), session['user_id'])
+    meta = {'message_id': message_id, 'pre_label': None, 'conversation_id': conversation['id']}
+
+    intent, local_reply = answer_locally(user_text, image)
+    if local_reply is not None:
+        def generate_local():
+            reply = google_translate_text(local_reply, target_language, source_language='en')
+            record_exchange(conversation, user_text, image, None, reply, count_intake=False)
+            recent_bot_responses.put(message_id, reply)
+            yield sse_event(meta, event='meta')
+            yield sse_event({'text': reply})
+            yield sse_event({'message_id': message_id}, event='done')
+
+        return Response(generate_local(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    try:
+        with stage("classifier"):
+            pre_label = food_classifier.pre_label(image)
+        message, context, history, cache_key = build_chat_prompt(conversation, user_text, target_language, image, pre_label, intent)
+    except Exception as e:
+        print(f"❌ Error in /chat/stream: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    def generate():
+        chunks = []
+        failed = False
+        yield sse_event({**meta, 'pre_label': pre_label}, event='meta')
+        for chunk in ask_gemini_stream(message, image, target_language, cache_key=cache_key, context=context, history=history):
+            failed = failed or is_error_reply(chunk)
+            chunks.append(chunk)
+            yield sse_event({'text': chunk})
+        reply = ''.join(chunks)
+        if not failed: # A stream that broke off ends with an error message after partial text
+            record_exchange(conversation, user_text, image, pre_label, reply)
+        recent_bot_responses.put(message_id, reply) # Full text for /feedback
+        yield sse_event({'message_id': message_id}, event='done')
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/feedback', methods=['POST'])
 def handle_feedback():
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     user_id = session.get('user_id')
 
     if not user_id:
@@ -210,6 +365,8 @@ def handle_feedback():
 
     message_id = data.get('message_id')
     feedback_type = data.get('feedback')  # 'like' or 'dislike'
+    if feedback_type not in FEEDBACK_TYPES:
+        return jsonify({'status': 'error', 'message': "feedback must be 'like' or 'dislike'"}), 400
     bot_response_content = recent_bot_responses.get(message_id, "Content not found")
 
     if feedback_manager.store_feedback(user_id, message_id, feedback_type, bot_response_content):
@@ -224,14 +381,82 @@ def get_user_preferences():
     if not user_id:
         return jsonify({'status': 'error', 'message': 'User not logged in'}), 401
 
-    df_users = pd.read_csv(USER_CSV)
-    user_data = df_users[df_users['user_id'] == user_id].iloc[0].to_dict()
+    user_data = user_repo.get_by_id(user_id) or {}
     
     preferences = feedback_manager.analyze_feedback(user_id)
     preferences['preferred_language'] = user_data.get('preferred_language', 'en-US') # Add language to preferences
     
     return jsonify({'status': 'success', 'preferences': preferences})
 
+@app.route('/api/user/intake', methods=['GET'])
+def get_user_intake():
+    """
+    Daily and weekly macro totals, averages and differences from the profile's daily targets,
+    computed from the stored nutrition records (see utils/intake_store.py).
+    Query: weeks (1-104, default 4) and tz_offset (minutes east of UTC, default 0).
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'status': 'error', 'message': 'User not logged in'}), 401
+
+    weeks = request.args.get('weeks', 4, type=int)
+    tz_offset = request.args.get('tz_offset', 0, type=int)
+    if not 1 <= weeks <= 104 or abs(tz_offset) > 14 * 60:
+        return jsonify({'status': 'error', 'message': 'weeks must be 1-104 and tz_offset within +/-840 minutes'}), 400
+
+    user_data = user_repo.get_by_id(user_id) or {}
+    with stage("intake"):
+        summary = summarize_intake(intake_store.load(user_id), daily_targets(user_data), weeks, tz_offset)
+    return jsonify({'status': 'success', 'intake': summary})
+
+@app.route('/api/meal_plans', methods=['POST'])
+def create_meal_plan():
+    """
+    Generates a plan for {"days": 1-7, "target_language": ..., "notes": "..."}: one Gemini call
+    per day, all days at once (see utils/meal_plans.py). The plan is stored for later reads.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'status': 'error', 'message': 'User not logged in'}), 401
+
+    data = request.get_json(silent=True) or {}
+    days = data.get('days', MEAL_PLAN_MAX_DAYS)
+    if not isinstance(days, int) or isinstance(days, bool) or not 1 <= days <= MEAL_PLAN_MAX_DAYS:
+        return jsonify({'status': 'error', 'message': f'days must be between 1 and {MEAL_PLAN_MAX_DAYS}'}), 400
+    notes = data.get('notes') or ''
+    if not isinstance(notes, str):
+        return jsonify({'status': 'error', 'message': 'notes must be a string'}), 400
+    target_language = resolve_target_language(data.get('target_language'), notes, user_id)
+
+    with stage("feedback"):
+        user_preferences = feedback_manager.analyze_feedback(user_id)
+    with stage("user_lookup"):
+        user_profile_data = user_repo.get_by_id(user_id) or {}
+    with stage("meal_plan"):
+        plan = meal_planner.generate(user_id, format_user_context(user_profile_data, user_preferences),
+                                     days, target_language, notes)
+    if plan['status'] == 'failed':
+        return jsonify({'status': 'error', 'message': plan['days'][0]['error'], 'plan': plan}), 502
+    return jsonify({'status': 'success', 'plan': plan})
+
+@app.route('/api/meal_plans', methods=['GET'])
+def list_meal_plans():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'status': 'error', 'message': 'User not logged in'}), 401
+    return jsonify({'status': 'success', 'plans': meal_planner.summaries(user_id)})
+
+@app.route('/api/meal_plans/<plan_id>', methods=['GET'])
+def get_meal_plan(plan_id):
+    """A stored plan; never calls Gemini."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'status': 'error', 'message': 'User not logged in'}), 401
+    plan = meal_planner.get(plan_id, user_id)
+    if plan is None:
+        return jsonify({'status': 'error', 'message': 'Meal plan not found'}), 404
+    return jsonify({'status': 'success', 'plan': plan})
+
 @app.route('/api/update_user_language_preference', methods=['POST'])
 def update_user_language_preference():
     user_id = session.get('user_id')
@@ -245,17 +470,61 @@ def update_user_language_preference():
         return jsonify({'status': 'error', 'message': 'No language provided'}), 400
 
     try:
-        df_users = pd.read_csv(USER_CSV)
-        if 'preferred_language' not in df_users.columns:
-            df_users['preferred_language'] = 'en-US' # Add column if it doesn't exist
-        
-        df_users.loc[df_users['user_id'] == user_id, 'preferred_language'] = new_language
-        df_users.to_csv(USER_CSV, index=False)
+        if not user_repo.update_user(user_id, {'preferred_language': new_language}):
+            return jsonify({'status': 'error', 'message': 'User not found'}), 404
         return jsonify({'status': 'success', 'message': 'Language preference updated.'})
     except Exception as e:
         print(f"Error updating user language preference: {e}")
         return jsonify({'status': 'error', 'message': f'Failed to update language preference: {e}'}), 500
 
+@app.route('/api/translate', methods=['POST'])
+def translate():
+    """
+    Translates {"text": "..."} or a batch {"texts": [...]} into target_lang.
+    Returns translated_text / translated_texts; source_lang is optional (auto-detected).
+    """
+    if not session.get('user_id'):
+        return jsonify({'error': 'User not logged in'}), 401
+
+    data = request.get_json(silent=True) or {}
+    target_language = data.get('target_lang')
+    source_language = data.get('source_lang')
+    texts = data.get('texts')
+    if not target_language:
+        return jsonify({'error': 'No target language provided'}), 400
+    if texts is None and data.get('text') is None:
+        return jsonify({'error': 'No text provided'}), 400
+    if texts is not None and (not isinstance(texts, list) or not all(isinstance(t, str) for t in texts)):
+        return jsonify({'error': 'texts must be a list of strings'}), 400
+
+    try:
+        if texts is not None:
+            return jsonify({'translated_texts': translation_service.translate_many(texts, target_language, source_language)})
+        return jsonify({'translated_text': translation_service.translate(str(data['text']), target_language, source_language)})
+    except Exception as e:
+        print(f"Error in /api/translate: {e}")
+        return jsonify({'error': f'Translation failed: {e}'}), 502
+
+@app.route('/api/detect_language', methods=['POST'])
+def detect_language():
+    if not session.get('user_id'):
+        return jsonify({'error': 'User not logged in'}), 401
+
+    data = request.get_json(silent=True) or {}
+    text = data.get('text')
+    if not text:
+        return jsonify({'error': 'No text provided'}), 400
+    # locale is a full tag from the language selector (e.g. 'hi-IN'), usable for speech recognition
+    return jsonify({'detected_language': google_detect_language(text),
+                    'locale': resolve_target_language('auto', text, session['user_id'])})
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({'status': 'success', 'response_cache': response_cache.stats(),
+                    'single_flight': single_flight.stats(), 'food_classifier': food_classifier.stats(),
+                    'translation': translation_service.stats(), 'email_outbox': email_outbox.stats(),
+                    'password_hasher': password_hasher.stats()})
+
 
 # --- Run the App ---
 if __name__ == '__main__':
@@ -0,0 +1,243 @@
+"""
+ASGI entry point.
+POST /chat and POST /chat/stream are served on the event loop (async profile/feedback lookups
+and an async Gemini call or stream), so one worker can hold hundreds of chats in flight while
+waiting on the upstream. Every other route is handed to the Flask app through asgiref's WSGI
+adapter, which runs them one at a time on a single thread per worker.
+
+Run with: gunicorn asgi:application -k uvicorn.workers.UvicornWorker
+"""
+import asyncio
+import io
+import json
+import time
+import uuid
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+
+from app import (app, UploadRequest, answer_locally, build_chat_prompt, load_conversation, read_uploaded_image, record_exchange,
+                 google_translate_text, recent_bot_responses, resolve_target_language, sse_event)
+from utils.gemini_api import ask_gemini_async, ask_gemini_stream_async, async_gemini_client, is_error_reply
+from utils.image_processor import food_classifier
+from utils.metrics import stage, start_request_timing, server_timing_header, record_request
+
+flask_asgi = WsgiToAsgi(app)
+
+
+async def read_body(receive, max_length):
+    """The whole request body, or None once it grows past max_length bytes."""
+    chunks = []
+    length = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get('body', b'')
+        length += len(chunk)
+        if length > max_length:
+            return None
+        chunks.append(chunk)
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+def declared_length(scope):
+    """The request's Content-Length header, or 0 if it has none."""
+    for name, value in scope['headers']:
+        if name.lower() == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return 0
+    return 0
+
+
+def build_request(scope, body):
+    """Wraps the buffered ASGI request in the app's Request class so form/file/cookie parsing matches Flask."""
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'CONTENT_TYPE': headers.get('content-type', ''),
+        'CONTENT_LENGTH': str(len(body)),
+        'HTTP_COOKIE': headers.get('cookie', ''),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+    }
+    return UploadRequest(environ)
+
+
+def load_session(request):
+    """Decodes Flask's signed session cookie, exactly as the WSGI routes would."""
+    serializer = app.session_interface.get_signing_serializer(app)
+    cookie = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+    if serializer is None or not cookie:
+        return {}
+    try:
+        return serializer.loads(cookie, max_age=int(app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+async def send_json(send, status, data, started, route='/chat', method='POST'):
+    """Sends the reply with the same Server-Timing header and /metrics accounting as the Flask routes."""
+    body = json.dumps(data).encode('utf-8')
+    elapsed = time.perf_counter() - started
+    record_request(route, method, status, elapsed, len(body))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                    (b'server-timing', server_timing_header(elapsed).encode('latin-1'))],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def read_chat_request(scope, receive, send, route, started):
+    """
+    The buffered request and the session's user_id, or (None, None) once a 413 or 401 has been
+    sent. The body is capped at MAX_CONTENT_LENGTH and parsed in memory.
+    """
+    body = await read_body(receive, app.config['MAX_CONTENT_LENGTH'])
+    if body is None:
+        await send_json(send, 413, {'error': 'Request too large'}, started, route)
+        return None, None
+    request = build_request(scope, body)
+    user_id = load_session(request).get('user_id')
+    if not user_id:
+        await send_json(send, 401, {'error': 'Unauthorized'}, started, route)
+        return None, None
+    return request, user_id
+
+
+async def chat(scope, receive, send):
+    """Async twin of app.chat with the same request/response contract."""
+    started = time.perf_counter()
+    start_request_timing() # Per task; the asyncio.to_thread calls below inherit it
+    request, user_id = await read_chat_request(scope, receive, send, '/chat', started)
+    if request is None:
+        return
+
+    user_text = request.form.get('user_text')
+    target_language = await asyncio.to_thread(resolve_target_language, request.form.get('target_language'),
+                                              user_text, user_id) # User lookup + n-gram scoring
+    image = read_uploaded_image(request.files.get('food_image')) # Already buffered in memory
+
+    try:
+        pre_label = None
+        with stage("conversation"):
+            conversation = await asyncio.to_thread(load_conversation, request.form.get('conversation_id'), user_id)
+        intent, local_reply = answer_locally(user_text, image) # Microseconds; fine on the loop
+        if local_reply is not None:
+            bot_response_content = await asyncio.to_thread(google_translate_text, local_reply, target_language, 'en')
+        else:
+            with stage("classifier"):
+                pre_label = await food_classifier.pre_label_async(image)
+            message, context, history, cache_key = await asyncio.to_thread(
+                build_chat_prompt, conversation, user_text, target_language, image, pre_label, intent)
+
+            with stage("gemini"):
+                bot_response_content = await ask_gemini_async(message, image, target_language, cache_key=cache_key,
+                                                              context=context, history=history)
+        await asyncio.to_thread(record_exchange, conversation, user_text, image, pre_label, bot_response_content,
+                                local_reply is None)
+
+        message_id = str(uuid.uuid4())
+        await asyncio.to_thread(recent_bot_responses.put, message_id, bot_response_content)
+
+        await send_json(send, 200, {'response': bot_response_content, 'message_id': message_id,
+                                   'pre_label': pre_label, 'conversation_id': conversation['id']}, started)
+    except Exception as e:
+        print(f"❌ Error in async /chat: {e}")
+        await send_json(send, 500, {'error': str(e)}, started)
+
+
+async def chat_stream(scope, receive, send):
+    """Async twin of app.chat_stream: the same 'meta', text and 'done' Server-Sent Events."""
+    started = time.perf_counter()
+    start_request_timing()
+    request, user_id = await read_chat_request(scope, receive, send, '/chat/stream', started)
+    if request is None:
+        return
+
+    user_text = request.form.get('user_text')
+    target_language = await asyncio.to_thread(resolve_target_language, request.form.get('target_language'),
+                                              user_text, user_id)
+    image = read_uploaded_image(request.files.get('food_image'))
+    message_id = str(uuid.uuid4())
+    try:
+        with stage("conversation"):
+            conversation = await asyncio.to_thread(load_conversation, request.form.get('conversation_id'), user_id)
+        meta = {'message_id': message_id, 'pre_label': None, 'conversation_id': conversation['id']}
+        intent, local_reply = answer_locally(user_text, image)
+        if local_reply is None:
+            with stage("classifier"):
+                meta['pre_label'] = await food_classifier.pre_label_async(image)
+            message, context, history, cache_key = await asyncio.to_thread(
+                build_chat_prompt, conversation, user_text, target_language, image, meta['pre_label'], intent)
+        else:
+            local_reply = await asyncio.to_thread(google_translate_text, local_reply, target_language, 'en')
+    except Exception as e:
+        print(f"❌ Error in async /chat/stream: {e}")
+        await send_json(send, 500, {'error': str(e)}, started, '/chat/stream')
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                    (b'server-timing', server_timing_header(time.perf_counter() - started).encode('latin-1'))],
+    })
+
+    async def send_event(data, event=None):
+        await send({'type': 'http.response.body', 'body': sse_event(data, event).encode('utf-8'), 'more_body': True})
+
+    await send_event(meta, event='meta')
+    if local_reply is not None:
+        reply = local_reply
+        await send_event({'text': reply})
+        await asyncio.to_thread(record_exchange, conversation, user_text, image, None, reply, False)
+    else:
+        chunks = []
+        failed = False
+        async for chunk in ask_gemini_stream_async(message, image, target_language, cache_key=cache_key,
+                                                   context=context, history=history):
+            failed = failed or is_error_reply(chunk)
+            chunks.append(chunk)
+            await send_event({'text': chunk})
+        reply = ''.join(chunks)
+        if not failed: # A stream that broke off ends with an error message after partial text
+            await asyncio.to_thread(record_exchange, conversation, user_text, image, meta['pre_label'], reply)
+    await asyncio.to_thread(recent_bot_responses.put, message_id, reply) # Full text for /feedback
+    await send_event({'message_id': message_id}, event='done')
+    await send({'type': 'http.response.body', 'body': b''})
+    record_request('/chat/stream', 'POST', 200, time.perf_counter() - started, None)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_gemini_client.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/chat' and scope['method'] == 'POST':
+        await chat(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/chat/stream' and scope['method'] == 'POST':
+        await chat_stream(scope, receive, send)
+    elif scope['type'] == 'http' and declared_length(scope) > app.config['MAX_CONTENT_LENGTH']:
+        # asgiref buffers the whole body (spooled to disk past 64 KB) before Flask checks the limit
+        await send_json(send, 413, {'error': 'Request too large'}, time.perf_counter(), 'unmatched', scope['method'])
+    else:
+        await flask_asgi(scope, receive, send)
@@ -0,0 +1,122 @@
+"""
+Compares the sync /chat path (Flask views, one request at a time per gunicorn sync worker)
+with the async path (asgi.py, a single event loop) against a fake slow Gemini upstream, then
+sends concurrent /chat/stream requests to one event loop: they should all finish after about
+one upstream latency, not one after another.
+
+Usage: python benchmarks/bench_async_chat.py --requests 200 --latency 0.5 --sync-workers 4 --streams 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_gemini import FakeGeminiServer
+
+
+def run_sync(flask_app, cookie, total_requests, workers):
+    """Each thread stands in for one sync worker handling its requests back to back."""
+    counter = iter(range(total_requests))
+    lock = threading.Lock()
+    statuses = []
+
+    def worker():
+        client = flask_app.test_client()
+        client.set_cookie('session', cookie)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            response = client.post('/chat', data={'user_text': f'sync benchmark query {i}'})
+            statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, statuses
+
+
+async def call_asgi_chat(application, cookie, i, path='/chat'):
+    body = urlencode({'user_text': f'async benchmark query {i} ({path})'}).encode() # Distinct per path, so no cache hits
+    scope = {
+        'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'',
+        'scheme': 'http', 'server': ('localhost', 80),
+        'headers': [(b'content-type', b'application/x-www-form-urlencoded'),
+                    (b'cookie', f'session={cookie}'.encode())],
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]['status']
+
+
+async def run_async(application, cookie, total_requests):
+    start = time.perf_counter()
+    statuses = await asyncio.gather(*(call_asgi_chat(application, cookie, i) for i in range(total_requests)))
+    return time.perf_counter() - start, statuses
+
+
+async def run_streams(application, cookie, total_requests):
+    """Concurrent /chat/stream requests; returns (elapsed, statuses, seconds until each one finished)."""
+    start = time.perf_counter()
+
+    async def timed(i):
+        status = await call_asgi_chat(application, cookie, i, path='/chat/stream')
+        return status, time.perf_counter() - start
+
+    results = await asyncio.gather(*(timed(i) for i in range(total_requests)))
+    return time.perf_counter() - start, [status for status, _ in results], sorted(done for _, done in results)
+
+
+def report(name, elapsed, statuses):
+    ok = sum(1 for status in statuses if status == 200)
+    print(f"{name:<28} {len(statuses):>6} req  {ok:>6} ok  {elapsed:>8.2f} s  {len(statuses) / elapsed:>8.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='Chats sent through each path')
+    parser.add_argument('--latency', type=float, default=0.5, help='Fake upstream latency in seconds')
+    parser.add_argument('--sync-workers', type=int, default=4, help='Sync workers to simulate')
+    parser.add_argument('--streams', type=int, default=8, help='Concurrent /chat/stream requests')
+    args = parser.parse_args()
+
+    upstream = FakeGeminiServer(latency=args.latency).start()
+    os.environ['GEMINI_API_BASE'] = upstream.base_url
+    os.chdir(tempfile.mkdtemp(prefix='bench_async_chat_')) # Keep data/ writes out of the repo
+
+    import app as app_module
+    import asgi
+
+    flask_app = app_module.app
+    cookie = flask_app.session_interface.get_signing_serializer(flask_app).dumps({'user_id': 'bench_user'})
+
+    print(f"Fake upstream latency {args.latency}s, {args.requests} requests per path")
+    report(f"sync ({args.sync_workers} workers)", *run_sync(flask_app, cookie, args.requests, args.sync_workers))
+    report("async (1 worker)", *asyncio.run(run_async(asgi.application, cookie, args.requests)))
+
+    elapsed, statuses, finished = asyncio.run(run_streams(asgi.application, cookie, args.streams))
+    report("async /chat/stream", elapsed, statuses)
+    print(f"{'':<28} first finished {finished[0]:.2f} s, last {finished[-1]:.2f} s "
+          f"({finished[-1] / args.latency:.1f}x upstream latency; ~1x means they ran concurrently)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+CPU-only throughput of the local food classifier at micro-batch sizes 1, 8 and 32, both
+as raw forward passes and through the batching service with concurrent callers.
+
+Usage: python benchmarks/bench_classifier.py --images 512 --clients 32
+Uses models/cnn_model.h5 if present, otherwise an untrained stand-in CNN with the same input shape.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1") # CPU only, set before TensorFlow loads
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+from utils.image_processor import FoodClassifier, INPUT_SIZE, decode_image, preprocess_batch
+
+BATCH_SIZES = (1, 8, 32)
+
+
+def load_or_build_model(model_path):
+    import tensorflow as tf
+    if os.path.exists(model_path):
+        return tf.keras.models.load_model(model_path, compile=False), model_path
+    model = tf.keras.Sequential([
+        tf.keras.layers.Input(shape=INPUT_SIZE + (3,)),
+        tf.keras.layers.Conv2D(32, 3, activation="relu"),
+        tf.keras.layers.MaxPooling2D(),
+        tf.keras.layers.Conv2D(64, 3, activation="relu"),
+        tf.keras.layers.MaxPooling2D(),
+        tf.keras.layers.Conv2D(128, 3, activation="relu"),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(101, activation="softmax"),
+    ])
+    return model, "stand-in CNN (no model file)"
+
+
+def make_jpegs(count, seed=0):
+    """Random 640x480 photos, JPEG-encoded like real uploads."""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        ok, encoded = cv2.imencode(".jpg", rng.integers(0, 255, (480, 640, 3), dtype=np.uint8))
+        images.append(encoded.tobytes())
+    return images
+
+
+def bench_forward(model, decoded, batch_size):
+    """Images/s for back-to-back forward passes of batch_size images."""
+    batches = [preprocess_batch(decoded[i:i + batch_size]) for i in range(0, len(decoded), batch_size)]
+    model.predict_on_batch(batches[0]) # Warm-up
+    start = time.perf_counter()
+    for batch in batches:
+        model.predict_on_batch(batch)
+    return len(decoded) / (time.perf_counter() - start)
+
+
+def bench_service(model, jpegs, batch_size, clients, max_wait_ms):
+    """Images/s through FoodClassifier with `clients` threads classifying concurrently."""
+    classifier = FoodClassifier(model=model, max_batch_size=batch_size, max_wait_ms=max_wait_ms)
+    classifier.classify(jpegs[0]) # Warm-up and start the worker
+    classifier.counters.update(images=0, batches=0)
+    counter = iter(range(len(jpegs)))
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            classifier.classify(jpegs[i])
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(jpegs) / (time.perf_counter() - start), classifier.stats()["avg_batch_size"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=512, help="Images classified per configuration")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent callers for the service benchmark")
+    parser.add_argument("--max-wait-ms", type=float, default=10, help="Batch fill deadline")
+    parser.add_argument("--model", default=os.path.join(ROOT, "models", "cnn_model.h5"))
+    args = parser.parse_args()
+
+    model, description = load_or_build_model(args.model)
+    jpegs = make_jpegs(args.images)
+    start = time.perf_counter()
+    decoded = [decode_image(data) for data in jpegs]
+    decode_ms = (time.perf_counter() - start) * 1000 / len(jpegs)
+
+    print(f"Model: {description}; {args.images} images, decode+resize {decode_ms:.2f} ms/image")
+    print(f"{'batch':>6} {'forward img/s':>14} {'service img/s':>14} {'avg batch':>10}")
+    for batch_size in BATCH_SIZES:
+        forward = bench_forward(model, decoded, batch_size)
+        service, avg_batch = bench_service(model, jpegs, batch_size, args.clients, args.max_wait_ms)
+        print(f"{batch_size:>6} {forward:>14.1f} {service:>14.1f} {avg_batch:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Micro-benchmarks of the per-request building blocks against a generated dataset: feedback
+summaries (analyze_feedback), user lookups, /chat prompt assembly and intake analytics. Each operation is
+timed call by call; --json saves p50/p95/p99 and --baseline flags regressions.
+
+Usage: python benchmarks/bench_micro.py --dataset /tmp/ds100k --calls 2000 --json results/micro_100k.json
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_utils import summarize_ms, write_results, compare_results
+from generate_dataset import ACTIVE_RATER_SHARE, user_email
+
+
+def time_calls(fn, args_list):
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - started)
+    return summarize_ms(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dataset", default=ROOT, help="Directory containing the data/ to use (generate_dataset.py)")
+    parser.add_argument("--calls", type=int, default=2000, help="Timed calls per operation")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare p50 with an earlier --json file; exit 1 on a >20%% regression")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    dataset = os.path.abspath(args.dataset)
+    os.chdir(dataset) # Every store resolves data/ relative to the working directory
+
+    import app
+    from utils.feedback_manager import FeedbackManager, format_preference_context
+    from utils.filter import MEAL_PLAN
+    from utils.intake_store import intake_store, summarize_intake
+    from utils.user_repository import UserRepository, USER_CSV
+
+    rng = random.Random(args.seed)
+    user_count = app.user_repo.count()
+    raters = max(1, int(user_count * ACTIVE_RATER_SHARE))
+    random_ids = [rng.randint(1, user_count) for _ in range(args.calls)]
+    rater_ids = [(f"user_{rng.randint(1, raters)}",) for _ in range(args.calls)]
+    heavy_user = "user_1" # The generator gives the first 1% of raters a fifth of all feedback
+    feedback = FeedbackManager(app.FEEDBACK_DIR)
+    rebuild_calls = max(1, args.calls // 100)
+    results = {}
+
+    results["analyze_feedback"] = time_calls(feedback.analyze_feedback, rater_ids)
+    results["analyze_feedback_heavy_user"] = time_calls(feedback.analyze_feedback, [(heavy_user,)] * args.calls)
+    results["rebuild_summary_heavy_user"] = time_calls(feedback._rebuild_summary, [(heavy_user,)] * rebuild_calls)
+    results["format_preference_context"] = time_calls(
+        format_preference_context, [(feedback.analyze_feedback(heavy_user),)] * args.calls)
+
+    results["user_lookup_by_id"] = time_calls(app.user_repo.get_by_id, [(f"user_{i}",) for i in random_ids])
+    results["user_lookup_by_email"] = time_calls(app.user_repo.get_by_email, [(user_email(i),) for i in random_ids])
+    started = time.perf_counter()
+    csv_repo = UserRepository(USER_CSV)
+    csv_repo.count() # First use parses the whole CSV
+    results["csv_repository_load"] = summarize_ms([time.perf_counter() - started])
+    results["csv_user_lookup_by_id"] = time_calls(csv_repo.get_by_id, [(f"user_{i}",) for i in random_ids])
+
+    def first_message_prompt(user_id, *args):
+        return app.build_chat_prompt(app.load_conversation(None, user_id), *args) # Profile + preference lookups included
+
+    prompt_args = [(user_id, "Suggest a high protein vegetarian breakfast", "en-US", None, None, MEAL_PLAN)
+                   for (user_id,) in rater_ids]
+    results["build_chat_prompt"] = time_calls(first_message_prompt, prompt_args)
+
+    records = intake_store.load(heavy_user)
+    results["intake_summary_heavy_user_52w"] = time_calls(
+        lambda user_id: summarize_intake(intake_store.load(user_id), None, 52, now=int(records["ts"].max())),
+        [(heavy_user,)] * args.calls)
+
+    print(f"Dataset {dataset}: {user_count} users, {args.calls} calls per operation")
+    print(f"{'operation':<30} {'calls':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, r in results.items():
+        print(f"{name:<30} {r['count']:>7} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f}")
+
+    if json_path:
+        write_results(json_path, "micro", {"dataset": dataset, "users": user_count, "calls": args.calls}, results)
+    if baseline_path and compare_results(baseline_path, results, metric="p50_ms"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Micro-benchmark of the /chat query router (utils/filter.route_query) over a labelled corpus,
+next to the old substring check it replaced.
+
+Usage: python benchmarks/bench_query_router.py --rounds 2000
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT) # The nutrition table path is relative to the repo root
+
+from utils.filter import route_query, OFF_TOPIC, SINGLE_FOOD, MEAL_PLAN, GENERAL_QUESTION
+
+CORPUS = [
+    ("nutritional info for apple", SINGLE_FOOD),
+    ("Calories in an orange?", SINGLE_FOOD),
+    ("how much protein does paneer have", SINGLE_FOOD),
+    ("strawberries nutrition", SINGLE_FOOD),
+    ("macros of greek yogurt", SINGLE_FOOD),
+    ("what is the nutrition of dal", SINGLE_FOOD),
+    ("banana", SINGLE_FOOD),
+    ("Suggest breakfast options", MEAL_PLAN),
+    ("Give me a 7 day meal plan for weight loss", MEAL_PLAN),
+    ("high protein vegetarian dinner ideas", MEAL_PLAN),
+    ("suggest some high protein snacks", MEAL_PLAN),
+    ("what should I eat before a workout", MEAL_PLAN),
+    ("मुझे नाश्ता के लिए कुछ सुझाव दो", MEAL_PLAN),
+    ("receta saludable para la cena", MEAL_PLAN),
+    ("idées de petit-déjeuner riche en protéines", MEAL_PLAN),
+    ("Was soll ich zum Abendessen kochen?", MEAL_PLAN),
+    ("benefits of protein", GENERAL_QUESTION),
+    ("Is intermittent fasting good for diabetics?", GENERAL_QUESTION),
+    ("how much water should I drink daily", GENERAL_QUESTION),
+    ("which vitamins help with hair fall", GENERAL_QUESTION),
+    ("is apple and banana good together", GENERAL_QUESTION),
+    ("वजन कम करने के लिए क्या करें", GENERAL_QUESTION),
+    ("¿Cuánta proteína necesito al día?", GENERAL_QUESTION),
+    ("Quels aliments sont riches en fer ?", GENERAL_QUESTION),
+    ("hello", GENERAL_QUESTION),
+    ("what's the weather in Mumbai tomorrow", OFF_TOPIC),
+    ("write me a python function to sort a list", OFF_TOPIC),
+    ("who won the cricket match yesterday", OFF_TOPIC),
+    ("tell me a joke", OFF_TOPIC),
+    ("bitcoin price prediction", OFF_TOPIC),
+    ("recommend a good movie for tonight", OFF_TOPIC),
+]
+
+
+def legacy_is_food_related(text):
+    """The substring check utils/filter.py used to have."""
+    keywords = ["nutrition", "vitamin", "calories", "food", "fruit", "meal", "protein", "diet", "carbs", "sugar"]
+    return any(word in text.lower() for word in keywords)
+
+
+def time_per_call(fn, texts, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            fn(text)
+    return (time.perf_counter() - start) / (rounds * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000, help="Passes over the corpus")
+    args = parser.parse_args()
+
+    texts = [text for text, _ in CORPUS]
+    mismatches = [(text, expected, route_query(text)[0]) for text, expected in CORPUS
+                  if route_query(text)[0] != expected]
+    intents = Counter(route_query(text)[0] for text in texts)
+
+    print(f"Corpus: {len(CORPUS)} queries x {args.rounds} rounds")
+    print(f"legacy is_food_related  {time_per_call(legacy_is_food_related, texts, args.rounds):8.2f} us/query")
+    print(f"route_query             {time_per_call(route_query, texts, args.rounds):8.2f} us/query")
+    print("Intents: " + ", ".join(f"{intent}={count}" for intent, count in sorted(intents.items())))
+    print(f"Matches expected intent: {len(CORPUS) - len(mismatches)}/{len(CORPUS)}")
+    for text, expected, actual in mismatches:
+        print(f"  {text!r}: expected {expected}, got {actual}")
+
+
+if __name__ == "__main__":
+    main()
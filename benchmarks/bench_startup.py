@@ -0,0 +1,99 @@
+"""
+Startup benchmark: import time of app.py and time to the first served request, each measured
+in a fresh interpreter, plus a check that heavy modules stay out of the startup path.
+Exits non-zero when a limit is exceeded, so it can guard against regressions in CI.
+
+Usage: python benchmarks/bench_startup.py --runs 5 --max-import-ms 400 --max-first-request-ms 600
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must not be imported by `import app`; each is loaded on first use
+LAZY_MODULES = ["pandas", "cv2", "tensorflow"]
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/login')
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_request_ms": (served - start) * 1000,
+    "status": response.status_code,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+
+def run_child(extra_args=()):
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, *extra_args, "-c", CHILD], cwd=ROOT, capture_output=True, text=True,
+                            env={**os.environ, "PYTHONPATH": ROOT})
+    wall_ms = (time.perf_counter() - started) * 1000
+    if output.returncode != 0:
+        sys.exit(f"Child failed:\n{output.stderr}")
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result["process_ms"] = wall_ms
+    return result, output.stderr
+
+
+def slowest_imports(stderr, top):
+    """Parses -X importtime output into the `top` modules with the largest cumulative time."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="Fail if median import time exceeds this")
+    parser.add_argument("--max-first-request-ms", type=float, default=None,
+                        help="Fail if median time to the first response exceeds this")
+    parser.add_argument("--profile", type=int, default=0, metavar="N", help="Also list the N slowest imports")
+    args = parser.parse_args()
+
+    results = [run_child()[0] for _ in range(args.runs)]
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    first_ms = statistics.median(r["first_request_ms"] for r in results)
+    process_ms = statistics.median(r["process_ms"] for r in results)
+    loaded = sorted({name for r in results for name in r["loaded"]})
+
+    print(f"Runs: {args.runs}")
+    print(f"import app               {import_ms:8.1f} ms (median)")
+    print(f"first request served     {first_ms:8.1f} ms after import started (GET /login -> {results[0]['status']})")
+    print(f"interpreter start..exit  {process_ms:8.1f} ms")
+    print(f"Heavy modules loaded at startup: {', '.join(loaded) if loaded else 'none'}")
+
+    if args.profile:
+        _, stderr = run_child(["-X", "importtime"])
+        print("Slowest imports (cumulative):")
+        for cumulative, name in slowest_imports(stderr, args.profile):
+            print(f"  {cumulative / 1000:8.1f} ms  {name.strip()}")
+
+    failures = []
+    if loaded:
+        failures.append(f"heavy modules imported eagerly: {', '.join(loaded)}")
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failures.append(f"import took {import_ms:.1f} ms (limit {args.max_import_ms:.0f})")
+    if args.max_first_request_ms is not None and first_ms > args.max_first_request_ms:
+        failures.append(f"first request after {first_ms:.1f} ms (limit {args.max_first_request_ms:.0f})")
+    if failures:
+        sys.exit("FAIL: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
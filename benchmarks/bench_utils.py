@@ -0,0 +1,85 @@
+"""
+Helpers shared by the benchmark scripts: latency summaries and machine-readable results.
+
+Results are written as JSON ({"benchmark", "created_at", "git_commit", "python", "params",
+"results": {name: {metric: value}}}) so two runs can be diffed with compare_results().
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_samples))))
+    return sorted_samples[min(rank, len(sorted_samples)) - 1]
+
+
+def summarize_ms(samples_seconds):
+    """count / mean / p50 / p95 / p99 / max in milliseconds for a list of durations in seconds."""
+    samples = sorted(s * 1000 for s in samples_seconds)
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean_ms": round(sum(samples) / len(samples), 3),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(path, benchmark, params, results):
+    """Saves one run; returns the document written."""
+    document = {
+        "benchmark": benchmark,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "params": params,
+        "results": results,
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    print(f"Results written to {path}")
+    return document
+
+
+def compare_results(baseline_path, results, metric="p50_ms", tolerance=0.2):
+    """
+    Prints each benchmark's `metric` next to the baseline file's. Returns the names that got
+    slower by more than `tolerance` (0.2 = 20%).
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"Compared with {baseline_path} ({metric}):")
+    for name, current in results.items():
+        before = baseline.get(name, {}).get(metric)
+        now = current.get(metric)
+        if before is None or now is None:
+            continue
+        change = (now - before) / before if before else 0.0
+        flag = "  REGRESSION" if change > tolerance else ""
+        print(f"  {name:<36} {before:>10.3f} -> {now:>10.3f}  {change:+7.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
@@ -0,0 +1,117 @@
+"""
+Local stand-in for the Gemini REST API, used by the benchmarks.
+Answers generateContent (JSON) and streamGenerateContent (SSE) with the same response
+shape as the real service after a configurable delay; requests asking for a JSON reply
+(generationConfig.responseMimeType, as meal plans do) get a day of meals as JSON. A configurable fraction of requests
+fail with the 503 UNAVAILABLE error body the real API sends when it is overloaded.
+
+Point the app at it with GEMINI_API_BASE=http://127.0.0.1:<port>/v1beta
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = (
+    "Option 1: Oatmeal with Berries\n"
+    "Description: Rolled oats topped with mixed berries.\n"
+    "Nutritional Info:\n"
+    "Protein: 12g\nCarbohydrates: 45g\nFats: 15g\nFiber: 8g\nCalories: 350 kcal\n"
+)
+
+DEFAULT_JSON_REPLY = json.dumps({"meals": [
+    {"meal": meal, "name": name, "description": f"A simple {name.lower()}.", "protein_g": protein, "carbs_g": carbs,
+     "fat_g": fat, "fiber_g": fiber, "calories_kcal": calories}
+    for meal, name, protein, carbs, fat, fiber, calories in [
+        ("Breakfast", "Oatmeal with Berries", 12, 45, 15, 8, 350), ("Lunch", "Chickpea Salad", 18, 40, 12, 10, 420),
+        ("Snack", "Greek Yogurt", 10, 8, 4, 0, 110), ("Dinner", "Paneer Stir-fry", 24, 30, 18, 6, 480)]
+]})
+
+
+def gemini_response(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+
+def gemini_error(code=503, status="UNAVAILABLE", message="The model is overloaded. Please try again later."):
+    return {"error": {"code": code, "message": message, "status": status}}
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        wants_json = request.get("generationConfig", {}).get("responseMimeType") == "application/json"
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            fail = server.error_rate > 0 and server.random.random() < server.error_rate
+            if fail:
+                server.error_count += 1
+        time.sleep(server.latency)
+
+        if fail:
+            body = json.dumps(gemini_error()).encode("utf-8")
+            self.send_response(503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if ":streamGenerateContent" in self.path:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for line in server.reply.splitlines(keepends=True):
+                self.wfile.write(f"data: {json.dumps(gemini_response(line))}\r\n\r\n".encode("utf-8"))
+                self.wfile.flush()
+            self.close_connection = True
+            return
+
+        body = json.dumps(gemini_response(DEFAULT_JSON_REPLY if wants_json else server.reply)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port=0, latency=0.5, reply=DEFAULT_REPLY, error_rate=0.0, seed=None):
+        super().__init__(("127.0.0.1", port), FakeGeminiHandler)
+        self.latency = latency
+        self.reply = reply
+        self.error_rate = error_rate # Fraction of requests answered with a 503
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.error_count = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1beta"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run a fake Gemini upstream")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before each reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail with 503")
+    args = parser.parse_args()
+    server = FakeGeminiServer(args.port, args.latency, error_rate=args.error_rate)
+    print(f"Fake Gemini listening on {server.base_url}")
+    server.serve_forever()
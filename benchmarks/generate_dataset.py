@@ -0,0 +1,149 @@
+"""
+Generates a synthetic data/ directory (users.csv and the legacy shared user_feedback.csv) at a
+given size, then runs the migrations so it has the same layout as a deployed instance
+(users.db, per-user feedback logs and summaries, intake records). Every user has the same password, so the
+load driver can log in as any of them.
+
+Usage: python benchmarks/generate_dataset.py --size 100k --out /tmp/ds100k
+       python benchmarks/load_test.py --dataset /tmp/ds100k ...   (see load_test.py)
+"""
+import argparse
+import csv
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bcrypt
+
+from utils.password_hasher import BCRYPT_ROUNDS
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+BENCH_PASSWORD = "benchmark-password"
+ACTIVE_RATER_SHARE = 0.1 # Fraction of users who ever rate a reply; feedback rows go to them
+
+GENDERS = ["Male", "Female", "Other"]
+DIETS = ["Vegetarian", "Non-Vegetarian", "Vegan", "Eggetarian", "Keto"]
+GOALS = ["Weight Loss", "Muscle Gain", "Overall Wellness", "Maintain Weight"]
+CONDITIONS = ["None", "None", "None", "Diabetes", "Hypertension", "PCOS", "Thyroid"]
+LANGUAGES = ["en-US"] * 6 + ["hi-IN", "es-ES", "fr-FR", "de-DE"]
+MEAL_WORDS = ["Bowl", "Salad", "Wrap", "Curry", "Stir-fry", "Smoothie", "Toast", "Soup"]
+
+
+def load_food_names():
+    with open(os.path.join(ROOT, "data", "nutrition", "foods.csv"), encoding="utf-8") as f:
+        return [row["name"] for row in csv.DictReader(f)]
+
+
+def user_email(i):
+    return f"user{i}@bench.example"
+
+
+def fake_reply(rng, foods):
+    """A meal-suggestion reply in the shape Gemini returns (titles + Nutritional Info blocks)."""
+    lines = ["Here are some options for you:", ""]
+    for option in range(1, rng.randint(2, 3) + 1):
+        picked = rng.sample(foods, 2)
+        lines += [f"Option {option}: {picked[0].title()} and {picked[1].title()} {rng.choice(MEAL_WORDS)}",
+                  f"Description: A simple dish with {picked[0]} and {picked[1]}.",
+                  "Nutritional Info:",
+                  f"Protein: {rng.randint(5, 40)}g", f"Carbohydrates: {rng.randint(10, 80)}g",
+                  f"Fats: {rng.randint(3, 30)}g", f"Fiber: {rng.randint(1, 12)}g",
+                  f"Calories: {rng.randint(150, 700)} kcal", ""]
+    return "\n".join(lines)
+
+
+def write_users(path, count, rng, hashed_password):
+    # Imported here: utils.user_repository opens data/users.db relative to the cwd on import,
+    # and the other benchmarks import this module before switching to their dataset
+    from utils.user_repository import EXPECTED_COLUMNS
+
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPECTED_COLUMNS)
+        for i in range(1, count + 1):
+            height = rng.randint(150, 195)
+            weight = rng.randint(45, 110)
+            writer.writerow([
+                f"user_{i}", f"Bench User {i}", user_email(i), hashed_password, rng.randint(18, 70),
+                rng.choice(GENDERS), rng.choice(DIETS), rng.choice(GOALS), float(height), float(weight),
+                round(weight / (height / 100) ** 2, 2), rng.choice(CONDITIONS), rng.choice(LANGUAGES),
+            ])
+
+
+def write_feedback(path, rows, user_count, rng, foods):
+    """Legacy shared log; a fifth of the rows go to the top 1% of raters, so some histories are long."""
+    raters = max(1, int(user_count * ACTIVE_RATER_SHARE))
+    heavy_raters = max(1, raters // 100)
+    start = datetime(2025, 1, 1)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "user_id", "message_id", "bot_response_content", "feedback_type"])
+        for i in range(rows):
+            user = rng.randint(1, heavy_raters) if rng.random() < 0.2 else rng.randint(1, raters)
+            writer.writerow([
+                (start + timedelta(seconds=i * 37)).isoformat(), f"user_{user}", str(uuid.UUID(int=rng.getrandbits(128))),
+                fake_reply(rng, foods), "like" if rng.random() < 0.7 else "dislike",
+            ])
+
+
+def link_static_data(out_data_dir):
+    """The nutrition table and language profiles are read-only; link them instead of copying."""
+    for name in ("nutrition", "langid"):
+        target = os.path.join(out_data_dir, name)
+        if os.path.exists(target):
+            continue
+        source = os.path.join(ROOT, "data", name)
+        try:
+            os.symlink(source, target, target_is_directory=True)
+        except (OSError, NotImplementedError):
+            shutil.copytree(source, target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", choices=sorted(SIZES), default="1k", help="Users and feedback rows")
+    parser.add_argument("--users", type=int, help="Override the number of users")
+    parser.add_argument("--feedback", type=int, help="Override the number of feedback rows")
+    parser.add_argument("--out", help="Output root (default benchmarks/datasets/<size>)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--bcrypt-rounds", type=int, default=BCRYPT_ROUNDS,
+                        help="Cost of the shared password hash (match BCRYPT_ROUNDS to avoid upgrades on login)")
+    parser.add_argument("--no-migrate", action="store_true", help="Only write the CSV files")
+    args = parser.parse_args()
+
+    users = args.users or SIZES[args.size]
+    feedback_rows = args.feedback if args.feedback is not None else SIZES[args.size]
+    out = os.path.abspath(args.out or os.path.join(ROOT, "benchmarks", "datasets", args.size))
+    data_dir = os.path.join(out, "data")
+    if os.path.exists(os.path.join(data_dir, "users.csv")):
+        sys.exit(f"{data_dir} already has a dataset; remove it first")
+    os.makedirs(os.path.join(data_dir, "feedback"), exist_ok=True)
+    rng = random.Random(args.seed)
+    hashed_password = bcrypt.hashpw(BENCH_PASSWORD.encode("utf-8"), bcrypt.gensalt(args.bcrypt_rounds)).decode("utf-8")
+
+    started = time.perf_counter()
+    write_users(os.path.join(data_dir, "users.csv"), users, rng, hashed_password)
+    print(f"{users} users written in {time.perf_counter() - started:.1f} s")
+    started = time.perf_counter()
+    write_feedback(os.path.join(data_dir, "feedback", "user_feedback.csv"), feedback_rows, users, rng, load_food_names())
+    print(f"{feedback_rows} feedback rows written in {time.perf_counter() - started:.1f} s")
+    link_static_data(data_dir)
+
+    if not args.no_migrate:
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "utils.migrations"], cwd=out, check=True,
+                       env={**os.environ, "PYTHONPATH": ROOT})
+        print(f"Migrations finished in {time.perf_counter() - started:.1f} s")
+    print(f"Dataset ready in {out} (log in as user<N>@bench.example / {BENCH_PASSWORD})")
+
+
+if __name__ == "__main__":
+    main()
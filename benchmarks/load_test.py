@@ -0,0 +1,229 @@
+"""
+HTTP load driver for /login, /chat, /feedback and /api/user/preferences.
+Starts the app in-process on a threaded WSGI server (or targets --url), points it at a local
+fake Gemini with configurable latency and error rate, and has N virtual users issue a weighted
+mix of requests. Reports per-route p50/p95/p99 latency and throughput; --json saves them.
+
+Usage:
+  python benchmarks/generate_dataset.py --size 100k --out /tmp/ds100k
+  python benchmarks/load_test.py --dataset /tmp/ds100k --concurrency 32 --duration 30 \\
+      --gemini-latency 0.8 --gemini-error-rate 0.02 --json results/load_100k.json
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+
+from bench_utils import summarize_ms, write_results, compare_results
+from fake_gemini import FakeGeminiServer
+from generate_dataset import BENCH_PASSWORD, user_email
+
+DEFAULT_MIX = "chat=5,feedback=2,preferences=2,login=1"
+
+# Meal requests and general questions reach Gemini; single-food ones are answered from the local table
+QUERIES = [
+    "Suggest a high protein vegetarian breakfast",
+    "Give me a 3 day meal plan for weight loss",
+    "What should I eat before a workout?",
+    "Healthy dinner ideas with paneer",
+    "Is intermittent fasting good for diabetics?",
+    "How much water should I drink daily?",
+    "nutritional info for apple",
+    "calories in banana",
+    "protein in eggs",
+]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        route, weight = part.split("=")
+        mix[route.strip()] = float(weight)
+    return mix
+
+
+def start_local_app(dataset, gemini_base):
+    """Imports the app with the dataset's data/ as working directory and serves it on a free port."""
+    os.environ["GEMINI_API_BASE"] = gemini_base
+    os.chdir(dataset)
+    import logging
+    logging.getLogger("werkzeug").setLevel(logging.WARNING) # No access log line per request
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    server.request_queue_size = 1024
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+class VirtualUser:
+    """One browser session: logs in, then issues requests from the mix until the run ends."""
+
+    def __init__(self, base_url, user_count, rng, unique_queries):
+        self.base_url = base_url
+        self.user_count = user_count
+        self.rng = rng
+        self.unique_queries = unique_queries
+        self.session = None
+        self.last_message_id = None
+        self.sent = 0
+
+    def login(self):
+        self.session = requests.Session()
+        email = user_email(self.rng.randint(1, self.user_count))
+        response = self.session.post(f"{self.base_url}/login", data={"email": email, "password": BENCH_PASSWORD},
+                                     allow_redirects=False, timeout=60)
+        return response.status_code == 302
+
+    def chat(self):
+        text = self.rng.choice(QUERIES)
+        if self.unique_queries:
+            self.sent += 1
+            text = f"{text} (variant {id(self)}-{self.sent})"
+        response = self.session.post(f"{self.base_url}/chat", data={"user_text": text, "target_language": "en-US"},
+                                     timeout=120)
+        if response.status_code != 200:
+            return False
+        body = response.json()
+        self.last_message_id = body.get("message_id")
+        return "error" not in body
+
+    def feedback(self):
+        if self.last_message_id is None:
+            return None # Nothing to rate yet; the caller issues a chat instead
+        response = self.session.post(f"{self.base_url}/feedback", timeout=60, json={
+            "message_id": self.last_message_id, "feedback": "like" if self.rng.random() < 0.7 else "dislike"})
+        self.last_message_id = None
+        return response.status_code == 200
+
+    def preferences(self):
+        return self.session.get(f"{self.base_url}/api/user/preferences", timeout=60).status_code == 200
+
+
+def run_load(base_url, user_count, mix, concurrency, duration, total_requests, seed, unique_queries):
+    samples = {route: [] for route in mix} # route -> [seconds]
+    errors = {route: 0 for route in mix}
+    lock = threading.Lock()
+    counter = iter(range(total_requests)) if total_requests else None
+    deadline = time.perf_counter() + duration
+    routes, weights = list(mix), list(mix.values())
+
+    def record(route, started, ok):
+        elapsed = time.perf_counter() - started
+        with lock:
+            samples[route].append(elapsed)
+            if not ok:
+                errors[route] += 1
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        user = VirtualUser(base_url, user_count, rng, unique_queries)
+        started = time.perf_counter()
+        logged_in = user.login()
+        if "login" in mix:
+            record("login", started, logged_in)
+        while time.perf_counter() < deadline:
+            if counter is not None:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+            route = rng.choices(routes, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = getattr(user, route)()
+                if ok is None:
+                    route, ok = "chat", user.chat()
+            except requests.RequestException:
+                ok = False
+            record(route, started, ok)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for route in mix:
+        summary = summarize_ms(samples[route])
+        summary["errors"] = errors[route]
+        summary["throughput_rps"] = round(len(samples[route]) / elapsed, 2)
+        results[route] = summary
+    total = sum(len(s) for s in samples.values())
+    results["all"] = {**summarize_ms([s for route in mix for s in samples[route]]),
+                      "errors": sum(errors.values()), "throughput_rps": round(total / elapsed, 2)}
+    return results, elapsed
+
+
+def print_table(results, elapsed):
+    print(f"{'route':<12} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, r in results.items():
+        if not r.get("count"):
+            continue
+        print(f"{route:<12} {r['count']:>9} {r['errors']:>7} {r['throughput_rps']:>8.1f} "
+              f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+    print(f"Elapsed: {elapsed:.1f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dataset", default=ROOT, help="Directory containing the data/ to serve (generate_dataset.py)")
+    parser.add_argument("--users", type=int, help="Users in the dataset (default: counted from users.csv)")
+    parser.add_argument("--url", help="Target an already running server instead of starting one")
+    parser.add_argument("--concurrency", type=int, default=16, help="Virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests (0: run for --duration)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Route weights, e.g. chat=5,feedback=2,preferences=2,login=1")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="Seconds per fake Gemini reply")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="Fraction of fake Gemini calls failing with 503")
+    parser.add_argument("--unique-queries", action="store_true", help="Make every chat message unique (no cache hits)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare p95 with an earlier --json file; exit 1 on a >20%% regression")
+    args = parser.parse_args()
+
+    dataset = os.path.abspath(args.dataset)
+    json_path = os.path.abspath(args.json) if args.json else None # The local app runs with the dataset as cwd
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    users = args.users
+    if users is None:
+        with open(os.path.join(dataset, "data", "users.csv"), encoding="utf-8") as f:
+            users = sum(1 for _ in f) - 1
+    mix = parse_mix(args.mix)
+
+    gemini = None
+    base_url = args.url
+    if base_url is None:
+        gemini = FakeGeminiServer(latency=args.gemini_latency, error_rate=args.gemini_error_rate, seed=args.seed).start()
+        base_url, _ = start_local_app(dataset, gemini.base_url)
+    print(f"Target {base_url}: {args.concurrency} virtual users, {users} users in dataset, mix {args.mix}")
+
+    results, elapsed = run_load(base_url, users, mix, args.concurrency, args.duration, args.requests, args.seed,
+                                args.unique_queries)
+    print_table(results, elapsed)
+    if gemini is not None:
+        print(f"Fake Gemini: {gemini.request_count} calls, {gemini.error_count} injected errors")
+        results["upstream"] = {"gemini_calls": gemini.request_count, "gemini_errors": gemini.error_count}
+
+    params = {"dataset": dataset, "users": users, "concurrency": args.concurrency, "duration": args.duration,
+              "requests": args.requests, "mix": args.mix, "gemini_latency": args.gemini_latency,
+              "gemini_error_rate": args.gemini_error_rate, "unique_queries": args.unique_queries}
+    if json_path:
+        write_results(json_path, "load_test", params, results)
+    if baseline_path and compare_results(baseline_path, results, metric="p95_ms"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
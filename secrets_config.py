@@ -6,3 +6,7 @@ EMAIL_PASSWORD = 'tuoufgismascoemo' # This is the app password, not your regular
 
 # Secret key for Flask sessions (IMPORTANT: Change this to a strong, random value)
 FLASK_SECRET_KEY = 'super_secret_and_random_key_for_flask_sessions_change_me!'
+
+# Google Cloud Translation API key (optional; leave empty to use the offline stand-in translator)
+GOOGLE_TRANSLATE_API_KEY = ''
+
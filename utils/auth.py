@@ -1,71 +1,29 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-import pandas as pd
-import os
-import bcrypt # For password hashing
-import smtplib # For sending emails
-import ssl # For secure email connection
-from email.message import EmailMessage # For creating email messages
 import random # For OTP generation
-import time # For OTP expiry
 from datetime import datetime, timedelta # For OTP expiry
-from config import EMAIL_ADDRESS, EMAIL_PASSWORD # Import email credentials
 import uuid # Import the uuid module
+from utils.user_repository import user_repo # Cached, indexed user lookups
+from utils.otp_store import create_otp_store, start_otp_sweeper
+from utils.email_outbox import email_outbox # Background SMTP delivery
+from utils.password_hasher import password_hasher, HasherBusy # bcrypt in a bounded process pool
 
 auth_blueprint = Blueprint("auth", __name__, template_folder="../templates")
-USER_CSV = "data/users.csv"
-OTP_STORAGE = {} # In-memory storage for OTPs: {email: {otp: "...", expiry: datetime}}
-
-# Define the expected columns for the users.csv file
-# Added 'height_cm', 'weight_kg', 'bmi', 'medical_conditions', and 'preferred_language'
-EXPECTED_COLUMNS = ["user_id", "name", "email", "hashed_password", "age", "gender", "diet", "goal", 
-                    "height_cm", "weight_kg", "bmi", "medical_conditions", "preferred_language"]
-
-# Ensure CSV file exists and has the correct columns
-if not os.path.exists(USER_CSV):
-    # If the file does not exist, create it with the expected columns
-    df = pd.DataFrame(columns=EXPECTED_COLUMNS)
-    df.to_csv(USER_CSV, index=False)
-else:
-    # If the file exists, read it and check its columns
-    df = pd.read_csv(USER_CSV)
-    
-    # Check if the existing columns match the expected columns
-    # Convert to sets for order-independent comparison
-    if set(df.columns) != set(EXPECTED_COLUMNS) or len(df.columns) != len(EXPECTED_COLUMNS):
-        print(f"⚠️ Warning: {USER_CSV} has unexpected columns. Recreating with correct schema.")
-        # Recreate the DataFrame with the correct columns and copy existing data if possible
-        new_df = pd.DataFrame(columns=EXPECTED_COLUMNS)
-        for col in EXPECTED_COLUMNS:
-            if col in df.columns:
-                new_df[col] = df[col]
-            else:
-                new_df[col] = None # Add missing columns as None
-        new_df.to_csv(USER_CSV, index=False)
-        df = new_df # Update df to the new DataFrame
-    else:
-        # Ensure all new columns exist for older CSVs
-        for col in ["height_cm", "weight_kg", "bmi", "medical_conditions", "preferred_language"]:
-            if col not in df.columns:
-                df[col] = None
-        df.to_csv(USER_CSV, index=False)
+OTP_TTL = timedelta(minutes=5) # OTP valid for 5 minutes
+RESET_TOKEN_TTL = timedelta(minutes=15) # Time allowed between verifying the OTP and choosing a new password
+
+# Expiring OTP store shared by all workers: {email: {otp: "...", expiry: datetime, reset_token: "..."}}
+otp_store = create_otp_store()
+start_otp_sweeper(otp_store)
+email_outbox.start()
 
 
 def send_email(receiver_email, subject, body):
-    """Sends an email using Gmail SMTP."""
-    em = EmailMessage()
-    em['From'] = EMAIL_ADDRESS
-    em['To'] = receiver_email
-    em['Subject'] = subject
-    em.set_content(body)
-
-    context = ssl.create_default_context()
+    """Queues an email in the outbox; background senders deliver it (with retries) over pooled SMTP connections."""
     try:
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465, context=context) as smtp:
-            smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            smtp.send_message(em)
+        email_outbox.enqueue(receiver_email, subject, body)
         return True
     except Exception as e:
-        print(f"❌ Error sending email to {receiver_email}: {e}")
+        print(f"❌ Error queueing email to {receiver_email}: {e}")
         flash(f"❌ Failed to send email: {e}", "danger")
         return False
 
@@ -87,14 +45,22 @@ def login():
         email = request.form['email'].strip()
         password = request.form['password'].strip()
 
-        df = pd.read_csv(USER_CSV)
-        user = df[df['email'] == email]
-
-        if not user.empty:
-            stored_hashed_password = user.iloc[0]['hashed_password']
-            if stored_hashed_password and bcrypt.checkpw(password.encode('utf-8'), stored_hashed_password.encode('utf-8')):
-                session['user_id'] = user.iloc[0]['user_id']
-                session['name'] = user.iloc[0]['name']
+        user = user_repo.get_by_email(email)
+
+        if user is not None:
+            stored_hashed_password = user['hashed_password']
+            try:
+                # Hashes below the configured cost are re-hashed in the background after a correct password
+                valid = bool(stored_hashed_password) and password_hasher.check_and_upgrade(
+                    password, stored_hashed_password,
+                    lambda new_hash: user_repo.update_user(user['user_id'], {'hashed_password': new_hash})
+                )
+            except HasherBusy:
+                flash("⏳ Too many sign-ins right now. Please try again in a moment.", "warning")
+                return render_template("login.html", error=False), 503
+            if valid:
+                session['user_id'] = user['user_id']
+                session['name'] = user['name']
                 flash("Login successful!", "success")
                 return redirect(url_for('home'))
             else:
@@ -110,22 +76,19 @@ def login():
 def register():
     if request.method == 'POST':
         data = request.form
-        # Read the CSV again to ensure the latest schema is used, especially after recreation
-        df = pd.read_csv(USER_CSV) 
 
         email = data['email'].strip()
         password = data['password'].strip()
         otp_input = data.get('otp_input') # OTP entered by user
         action = data.get('action') # 'send_otp' or 'register'
 
-        if email in df['email'].values:
+        if user_repo.email_exists(email):
             flash("⚠️ Email already registered!", "warning")
             return render_template("register.html") # Stay on register page
 
         if action == 'send_otp':
             otp = generate_otp()
-            expiry_time = datetime.now() + timedelta(minutes=5) # OTP valid for 5 minutes
-            OTP_STORAGE[email] = {'otp': otp, 'expiry': expiry_time}
+            otp_store.put(email, otp, OTP_TTL.total_seconds())
 
             subject = "Nutrition Assistant: Your Registration OTP"
             body = f"Your One-Time Password (OTP) for Nutrition Assistant registration is: {otp}\n\nThis OTP is valid for 5 minutes."
@@ -138,16 +101,18 @@ def register():
                 return render_template("register.html", form_data=data)
 
         elif action == 'register':
-            stored_otp_info = OTP_STORAGE.get(email)
+            stored_otp_info = otp_store.get(email)
 
             if not stored_otp_info or stored_otp_info['otp'] != otp_input or datetime.now() > stored_otp_info['expiry']:
                 flash("❌ Invalid or expired OTP. Please request a new one.", "danger")
                 return render_template("register.html", email_sent=True, user_email=email, form_data=data)
             
             # OTP is valid, proceed with registration
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            
-            user_id = f"user_{len(df)+1}"
+            try:
+                hashed_password = password_hasher.hash(password)
+            except HasherBusy:
+                flash("⏳ The server is busy right now. Please try again in a moment.", "warning")
+                return render_template("register.html", email_sent=True, user_email=email, form_data=data), 503
             
             # Get height and weight, calculate BMI
             height_cm = float(data['height_cm']) if data.get('height_cm') else None
@@ -156,16 +121,19 @@ def register():
             medical_conditions = data.get('medical_conditions', 'None') # Get medical conditions
             preferred_language = data.get('preferred_language', 'en-US') # Get preferred language
 
-            new_row = pd.DataFrame([[user_id, data['name'], email, hashed_password,
-                                     data['age'], data['gender'], data['diet'], data['goal'],
-                                     height_cm, weight_kg, bmi, medical_conditions, preferred_language]],
-                                   columns=EXPECTED_COLUMNS) # Use EXPECTED_COLUMNS here
-
-            df = pd.concat([df, new_row], ignore_index=True)
-            df.to_csv(USER_CSV, index=False)
+            # user_id is allocated atomically by the store, so concurrent registrations can't collide
+            new_user = user_repo.add_user({
+                'name': data['name'], 'email': email, 'hashed_password': hashed_password,
+                'age': data['age'], 'gender': data['gender'], 'diet': data['diet'], 'goal': data['goal'],
+                'height_cm': height_cm, 'weight_kg': weight_kg, 'bmi': bmi,
+                'medical_conditions': medical_conditions, 'preferred_language': preferred_language
+            })
+            if new_user is None:
+                flash("⚠️ Email already registered!", "warning")
+                return render_template("register.html")
             
             # Clear OTP from storage after successful registration
-            OTP_STORAGE.pop(email, None)
+            otp_store.pop(email)
 
             flash("✅ Registered successfully! You can now log in.", "success")
             return redirect(url_for("auth.login"))
@@ -184,17 +152,15 @@ def forgot_password():
         email = request.form['email'].strip()
         action = request.form.get('action') # 'send_otp' or 'verify_otp' or 'reset_password'
 
-        df = pd.read_csv(USER_CSV)
-        user = df[df['email'] == email]
+        user = user_repo.get_by_email(email)
 
-        if user.empty:
+        if user is None:
             flash("❌ Email not found.", "danger")
             return render_template("forgot_password.html")
 
         if action == 'send_otp':
             otp = generate_otp()
-            expiry_time = datetime.now() + timedelta(minutes=5)
-            OTP_STORAGE[email] = {'otp': otp, 'expiry': expiry_time, 'reset_token': str(uuid.uuid4())} # Add reset token
+            otp_store.put(email, otp, OTP_TTL.total_seconds(), reset_token=str(uuid.uuid4())) # Add reset token
 
             subject = "Nutrition Assistant: Password Reset OTP"
             body = f"Your One-Time Password (OTP) for password reset is: {otp}\n\nThis OTP is valid for 5 minutes."
@@ -208,33 +174,37 @@ def forgot_password():
 
         elif action == 'verify_otp':
             otp_input = request.form['otp_input'].strip()
-            stored_otp_info = OTP_STORAGE.get(email)
+            stored_otp_info = otp_store.get(email)
 
             if not stored_otp_info or stored_otp_info['otp'] != otp_input or datetime.now() > stored_otp_info['expiry']:
                 flash("❌ Invalid or expired OTP. Please try again.", "danger")
                 return render_template("forgot_password.html", email_sent=True, user_email=email)
             
-            # OTP valid, allow password reset
+            # OTP valid, allow password reset: keep only the reset token (the OTP can't be reused)
+            otp_store.put(email, None, RESET_TOKEN_TTL.total_seconds(), reset_token=stored_otp_info['reset_token'])
             flash("✅ OTP verified. You can now reset your password.", "success")
             return render_template("forgot_password.html", otp_verified=True, user_email=email, reset_token=stored_otp_info['reset_token'])
         
         elif action == 'reset_password':
             new_password = request.form['new_password'].strip()
             reset_token = request.form['reset_token'].strip()
-            stored_otp_info = OTP_STORAGE.get(email)
+            stored_otp_info = otp_store.get(email)
 
             if not stored_otp_info or stored_otp_info['reset_token'] != reset_token:
                 flash("❌ Invalid reset token. Please restart the forgot password process.", "danger")
                 return render_template("forgot_password.html")
 
-            hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            try:
+                hashed_password = password_hasher.hash(new_password)
+            except HasherBusy:
+                flash("⏳ The server is busy right now. Please try again in a moment.", "warning")
+                return render_template("forgot_password.html", otp_verified=True, user_email=email, reset_token=reset_token), 503
             
             # Update password in CSV
-            df.loc[df['email'] == email, 'hashed_password'] = hashed_password
-            df.to_csv(USER_CSV, index=False)
+            user_repo.update_user(user['user_id'], {'hashed_password': hashed_password})
             
             # Clear OTP and reset token from storage
-            OTP_STORAGE.pop(email, None)
+            otp_store.pop(email)
 
             flash("✅ Your password has been reset successfully. You can now log in.", "success")
             return redirect(url_for('auth.login'))
@@ -248,8 +218,11 @@ def edit_profile():
         return redirect(url_for('auth.login'))
 
     user_id = session['user_id']
-    df = pd.read_csv(USER_CSV)
-    user_data = df[df['user_id'] == user_id].iloc[0].to_dict()
+    user_data = user_repo.get_by_id(user_id)
+    if user_data is None:
+        session.clear()
+        flash("Please log in to edit your profile.", "warning")
+        return redirect(url_for('auth.login'))
 
     if request.method == 'POST':
         # Update user data from form
@@ -267,12 +240,8 @@ def edit_profile():
 
         user_data['bmi'] = calculate_bmi(user_data['weight_kg'], user_data['height_cm']) if user_data['height_cm'] is not None and user_data['weight_kg'] is not None else None
 
-        # Update the DataFrame
-        for col in EXPECTED_COLUMNS: # Use EXPECTED_COLUMNS to iterate through all fields
-            if col in user_data: # Ensure the key exists in user_data
-                df.loc[df['user_id'] == user_id, col] = user_data[col]
-        
-        df.to_csv(USER_CSV, index=False)
+        # Update the user's row
+        user_repo.update_user(user_id, user_data)
         session['name'] = user_data['name'] # Update session name if changed
 
         flash("✅ Profile updated successfully!", "success")
@@ -0,0 +1,19 @@
+# bcrypt_worker.py
+"""
+The jobs run in the password hashing processes (see utils/password_hasher.py). Kept in their
+own module so the forkserver, which preloads it, imports nothing but bcrypt.
+"""
+import time
+
+import bcrypt
+
+
+# They return when the work started so queueing delay can be measured
+def hash_job(password, rounds):
+    started = time.time()
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8"), started
+
+
+def check_job(password, hashed):
+    started = time.time()
+    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8")), started
@@ -0,0 +1,208 @@
+# conversation_store.py
+"""
+Server-side chat conversations, so a follow-up ("for the second option, swap the eggs") is
+answered with the earlier turns instead of from scratch.
+
+A conversation pins the user's profile and feedback preferences as they were when it started
+(sent in Gemini's system instruction, identical for every message of the conversation) and
+keeps the turns within CONVERSATION_TOKEN_BUDGET: once over budget, the oldest exchanges are
+compacted into one-line summaries (the question asked, the meals proposed), and the oldest
+summary lines are dropped when the summary outgrows CONVERSATION_SUMMARY_TOKENS. Photos are
+not kept; their turn records the classifier's label instead.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from utils.feedback_manager import CHARS_PER_TOKEN, extract_preference_items
+from utils.message_store import compress_text, decompress_text
+from utils.response_cache import PROFILE_PROMPT_FIELDS
+
+CONVERSATION_STORE = os.environ.get("CONVERSATION_STORE", "sqlite") # 'sqlite' (shared by workers) or 'memory'
+CONVERSATION_DB = "data/cache/conversations.db"
+CONVERSATION_TTL = int(os.environ.get("CONVERSATION_TTL", 2 * 60 * 60)) # Idle seconds before a conversation is forgotten
+CONVERSATION_MAX_ENTRIES = int(os.environ.get("CONVERSATION_MAX_ENTRIES", 20000))
+CONVERSATION_TOKEN_BUDGET = int(os.environ.get("CONVERSATION_TOKEN_BUDGET", 1200)) # Earlier turns sent per message
+CONVERSATION_SUMMARY_TOKENS = int(os.environ.get("CONVERSATION_SUMMARY_TOKENS", 200)) # Share of the budget for compacted turns
+SUMMARY_LINE_CHARS = 160 # Limit a compacted question or answer to one short line
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _clip(text, limit):
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def _shorten(text, limit):
+    """Clipped to one line."""
+    return _clip(" ".join(text.split()), limit)
+
+
+def summarize_turn(role, text):
+    """One line for a compacted turn: the user's question, or the meal titles a reply proposed."""
+    if role == "user":
+        return f"User asked: {_shorten(text, SUMMARY_LINE_CHARS)}"
+    titles, _ = extract_preference_items(text)
+    if titles:
+        return f"You suggested: {'; '.join(titles)}"
+    return f"You answered: {_shorten(text, SUMMARY_LINE_CHARS)}"
+
+
+def new_conversation(user_id, profile, preferences):
+    return {
+        "id": uuid.uuid4().hex,
+        "user_id": user_id,
+        "profile": {field: profile.get(field) for field in PROFILE_PROMPT_FIELDS},
+        "preferences": preferences,
+        "summary": [], # Lines for compacted turns, oldest first
+        "turns": [], # [role, text] pairs, always whole exchanges (user, model)
+    }
+
+
+def history_tokens(conversation):
+    return (estimate_tokens("\n".join(conversation["summary"])) +
+            sum(estimate_tokens(text) for _, text in conversation["turns"]))
+
+
+def add_exchange(conversation, user_text, reply, token_budget=CONVERSATION_TOKEN_BUDGET,
+                 summary_tokens=CONVERSATION_SUMMARY_TOKENS):
+    """
+    Appends a question and its answer, then compacts the oldest exchanges until the history
+    fits token_budget again. The newest exchange is always kept verbatim, clipped so that on
+    its own it leaves room for the summary.
+    """
+    turn_chars = max(1, (token_budget - summary_tokens) // 2) * CHARS_PER_TOKEN
+    turns = conversation["turns"]
+    summary = conversation["summary"]
+    turns += [["user", _clip(user_text, turn_chars)], ["model", _clip(reply, turn_chars)]]
+    while len(turns) > 2 and history_tokens(conversation) > token_budget:
+        for role, text in (turns.pop(0), turns.pop(0)):
+            summary.append(summarize_turn(role, text))
+        while len(summary) > 1 and estimate_tokens("\n".join(summary)) > summary_tokens:
+            summary.pop(0)
+
+
+def history_contents(conversation):
+    """Earlier turns as Gemini `contents`; the summary of compacted turns leads the first one."""
+    contents = [{"role": role, "parts": [{"text": text}]} for role, text in conversation["turns"]]
+    if conversation["summary"] and contents:
+        summary = "Summary of the earlier conversation:\n" + "\n".join(conversation["summary"])
+        contents[0]["parts"].insert(0, {"text": summary})
+    return contents
+
+
+class MemoryConversationStore:
+    """Per-process conversations, bounded by count (least recently used evicted) and idle TTL."""
+
+    def __init__(self, max_entries=CONVERSATION_MAX_ENTRIES, ttl=CONVERSATION_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict() # conversation id -> (expires_at, user_id, compressed JSON)
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id, user_id):
+        """The conversation if it exists, has not expired and belongs to user_id; else None."""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+        if entry is None or entry[0] <= time.time() or entry[1] != user_id:
+            return None
+        return json.loads(decompress_text(entry[2]))
+
+    def save(self, conversation):
+        body = compress_text(json.dumps(conversation))
+        with self._lock:
+            self._entries[conversation["id"]] = (time.time() + self.ttl, conversation["user_id"], body)
+            self._entries.move_to_end(conversation["id"])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteConversationStore:
+    """
+    Conversations in a SQLite file shared by all workers, so a follow-up can land on any worker.
+    Each is one zlib-compressed JSON row; saving pushes back its expiry, and expired or excess
+    rows are evicted every `eviction_interval` saves. Two messages of the same conversation in
+    flight at once are not merged: the later save wins.
+    """
+
+    def __init__(self, db_path=CONVERSATION_DB, max_entries=CONVERSATION_MAX_ENTRIES, ttl=CONVERSATION_TTL,
+                 eviction_interval=200):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.eviction_interval = eviction_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._saves_since_eviction = 0
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS conversations ("
+                     "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, body BLOB NOT NULL, expires_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_expires ON conversations(expires_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, conversation_id, user_id):
+        """The conversation if it exists, has not expired and belongs to user_id; else None."""
+        row = self._connect().execute(
+            "SELECT body FROM conversations WHERE id = ? AND user_id = ? AND expires_at > ?",
+            (conversation_id, user_id, time.time())
+        ).fetchone()
+        return json.loads(decompress_text(row[0])) if row else None
+
+    def save(self, conversation):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO conversations (id, user_id, body, expires_at) VALUES (?, ?, ?, ?)",
+            (conversation["id"], conversation["user_id"], compress_text(json.dumps(conversation)), time.time() + self.ttl)
+        )
+        with self._lock:
+            self._saves_since_eviction += 1
+            run_eviction = self._saves_since_eviction >= self.eviction_interval
+            if run_eviction:
+                self._saves_since_eviction = 0
+        if run_eviction:
+            self.evict()
+
+    def evict(self):
+        """Drops expired conversations and trims to max_entries (soonest to expire first)."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM conversations WHERE expires_at <= ?", (time.time(),))
+            overflow = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute("DELETE FROM conversations WHERE id IN "
+                             "(SELECT id FROM conversations ORDER BY expires_at LIMIT ?)", (overflow,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM conversations WHERE expires_at > ?",
+                                       (time.time(),)).fetchone()[0]
+
+
+def create_conversation_store(store=CONVERSATION_STORE):
+    """Builds the configured store for chat conversations."""
+    if store == "memory":
+        return MemoryConversationStore()
+    return SQLiteConversationStore()
@@ -0,0 +1,327 @@
+# email_outbox.py
+"""
+Background delivery for OTP and notification emails.
+Request handlers only insert a row into a SQLite outbox (shared by all workers) and return;
+a small pool of sender threads claims due rows, sends them over SMTP connections that stay
+open and authenticated between messages, and reschedules failures with exponential backoff.
+
+To try it against a local debugging server instead of Gmail:
+    python -m smtpd -n -c DebuggingServer localhost:1025     (or: python -m aiosmtpd -n -l localhost:1025)
+    SMTP_HOST=localhost SMTP_PORT=1025 SMTP_SECURITY=none python app.py
+"""
+import os
+import random
+import smtplib
+import sqlite3
+import ssl
+import sys
+import threading
+import time
+from email.message import EmailMessage
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from secrets_config import EMAIL_ADDRESS, EMAIL_PASSWORD
+
+EMAIL_OUTBOX_DB = "data/email_outbox.db"
+SMTP_HOST = os.environ.get("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 465))
+SMTP_SECURITY = os.environ.get("SMTP_SECURITY", "ssl") # 'ssl' (implicit TLS), 'starttls' or 'none' (local test servers)
+SMTP_TIMEOUT = 20 # Seconds per SMTP command
+SMTP_IDLE_TIMEOUT = int(os.environ.get("SMTP_IDLE_TIMEOUT", 60)) # Close a pooled connection unused this long; servers drop idle ones anyway
+EMAIL_WORKERS = int(os.environ.get("EMAIL_WORKERS", 2)) # Sender threads (= open SMTP connections) per process
+EMAIL_MAX_ATTEMPTS = int(os.environ.get("EMAIL_MAX_ATTEMPTS", 5))
+EMAIL_RETRY_BASE = float(os.environ.get("EMAIL_RETRY_BASE", 2.0)) # Seconds before the first retry; doubles each attempt
+EMAIL_RETRY_MAX = 300.0 # Cap on the backoff delay
+EMAIL_POLL_INTERVAL = float(os.environ.get("EMAIL_POLL_INTERVAL", 1.0)) # Seconds; picks up mail queued by other processes
+EMAIL_LEASE = 120 # Seconds a claimed message stays reserved; a crashed sender's mail is retried after this
+EMAIL_RETENTION = 7 * 24 * 60 * 60 # Sent/failed rows are kept this long for inspection
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+
+class OutboxStore:
+    """The queue itself: one row per message, claimed with a lease so several processes can drain it."""
+
+    def __init__(self, db_path=EMAIL_OUTBOX_DB):
+        self.db_path = db_path
+        self._local = threading.local()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, recipient TEXT NOT NULL, subject TEXT NOT NULL, body TEXT NOT NULL, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, "
+            "last_error TEXT, created_at REAL NOT NULL, sent_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, recipient, subject, body):
+        now = time.time()
+        return self._connect().execute(
+            "INSERT INTO outbox (recipient, subject, body, status, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (recipient, subject, body, PENDING, now, now)
+        ).lastrowid
+
+    def claim(self, lease=EMAIL_LEASE):
+        """
+        Reserves the oldest due message (pending, or sending with an expired lease) and returns
+        {id, recipient, subject, body, attempts}, or None when nothing is due.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, recipient, subject, body, attempts FROM outbox "
+                "WHERE status IN (?, ?) AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT 1",
+                (PENDING, SENDING, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE outbox SET status = ?, attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+                             (SENDING, now + lease, row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return {"id": row[0], "recipient": row[1], "subject": row[2], "body": row[3], "attempts": row[4] + 1}
+
+    def mark_sent(self, message_id):
+        self._connect().execute("UPDATE outbox SET status = ?, sent_at = ?, last_error = NULL WHERE id = ?",
+                                (SENT, time.time(), message_id))
+
+    def reschedule(self, message_id, delay, error):
+        self._connect().execute("UPDATE outbox SET status = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                                (PENDING, time.time() + delay, error, message_id))
+
+    def mark_failed(self, message_id, error):
+        self._connect().execute("UPDATE outbox SET status = ?, last_error = ? WHERE id = ?",
+                                (FAILED, error, message_id))
+
+    def status(self, message_id):
+        """Returns {status, attempts, last_error} for a message, or None if unknown."""
+        row = self._connect().execute("SELECT status, attempts, last_error FROM outbox WHERE id = ?",
+                                      (message_id,)).fetchone()
+        return {"status": row[0], "attempts": row[1], "last_error": row[2]} if row else None
+
+    def counts(self):
+        return dict(self._connect().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+
+    def purge(self, older_than=EMAIL_RETENTION):
+        """Drops sent and failed rows older than `older_than` seconds; returns how many."""
+        return self._connect().execute("DELETE FROM outbox WHERE status IN (?, ?) AND created_at <= ?",
+                                       (SENT, FAILED, time.time() - older_than)).rowcount
+
+
+class SMTPConnection:
+    """
+    One authenticated SMTP session that is reused across messages. It's opened on first use,
+    reopened if a NOOP shows the server has dropped it, and closed after SMTP_IDLE_TIMEOUT idle seconds.
+    Each sender thread owns one, so no locking is needed.
+    """
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, security=SMTP_SECURITY,
+                 username=EMAIL_ADDRESS, password=EMAIL_PASSWORD, idle_timeout=SMTP_IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.security = security
+        self.username = username
+        self.password = password
+        self.idle_timeout = idle_timeout
+        self.smtp = None
+        self.last_used = 0.0
+        self.connects = 0
+
+    def open(self):
+        if self.security == "ssl":
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=SMTP_TIMEOUT, context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+            if self.security == "starttls":
+                smtp.starttls(context=ssl.create_default_context())
+        if self.username and self.password and self.security != "none":
+            smtp.login(self.username, self.password)
+        self.smtp = smtp
+        self.connects += 1
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+            self.smtp = None
+
+    def close_if_idle(self):
+        if self.smtp is not None and time.time() - self.last_used > self.idle_timeout:
+            self.close()
+
+    def is_alive(self):
+        """NOOP round trip on the pooled session; False if the server has dropped it."""
+        try:
+            return self.smtp.noop()[0] == 250
+        except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+            return False
+
+    def send(self, message):
+        # A stale session is detected and replaced before the message goes out. Errors during
+        # the send itself are not retried here: after DATA the server may already have the mail.
+        if self.smtp is not None and not self.is_alive():
+            self.close()
+        if self.smtp is None:
+            self.open()
+        self.smtp.send_message(message)
+        self.last_used = time.time()
+
+
+def is_permanent_error(error):
+    """5xx replies and refused recipients won't succeed on retry; everything else (timeouts, 4xx, drops) might."""
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPAuthenticationError)):
+        return True
+    code = getattr(error, "smtp_code", None)
+    return isinstance(code, int) and 500 <= code < 600
+
+
+def retry_delay(attempts, base=EMAIL_RETRY_BASE):
+    """Exponential backoff with jitter: base, 2*base, 4*base ... capped at EMAIL_RETRY_MAX."""
+    delay = min(base * (2 ** (attempts - 1)), EMAIL_RETRY_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class EmailOutbox:
+    """
+    enqueue() is all a request handler calls; start() launches the sender threads. Senders
+    wake immediately for mail queued in this process and poll for mail queued by others.
+    """
+
+    def __init__(self, store=None, workers=EMAIL_WORKERS, max_attempts=EMAIL_MAX_ATTEMPTS,
+                 sender=EMAIL_ADDRESS, connection_factory=SMTPConnection):
+        self._store = store
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.sender = sender
+        self.connection_factory = connection_factory
+        self._wake = threading.Condition()
+        self._pending_wakeups = 0
+        self._threads = []
+        self._stopping = False
+        self._lock = threading.Lock()
+        self.counters = {"enqueued": 0, "sent": 0, "retried": 0, "failed": 0, "connects": 0}
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = OutboxStore()
+        return self._store
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self.counters[name] += value
+
+    def enqueue(self, recipient, subject, body):
+        """Queues a plain-text email and returns its outbox id without touching the network."""
+        message_id = self.store.add(recipient, subject, body)
+        self._count(enqueued=1)
+        with self._wake:
+            self._pending_wakeups += 1
+            self._wake.notify()
+        return message_id
+
+    def build_message(self, item):
+        em = EmailMessage()
+        em['From'] = self.sender
+        em['To'] = item['recipient']
+        em['Subject'] = item['subject']
+        em.set_content(item['body'])
+        return em
+
+    def deliver(self, item, connection):
+        """Sends one claimed message and records the outcome; returns True if it was sent."""
+        try:
+            connection.send(self.build_message(item))
+        except Exception as e:
+            connection.close()
+            error = f"{type(e).__name__}: {e}"
+            if is_permanent_error(e) or item['attempts'] >= self.max_attempts:
+                self.store.mark_failed(item['id'], error)
+                self._count(failed=1)
+                print(f"❌ Giving up on email {item['id']} to {item['recipient']} after {item['attempts']} attempt(s): {error}")
+            else:
+                self.store.reschedule(item['id'], retry_delay(item['attempts']), error)
+                self._count(retried=1)
+            return False
+        self.store.mark_sent(item['id'])
+        self._count(sent=1)
+        return True
+
+    def _wait_for_work(self, connection):
+        with self._wake:
+            if self._pending_wakeups == 0 and not self._stopping:
+                self._wake.wait(EMAIL_POLL_INTERVAL)
+            self._pending_wakeups = max(0, self._pending_wakeups - 1)
+        connection.close_if_idle()
+
+    def _run(self):
+        connection = self.connection_factory()
+        while not self._stopping:
+            try:
+                item = self.store.claim()
+            except Exception as e:
+                print(f"Email outbox claim failed: {e}")
+                item = None
+            if item is None:
+                self._wait_for_work(connection)
+                continue
+            connects = connection.connects
+            self.deliver(item, connection)
+            self._count(connects=connection.connects - connects)
+        connection.close()
+
+    def start(self):
+        """Starts the sender threads (once per process)."""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping = False
+            try:
+                self.store.purge()
+            except Exception as e:
+                print(f"Email outbox purge failed: {e}")
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"email-sender-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=5.0):
+        with self._wake:
+            self._stopping = True
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["workers"] = len(self._threads)
+        stats["queue"] = self.store.counts()
+        return stats
+
+
+# Shared outbox used by utils/auth.send_email
+email_outbox = EmailOutbox()
@@ -1,41 +1,192 @@
 # feedback_manager.py
 import csv
+import json
 import os
+import re
+import threading
 from datetime import datetime
-from flask import jsonify, session
+
+from utils.nutrition_facts import nutrition_facts
+
+try:
+    import fcntl # Cross-process locking (Linux/macOS); Windows falls back to the in-process lock only
+except ImportError:
+    fcntl = None
+
+FEEDBACK_KEYWORDS = ['protein', 'carbs', 'vegetarian', 'vegan', 'low-calorie']
+FEEDBACK_TYPES = ('like', 'dislike')
+SUMMARY_VERSION = 2 # Bump when the summary layout changes; older summaries are rebuilt from the log
+MAX_SUMMARY_ITEMS = 5 # Recent liked/disliked meal titles kept in the summary
+MAX_ITEM_CHARS = 60 # Limit meal title length kept in the summary
+MAX_SUMMARY_FOODS = 15 # Liked/disliked foods kept in the summary, by how often they were rated
+PREFERENCE_TOKEN_BUDGET = int(os.environ.get("PREFERENCE_TOKEN_BUDGET", 80)) # Preference context per prompt
+CHARS_PER_TOKEN = 4 # Rough estimate for English prompt text
+
+# "Option 1: Oatmeal with Berries" / "Meal 2 - Paneer Wrap" headings in a bot reply
+MEAL_TITLE_PATTERN = re.compile(r'^[\s*#>-]*(?:option|meal)\s*\d+\s*[:.)-]\s*(?P<title>.+?)[\s*:]*$',
+                                re.IGNORECASE | re.MULTILINE)
+
+
+def extract_preference_items(message_content):
+    """
+    Reduces a rated bot reply to (meal titles, foods): the option headings it proposed and the
+    table foods it mentions. A multi-kilobyte meal plan becomes a few dozen characters.
+    """
+    content = (message_content or '').replace('*', '')
+    titles = []
+    for match in MEAL_TITLE_PATTERN.finditer(content):
+        title = match.group('title').strip()[:MAX_ITEM_CHARS]
+        if title and title not in titles:
+            titles.append(title)
+    return titles, nutrition_facts.find_foods(content)
+
+
+def format_preference_context(preferences, token_budget=PREFERENCE_TOKEN_BUDGET):
+    """
+    Renders the liked/disliked foods and meals for the Gemini prompt within a fixed token budget.
+    Dislikes are filled first (avoiding them matters most), then likes; foods before meal titles.
+    """
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    disliked_foods = [food for food, _ in preferences.get('disliked_foods', [])]
+    liked_foods = [food for food, _ in preferences.get('liked_foods', []) if food not in disliked_foods]
+    sections = {'liked': [], 'disliked': []}
+    candidates = ([('disliked', food) for food in disliked_foods] + [('liked', food) for food in liked_foods] +
+                  [('disliked', item) for item in preferences.get('disliked_items', [])] +
+                  [('liked', item) for item in preferences.get('liked_items', [])])
+
+    def render():
+        context = ""
+        if sections['liked']:
+            context += f"User previously liked: {', '.join(sections['liked'])}.\n"
+        if sections['disliked']:
+            context += f"User previously disliked: {', '.join(sections['disliked'])}. Please avoid recommending similar items.\n"
+        return context
+
+    for section, item in candidates:
+        sections[section].append(item)
+        if len(render()) > budget_chars:
+            sections[section].pop()
+    return render()
+
 
 class FeedbackManager:
-    def __init__(self, feedback_dir='feedback_data'):
+    """
+    Stores feedback partitioned per user (one append-only CSV each) and keeps a small
+    JSON summary per user up to date on every write, so reading a user's preferences
+    never scans other users' feedback or recomputes anything.
+    """
+    def __init__(self, feedback_dir='feedback_data', legacy_csv_path=None):
         self.FEEDBACK_DIR = feedback_dir
+        self._lock = threading.Lock()
         if not os.path.exists(self.FEEDBACK_DIR):
             os.makedirs(self.FEEDBACK_DIR)
+        if legacy_csv_path:
+            self.migrate_legacy_feedback(legacy_csv_path)
+
+    def _user_key(self, user_id):
+        """Makes the user id safe to use in a filename"""
+        return re.sub(r'[^A-Za-z0-9_-]', '_', str(user_id))
 
     def get_feedback_filename(self, user_id):
         """Generate filename for user's feedback CSV"""
-        return os.path.join(self.FEEDBACK_DIR, f'user_{user_id}_feedback.csv')
+        return os.path.join(self.FEEDBACK_DIR, f'user_{self._user_key(user_id)}_feedback.csv')
+
+    def get_summary_filename(self, user_id):
+        """Generate filename for user's precomputed preference summary"""
+        return os.path.join(self.FEEDBACK_DIR, f'user_{self._user_key(user_id)}_summary.json')
 
     def ensure_feedback_file(self, user_id):
         """Create CSV file with headers if it doesn't exist"""
         filename = self.get_feedback_filename(user_id)
         if not os.path.exists(filename):
-            with open(filename, 'w', newline='') as csvfile:
+            with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
                 writer = csv.writer(csvfile)
                 writer.writerow(['timestamp', 'message_id', 'message_content', 'feedback_type'])
 
+    @staticmethod
+    def empty_summary():
+        return {
+            'version': SUMMARY_VERSION,
+            'total_likes': 0,
+            'total_dislikes': 0,
+            'liked_items': [], # Meal titles, most recent first
+            'disliked_items': [],
+            'liked_foods': [], # [food, times rated], most rated first
+            'disliked_foods': [],
+            'preferred_keywords': [],
+            'avoided_keywords': []
+        }
+
+    def _read_summary(self, user_id):
+        """The stored summary, or None if it's missing or from an older layout (then it's rebuilt)"""
+        try:
+            with open(self.get_summary_filename(user_id), 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return summary if summary.get('version') == SUMMARY_VERSION else None
+
+    def _write_summary(self, user_id, summary):
+        filename = self.get_summary_filename(user_id)
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False)
+        os.replace(tmp_filename, filename)
+
+    @staticmethod
+    def _apply_to_summary(summary, feedback_type, message_content):
+        """Folds one feedback entry into the summary (most recent items first); unknown types are ignored"""
+        if feedback_type == 'like':
+            summary['total_likes'] += 1
+            items_key, foods_key, keywords_key = 'liked_items', 'liked_foods', 'preferred_keywords'
+        elif feedback_type == 'dislike':
+            summary['total_dislikes'] += 1
+            items_key, foods_key, keywords_key = 'disliked_items', 'disliked_foods', 'avoided_keywords'
+        else:
+            return summary
+
+        content = (message_content or '').strip()
+        if content:
+            titles, foods = extract_preference_items(content)
+            items = [item for item in summary[items_key] if item not in titles]
+            summary[items_key] = (titles + items)[:MAX_SUMMARY_ITEMS]
+
+            counts = {food: 1 for food in foods} # Newly rated foods first, so ties keep the most recent
+            for food, count in summary[foods_key]:
+                counts[food] = counts.get(food, 0) + count
+            ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+            summary[foods_key] = [[food, count] for food, count in ranked[:MAX_SUMMARY_FOODS]]
+
+            lowered = content.lower()
+            found = set(summary[keywords_key]) | {kw for kw in FEEDBACK_KEYWORDS if kw in lowered}
+            summary[keywords_key] = [kw for kw in FEEDBACK_KEYWORDS if kw in found]
+        return summary
+
     def store_feedback(self, user_id, message_id, feedback_type, message_content=''):
-        """Store feedback in user's CSV file"""
+        """Append feedback to the user's CSV file and update their summary"""
         try:
-            self.ensure_feedback_file(user_id)
-            filename = self.get_feedback_filename(user_id)
-            
-            with open(filename, 'a', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow([
-                    datetime.now().isoformat(),
-                    message_id,
-                    message_content[:500],  # Limit content length
-                    feedback_type
-                ])
+            with self._lock:
+                self.ensure_feedback_file(user_id)
+                filename = self.get_feedback_filename(user_id)
+
+                with open(filename, 'a', newline='', encoding='utf-8') as csvfile:
+                    if fcntl:
+                        fcntl.flock(csvfile, fcntl.LOCK_EX) # Serializes log append + summary update across workers
+                    writer = csv.writer(csvfile)
+                    writer.writerow([
+                        datetime.now().isoformat(),
+                        message_id,
+                        message_content,
+                        feedback_type
+                    ])
+                    csvfile.flush()
+
+                    summary = self._read_summary(user_id)
+                    if summary is None:
+                        summary = self._rebuild_summary(user_id)
+                    else:
+                        summary = self._apply_to_summary(summary, feedback_type, message_content)
+                    self._write_summary(user_id, summary)
             return True
         except Exception as e:
             print(f"Error storing feedback: {e}")
@@ -46,47 +197,69 @@ class FeedbackManager:
         filename = self.get_feedback_filename(user_id)
         if not os.path.exists(filename):
             return []
-        
+
         feedback = []
-        with open(filename, 'r') as csvfile:
+        with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
             reader = csv.DictReader(csvfile)
             for row in reader:
                 feedback.append(dict(row))
         return feedback
 
+    def _rebuild_summary(self, user_id):
+        """Recomputes a summary from the user's full log (only needed if the summary file is missing)"""
+        summary = self.empty_summary()
+        for item in self.get_user_feedback(user_id):
+            self._apply_to_summary(summary, item.get('feedback_type'), item.get('message_content', ''))
+        return summary
+
     def analyze_feedback(self, user_id):
-        """Analyze feedback to determine user preferences"""
-        feedback = self.get_user_feedback(user_id)
-        if not feedback:
-            return {}
-        
-        analysis = {
-            'total_likes': 0,
-            'total_dislikes': 0,
-            'liked_items': [],
-            'disliked_items': [],
-            'preferred_keywords': [],
-            'avoided_keywords': []
-        }
-        
-        # Simple analysis - can be enhanced
-        for item in feedback:
-            if item['feedback_type'] == 'like':
-                analysis['total_likes'] += 1
-                analysis['liked_items'].append(item['message_content'])
-            else:
-                analysis['total_dislikes'] += 1
-                analysis['disliked_items'].append(item['message_content'])
-        
-        # Add basic keyword analysis (very simple implementation)
-        all_liked = ' '.join(analysis['liked_items']).lower()
-        all_disliked = ' '.join(analysis['disliked_items']).lower()
-        
-        # Example keyword checks - expand based on your needs
-        for keyword in ['protein', 'carbs', 'vegetarian', 'vegan', 'low-calorie']:
-            if keyword in all_liked:
-                analysis['preferred_keywords'].append(keyword)
-            if keyword in all_disliked:
-                analysis['avoided_keywords'].append(keyword)
-        
-        return analysis
\ No newline at end of file
+        """Return the user's precomputed preferences (liked/disliked meals, foods and keywords)"""
+        summary = self._read_summary(user_id)
+        if summary is None:
+            summary = self._rebuild_summary(user_id)
+            if summary['total_likes'] or summary['total_dislikes']:
+                self._write_summary(user_id, summary) # Upgrades an old-layout summary once
+        return summary
+
+    def migrate_legacy_feedback(self, legacy_csv_path):
+        """
+        One-time split of the old shared user_feedback.csv into per-user logs and summaries.
+        A marker file, written once every user is done, records that the migration ran so later
+        starts skip it. Rows already in a user's log are not copied again, so a run that stopped
+        partway can simply be repeated.
+        """
+        marker = os.path.join(self.FEEDBACK_DIR, '.legacy_feedback_migrated')
+        if not os.path.exists(legacy_csv_path) or os.path.exists(marker):
+            return 0
+        with open(f"{marker}.lock", 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX) # Only one process migrates at a time
+            if os.path.exists(marker):
+                return 0
+
+            rows_by_user = {}
+            with open(legacy_csv_path, 'r', newline='', encoding='utf-8') as file:
+                for row in csv.DictReader(file):
+                    if row.get('user_id'):
+                        rows_by_user.setdefault(row['user_id'], []).append(row)
+
+            migrated = 0
+            with self._lock:
+                for user_id, rows in rows_by_user.items():
+                    self.ensure_feedback_file(user_id)
+                    copied = {(item.get('timestamp'), item.get('message_id'), item.get('feedback_type'))
+                              for item in self.get_user_feedback(user_id)}
+                    with open(self.get_feedback_filename(user_id), 'a', newline='', encoding='utf-8') as csvfile:
+                        writer = csv.writer(csvfile)
+                        for row in rows:
+                            if (row.get('timestamp'), row.get('message_id'), row.get('feedback_type')) in copied:
+                                continue
+                            writer.writerow([row.get('timestamp'), row.get('message_id'),
+                                             row.get('bot_response_content', ''), row.get('feedback_type')])
+                            migrated += 1
+                    self._write_summary(user_id, self._rebuild_summary(user_id))
+
+            with open(marker, 'w'):
+                pass
+        print(f"Migrated {migrated} feedback rows from {legacy_csv_path} into per-user files")
+        return migrated
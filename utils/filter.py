@@ -1,3 +1,161 @@
+"""
+Query router for /chat.
+Every lexicon below is compiled into ONE regular expression with a named group per category,
+so a message is classified in a single left-to-right scan (a few microseconds) before any
+network call. Each category's terms are merged into a character trie first, so the regex
+engine follows shared prefixes once instead of trying hundreds of alternatives at every
+position. Terms ending in '*' match any word continuing from that stem.
+"""
+import re
+
+from utils.nutrition_facts import nutrition_facts
+
+OFF_TOPIC = "off_topic"
+SINGLE_FOOD = "single_food"
+MEAL_PLAN = "meal_plan"
+GENERAL_QUESTION = "general_question"
+
+OFF_TOPIC_REPLY = ("I'm your nutrition assistant, so I can only help with food, diet and health questions. "
+                   "Try asking about a meal idea, the nutrients in a food or your nutrition goals.")
+
+MEAL_TERMS = [
+    # English
+    "meal*", "breakfast*", "brunch", "lunch*", "dinner*", "supper", "snack*", "recipe*", "menu*", "dish*",
+    "diet plan*", "meal plan*", "meal prep", "what should i eat", "what to eat",
+    "what can i eat", "weekly plan", "day of eating",
+    # Hindi (romanized and Devanagari)
+    "nashta", "naashta", "khane mein", "kya khana", "kya khaun", "diet chart",
+    "नाश्ता", "दोपहर का खाना", "रात का खाना", "भोजन योजना", "डाइट प्लान", "डाइट चार्ट", "रेसिपी",
+    # Spanish / Portuguese
+    "desayuno*", "almuerzo*", "cena", "cenas", "receta*", "plan de comidas", "menú", "café da manhã",
+    "almoço", "jantar", "receita*", "refeição", "refeições", "lanche*",
+    # French / German / Italian
+    "petit-déjeuner", "petit déjeuner", "déjeuner", "dîner", "recette*", "repas", "frühstück", "mittagessen",
+    "abendessen", "rezept*", "mahlzeit*", "speiseplan", "colazione", "pranzo", "ricetta*",
+]
+
+# Generic asks; they mean a meal request only alongside a food/nutrition term ("suggest high protein snacks")
+REQUEST_TERMS = [
+    "suggest*", "recommend*", "ideas", "idea for", "options", "plan", "planning", "give me", "help me",
+    "sugiere*", "recomienda*", "ideas de", "idées", "propose*", "vorschlag*", "empfehl*", "suggerisci",
+    "sugestões", "sugira", "सुझाव", "बताओ", "batao", "bataiye", "sujhav",
+]
+
+NUTRITION_TERMS = [
+    # English
+    "nutri*", "vitamin*", "mineral*", "calori*", "kcal", "protein*", "carb*", "fat", "fats", "fatty", "fiber*",
+    "fibre*", "sugar*", "sodium", "salt", "cholesterol", "diet*", "health*", "weight", "bmi", "keto*", "paleo",
+    "vegan*", "vegetarian*", "gluten*", "lactose", "dairy", "diabet*", "allerg*", "digest*", "metabolism",
+    "hydrat*", "macro*", "micronutrient*", "omega*", "iron", "calcium", "zinc", "magnesium", "potassium",
+    "antioxidant*", "supplement*", "portion*", "serving*", "glycemic", "insulin", "blood pressure", "gut",
+    "probiotic*", "prebiotic*", "fasting", "intermittent", "muscle*", "workout*", "exercise*", "bulk*",
+    "lose weight", "gain weight", "fat loss", "cravings", "appetite", "food*", "eat", "eats", "eating",
+    "ate", "drink*", "cook*", "bake*", "fried", "ingredient*", "fruit*", "vegetable*", "veggie*", "meat*",
+    "fish", "seafood", "grain*", "cereal*", "nut", "nuts", "seed*", "bean*", "legume*", "spice*", "juice*",
+    "smoothie*", "salad*", "soup*", "sandwich*", "pizza*", "burger*", "noodle*", "sushi", "curry", "curries",
+    "biryani", "cake*", "cookie*", "dessert*", "sweets", "chocolate*", "tea", "water", "alcohol", "beer", "wine",
+    # Hindi (romanized and Devanagari)
+    "khana", "khaana", "sehat", "vajan", "wajan", "poshan", "aahar", "sabzi", "sabji", "phal", "doodh", "roti",
+    "पोषण", "खाना", "भोजन", "आहार", "प्रोटीन", "कैलोरी", "विटामिन", "फल", "सब्जी", "वजन", "स्वास्थ्य", "सेहत",
+    "डाइट", "चीनी", "दूध", "दाल", "चावल", "रोटी",
+    # Spanish / Portuguese
+    "nutrición", "comida*", "alimento*", "alimentação", "dieta*", "vitamina*", "proteína*", "caloría*",
+    "caloria*", "saludable*", "saudável", "grasa*", "gordura*", "azúcar", "açúcar", "fruta*", "verdura*",
+    "legumes", "comer", "bebida*", "salud", "saúde", "peso",
+    # French / German / Italian
+    "aliment*", "nourriture", "manger", "régime", "protéine*", "sucre*", "légume*", "santé", "graisse*",
+    "ernährung", "essen", "lebensmittel", "kalorien", "eiweiß", "zucker", "obst", "gemüse", "diät", "gesund*",
+    "abnehmen", "cibo", "mangiare", "salute", "verdure",
+]
+
+OFF_TOPIC_TERMS = [
+    "weather", "forecast", "stock market", "stocks", "share price", "bitcoin", "crypto*", "nft*", "football",
+    "soccer", "cricket", "ipl", "nba", "movie*", "film*", "netflix", "song*", "lyrics", "music", "politic*",
+    "election*", "president", "prime minister", "programming", "javascript", "python", "java", "coding",
+    "source code", "homework", "math problem", "equation", "joke*", "video game*", "capital of", "news",
+    "horoscope", "dating", "girlfriend", "boyfriend", "car", "cars", "flight*", "hotel*", "laptop*", "iphone",
+    "clima", "tiempo", "película*", "fútbol", "wetter", "politik", "météo", "मौसम", "क्रिकेट", "फिल्म",
+]
+
+
+_END = ""
+_STEM = "*"
+
+
+def _trie_regex(node):
+    """Regex for a trie node; longer continuations are tried before ending the term here."""
+    if _STEM in node:
+        return r"\w*" # A stem already matches every longer term below it
+    branches = [re.escape(char) + _trie_regex(child) for char, child in sorted(node.items()) if char != _END]
+    if not branches:
+        return ""
+    if len(branches) == 1 and _END not in node:
+        return branches[0]
+    group = "(?:" + "|".join(branches) + ")"
+    return group + "?" if _END in node else group
+
+
+def _alternation(terms):
+    trie = {}
+    for term in terms:
+        node = trie
+        is_stem = term.endswith("*")
+        for char in term.rstrip("*"):
+            node = node.setdefault(char, {})
+        node[_STEM if is_stem else _END] = {}
+    return _trie_regex(trie)
+
+
+def _food_names():
+    """Every name, synonym and plural the local nutrition table knows."""
+    return list(nutrition_facts.index)
+
+
+def compile_router_pattern(food_names=None):
+    groups = [
+        ("meal", MEAL_TERMS),
+        ("request", REQUEST_TERMS),
+        ("nutrition", NUTRITION_TERMS + (food_names if food_names is not None else _food_names())),
+        ("off_topic", OFF_TOPIC_TERMS),
+    ]
+    body = "|".join(f"(?P<{name}>{_alternation(terms)})" for name, terms in groups)
+    return re.compile(rf"(?<!\w)(?:{body})(?!\w)")
+
+
+_ROUTER_PATTERN = compile_router_pattern()
+
+
+def scan_query(text):
+    """Returns the set of lexicon categories ('meal', 'request', 'nutrition', 'off_topic') found in text."""
+    hits = set()
+    for match in _ROUTER_PATTERN.finditer((text or "").casefold()):
+        hits.add(match.lastgroup)
+        if len(hits) == 4:
+            break
+    return hits
+
+
+def route_query(text, has_image=False):
+    """
+    Sorts a /chat message into one of OFF_TOPIC, SINGLE_FOOD, MEAL_PLAN or GENERAL_QUESTION.
+    Returns (intent, food) where food is the nutrition table row for SINGLE_FOOD, else None.
+    Only messages that name an off-topic subject and nothing food-related are OFF_TOPIC;
+    anything unrecognised is given the benefit of the doubt as a GENERAL_QUESTION.
+    """
+    if not has_image:
+        food = nutrition_facts.match_query(text)
+        if food is not None:
+            return SINGLE_FOOD, food
+
+    hits = scan_query(text)
+    if "meal" in hits or ("request" in hits and "nutrition" in hits):
+        return MEAL_PLAN, None
+    if "nutrition" in hits or has_image:
+        return GENERAL_QUESTION, None
+    if "off_topic" in hits:
+        return OFF_TOPIC, None
+    return GENERAL_QUESTION, None
+
+
 def is_food_related(text):
-    keywords = ["nutrition", "vitamin", "calories", "food", "fruit", "meal", "protein", "diet", "carbs", "sugar"]
-    return any(word in text.lower() for word in keywords)
+    return bool(scan_query(text) & {"meal", "nutrition"})
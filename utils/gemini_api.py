@@ -1,32 +1,31 @@
 import requests
-import base64
+import asyncio
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from secrets_config import GEMINI_API_KEY
+from utils.response_cache import response_cache
+from utils.gemini_client import GeminiClient, AsyncGeminiClient
+from utils.single_flight import single_flight
+from utils.image_pipeline import ImageUpload
+from utils.metrics import registry, stage
 
 
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY is not set in config.py. Please provide a valid API key.")
 
-FLASH_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={GEMINI_API_KEY}"
+# Shared client: pooled keep-alive connections, timeouts, retries and a circuit breaker
+gemini_client = GeminiClient(GEMINI_API_KEY)
+# Async client for the ASGI entry point; shares the breaker so both paths agree on upstream health
+async_gemini_client = AsyncGeminiClient(GEMINI_API_KEY, circuit_breaker=gemini_client.circuit_breaker)
 
-def encode_image(image_path):
-    """Encodes an image to base64 for multimodal queries."""
-    if not os.path.exists(image_path):
-        return None
-    with open(image_path, "rb") as img_file:
-        return base64.b64encode(img_file.read()).decode("utf-8")
+def load_image(image):
+    """Accepts an in-memory ImageUpload or, for older callers, a path to an image file."""
+    if image is None or isinstance(image, ImageUpload):
+        return image
+    return ImageUpload.from_path(image)
 
-def ask_gemini_flash(user_text, image_path=None, target_language='en-US'):
-    """
-    Uses Gemini 1.5 Flash 2.0 for both text-only and multimodal (image + text) nutrition queries.
-    The user_text now includes comprehensive context (original query, profile, feedback).
-    The response will be generated in the specified target_language.
-    """
-    prompt_parts = []
-
-    system_prompt = f"""
+SYSTEM_PROMPT = """
 You are a helpful and knowledgeable AI Nutrition Assistant. Your goal is to provide personalized, accurate, and actionable nutrition advice, meal suggestions, and food analysis based on the user's query, their profile, and their past feedback.
 
 When providing information, adhere strictly to these formatting guidelines:
@@ -52,58 +51,201 @@ IMPORTANT:
 - Personalization: Tailor your responses based on the user's provided profile (age, gender, diet, goal, height, weight, BMI, medical conditions) and their feedback (liked/disliked items).
 - Avoid Disliked Items: Explicitly avoid recommending or including ingredients/concepts that the user has previously disliked.
 - Clarity: Ensure all nutritional values are clearly stated with units.
+- Keep the Nutritional Info labels (Protein, Carbohydrates, Fats, Fiber, Calories) in English in every language; the app reads the values from them.
 - Tone: Maintain a helpful, encouraging, and professional tone.
 - Language: Respond entirely in the language corresponding to the BCP-47 language tag: {target_language}.
-
+- Conversation: Earlier messages of the conversation may precede the current one; use them to resolve follow-ups such as "swap the eggs in the second option".
 """
-    prompt_parts.append({"text": system_prompt.strip()})
-    prompt_parts.append({"text": f"\n---\n{user_text}\n---\n"})
-
-    if image_path:
-        encoded_image = encode_image(image_path)
-        if encoded_image:
-            prompt_parts.append({
-                "inline_data": {
-                    "mime_type": "image/jpeg",
-                    "data": encoded_image
-                }
-            })
-
-    payload = {
-        "contents": [
-            {"role": "user", "parts": prompt_parts}
-        ]
+
+def build_gemini_payload(user_text, image=None, target_language='en-US', context=None, history=None):
+    """
+    Builds the generateContent request body. The system prompt and the user context (profile,
+    preferences) go into systemInstruction, which stays the same for a whole conversation, so
+    the repeated prefix is eligible for Gemini's implicit context caching; earlier turns
+    (see utils/conversation_store.py) precede the new message and optional image in contents.
+    The image is downscaled in memory and sent with its real mime type (see utils/image_pipeline.py).
+    The response will be generated in the specified target_language.
+    """
+    system_text = SYSTEM_PROMPT.format(target_language=target_language).strip()
+    if context:
+        system_text += f"\n\n{context}"
+    message_parts = [{"text": user_text}]
+    history = list(history or [])
+    registry.observe("gemini_prompt_chars", len(system_text) + len(user_text) +
+                     sum(len(part["text"]) for turn in history for part in turn["parts"]))
+
+    image = load_image(image)
+    if image:
+        with stage("image_encode"): # Downscale + base64
+            message_parts.append({"inline_data": image.inline_data()})
+
+    return {
+        "systemInstruction": {"parts": [{"text": system_text}]},
+        "contents": history + [{"role": "user", "parts": message_parts}]
     }
 
-    try:
-        response = requests.post(FLASH_URL, json=payload)
-        response.raise_for_status()
+EMPTY_REPLY_MESSAGE = "Sorry, I couldn't generate a response. The AI provided an empty or unexpected reply. Please try again."
 
-        response_json = response.json()
+def extract_response_text(response_json):
+    """Returns the text of the first candidate in a (full or streamed) Gemini response, or None."""
+    if response_json and 'candidates' in response_json and \
+       len(response_json['candidates']) > 0 and \
+       'content' in response_json['candidates'][0] and \
+       'parts' in response_json['candidates'][0]['content'] and \
+       len(response_json['candidates'][0]['content'].get('parts', [])) > 0:
+        return response_json['candidates'][0]['content']['parts'][0].get('text', '').replace('*', '')
+    return None
 
-        if response_json and 'candidates' in response_json and \
-           len(response_json['candidates']) > 0 and \
-           'content' in response_json['candidates'][0] and \
-           'parts' in response_json['candidates'][0]['content'] and \
-           len(response_json['candidates'][0]['content'].get('parts', [])) > 0:
-            return response_json['candidates'][0]['content']['parts'][0]['text'].replace('*', '')
-        else:
-            return "Sorry, I couldn't generate a response. The AI provided an empty or unexpected reply. Please try again."
-    except requests.exceptions.HTTPError as http_err:
-        return f"Sorry, an HTTP error occurred with the AI. ({http_err.response.status_code}) Please check your API key or try again later."
-    except requests.exceptions.ConnectionError as conn_err:
+class ErrorReply(str):
+    """
+    A message shown instead of a reply when the Gemini call failed or came back empty. It's sent
+    to the user like any reply; the type marks it so it's kept out of conversations and intake.
+    """
+
+def is_error_reply(text):
+    """True for the messages shown instead of a reply, which are not kept in a conversation."""
+    return isinstance(text, ErrorReply)
+
+def friendly_error_message(error):
+    """Maps an exception from the Gemini call to the message shown to the user."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return f"Sorry, an HTTP error occurred with the AI. ({error.response.status_code}) Please check your API key or try again later."
+    if isinstance(error, requests.exceptions.ConnectionError):
         return "Sorry, a network connection error occurred while reaching the AI. Please check your internet connection."
-    except requests.exceptions.Timeout as timeout_err:
+    if isinstance(error, requests.exceptions.Timeout):
         return "Sorry, the AI request timed out. Please try again later."
-    except requests.exceptions.RequestException as req_err:
+    if isinstance(error, requests.exceptions.RequestException): # Includes CircuitOpenError (fail fast)
         return "Sorry, an unknown error occurred with the AI request. Please try again later."
+    return f"Sorry, an unexpected error occurred with the AI. Please try again later. (Error: {error})"
+
+def _generate_reply(user_text, image, target_language, cache_key, context=None, history=None):
+    """One upstream generateContent call; caches the reply if it succeeded."""
+    try:
+        payload = build_gemini_payload(user_text, image, target_language, context, history)
+        response_text = extract_response_text(gemini_client.generate_content(payload))
+
+        if response_text:
+            if cache_key:
+                response_cache.set(cache_key, response_text) # Only successful replies are cached
+            return response_text
+        else:
+            return ErrorReply(EMPTY_REPLY_MESSAGE)
     except Exception as e:
-        return f"Sorry, an unexpected error occurred with the AI. Please try again later. (Error: {e})"
+        return ErrorReply(friendly_error_message(e))
+
+def ask_gemini_flash(user_text, image=None, target_language='en-US', cache_key=None, context=None, history=None):
+    """
+    Uses Gemini 1.5 Flash 2.0 for both text-only and multimodal (image + text) nutrition queries.
+    context (profile, feedback) is sent as part of the system instruction and history holds the
+    conversation's earlier turns as Gemini contents (see app.build_chat_prompt).
+    The response will be generated in the specified target_language.
+    If cache_key is given (see utils/response_cache.make_cache_key), successful replies are
+    cached and a cached reply is returned without calling the API. Concurrent requests with the
+    same cache_key share a single upstream call (see utils/single_flight.py).
+    """
+    if not cache_key:
+        return _generate_reply(user_text, image, target_language, cache_key, context, history)
+
+    cached_response = response_cache.get(cache_key)
+    if cached_response is not None:
+        return cached_response
+    return single_flight.do(cache_key,
+                            lambda: _generate_reply(user_text, image, target_language, cache_key, context, history),
+                            lookup=response_cache.get)
+
+async def _generate_reply_async(user_text, image, target_language, cache_key, context=None, history=None):
+    try:
+        payload = await asyncio.to_thread(build_gemini_payload, user_text, image, target_language, context, history)
+        response_text = extract_response_text(await async_gemini_client.generate_content(payload))
+
+        if response_text:
+            if cache_key:
+                await asyncio.to_thread(response_cache.set, cache_key, response_text)
+            return response_text
+        else:
+            return ErrorReply(EMPTY_REPLY_MESSAGE)
+    except Exception as e:
+        return ErrorReply(friendly_error_message(e))
+
+async def ask_gemini_async(user_text, image=None, target_language='en-US', cache_key=None, context=None, history=None):
+    """
+    asyncio version of ask_gemini_flash used by the ASGI chat endpoint (asgi.py).
+    Cache lookups and image encoding run in a thread so the event loop never blocks on disk.
+    """
+    if not cache_key:
+        return await _generate_reply_async(user_text, image, target_language, cache_key, context, history)
+
+    cached_response = await asyncio.to_thread(response_cache.get, cache_key)
+    if cached_response is not None:
+        return cached_response
+    return await single_flight.do_async(cache_key,
+                                        lambda: _generate_reply_async(user_text, image, target_language, cache_key,
+                                                                      context, history),
+                                        lookup=response_cache.get)
+
+def ask_gemini_stream(user_text, image=None, target_language='en-US', cache_key=None, context=None, history=None):
+    """
+    Streaming variant of ask_gemini_flash using streamGenerateContent.
+    Yields text chunks as soon as Gemini produces them. Errors are yielded as the same
+    friendly messages (an ErrorReply chunk, possibly after some text if the stream broke off);
+    the full reply is cached only if the stream completed cleanly.
+    """
+    if cache_key:
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            yield cached_response
+            return
+
+    chunks = []
+    try:
+        payload = build_gemini_payload(user_text, image, target_language, context, history)
+        for event in gemini_client.stream_generate_content(payload):
+            text = extract_response_text(event)
+            if text:
+                chunks.append(text)
+                yield text
+    except Exception as e:
+        yield ErrorReply(friendly_error_message(e))
+        return
+
+    if not chunks:
+        yield ErrorReply(EMPTY_REPLY_MESSAGE)
+    elif cache_key:
+        response_cache.set(cache_key, ''.join(chunks))
+
+async def ask_gemini_stream_async(user_text, image=None, target_language='en-US', cache_key=None, context=None,
+                                  history=None):
+    """
+    asyncio version of ask_gemini_stream used by the ASGI /chat/stream endpoint (asgi.py);
+    yields the same chunks, including the ErrorReply chunk when the stream fails.
+    """
+    if cache_key:
+        cached_response = await asyncio.to_thread(response_cache.get, cache_key)
+        if cached_response is not None:
+            yield cached_response
+            return
+
+    chunks = []
+    try:
+        payload = await asyncio.to_thread(build_gemini_payload, user_text, image, target_language, context, history)
+        async for event in async_gemini_client.stream_generate_content(payload):
+            text = extract_response_text(event)
+            if text:
+                chunks.append(text)
+                yield text
+    except Exception as e:
+        yield ErrorReply(friendly_error_message(e))
+        return
+
+    if not chunks:
+        yield ErrorReply(EMPTY_REPLY_MESSAGE)
+    elif cache_key:
+        await asyncio.to_thread(response_cache.set, cache_key, ''.join(chunks))
 
-def ask_gemini(user_text, image_path=None, target_language='en-US'):
+def ask_gemini(user_text, image=None, target_language='en-US', cache_key=None, context=None, history=None):
     """
     Unified function to ask Gemini models.
     Always uses Gemini 1.5 Flash for both text and multimodal inputs.
-    Passes target_language to the underlying ask_gemini_flash function.
+    Passes target_language, cache_key and the conversation context/history to ask_gemini_flash.
     """
-    return ask_gemini_flash(user_text, image_path, target_language)
+    return ask_gemini_flash(user_text, image, target_language, cache_key=cache_key, context=context, history=history)
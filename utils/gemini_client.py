@@ -0,0 +1,277 @@
+# gemini_client.py
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import registry
+
+GEMINI_API_BASE = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_MODEL = "gemini-1.5-flash-latest"
+GEMINI_CONNECT_TIMEOUT = float(os.environ.get("GEMINI_CONNECT_TIMEOUT", 5)) # Seconds
+GEMINI_READ_TIMEOUT = float(os.environ.get("GEMINI_READ_TIMEOUT", 60)) # Seconds
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", 2))
+GEMINI_POOL_SIZE = int(os.environ.get("GEMINI_POOL_SIZE", 10))
+GEMINI_ASYNC_POOL_SIZE = int(os.environ.get("GEMINI_ASYNC_POOL_SIZE", 200)) # One event loop holds many in-flight calls
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def record_attempt(started, outcome, response_bytes=None):
+    """Metrics for one HTTP attempt: latency, outcome (status code or error kind) and body size."""
+    registry.observe("gemini_request_seconds", time.perf_counter() - started)
+    registry.inc("gemini_responses_total", outcome=outcome)
+    if response_bytes is not None:
+        registry.observe("gemini_response_bytes", response_bytes)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without touching the network while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive upstream failures and rejects calls for
+    `reset_timeout` seconds. After that a single trial call is let through (half-open):
+    success closes the breaker, failure opens it again.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN # Let one trial request through per reset window
+                self.opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class BaseGeminiClient:
+    """Configuration, endpoint and backoff logic shared by the sync and async clients."""
+
+    def __init__(self, api_key, model=GEMINI_MODEL, base_url=GEMINI_API_BASE,
+                 connect_timeout=GEMINI_CONNECT_TIMEOUT, read_timeout=GEMINI_READ_TIMEOUT,
+                 max_retries=GEMINI_MAX_RETRIES, backoff_base=0.5, backoff_max=8.0,
+                 pool_size=GEMINI_POOL_SIZE, circuit_breaker=None):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+
+    def endpoint(self, method="generateContent"):
+        return f"{self.base_url}/models/{self.model}:{method}"
+
+    def _backoff(self, attempt, response=None):
+        """Full-jitter exponential backoff, honouring Retry-After on 429/503 when present."""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+
+class GeminiClient(BaseGeminiClient):
+    """
+    Thin HTTP client for the Gemini REST API.
+    Reuses keep-alive connections from a pooled requests.Session, applies connect/read
+    timeouts, retries 429/5xx and network errors with jittered exponential backoff and
+    fails fast through a circuit breaker while the upstream is unhealthy.
+    base_url can point at a local stand-in server for testing.
+    """
+
+    def __init__(self, api_key, **kwargs):
+        super().__init__(api_key, **kwargs)
+        self.timeout = (self.connect_timeout, self.read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size) # Retries are handled below
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, method, payload, stream=False):
+        """
+        POSTs payload to models/<model>:<method> and returns the requests.Response.
+        Raises requests exceptions (HTTPError, Timeout, ConnectionError, CircuitOpenError) on failure.
+        """
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError("Gemini upstream is unavailable (circuit open)")
+
+        params = {"key": self.api_key}
+        if stream:
+            params["alt"] = "sse"
+        body = json.dumps(payload).encode("utf-8") # Serialized once, so its size can be recorded
+        registry.observe("gemini_request_bytes", len(body))
+        attempt = 0
+        while True:
+            response = None
+            started = time.perf_counter()
+            try:
+                response = self.session.post(self.endpoint(method), params=params, data=body, headers=JSON_HEADERS,
+                                             timeout=self.timeout, stream=stream)
+                record_attempt(started, response.status_code, None if stream else len(response.content))
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    self.circuit_breaker.record_success() # The upstream answered; other 4xx are our fault
+                    response.raise_for_status()
+                    return response
+                error = requests.exceptions.HTTPError(f"{response.status_code} from Gemini", response=response)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                record_attempt(started, "timeout" if isinstance(e, requests.exceptions.Timeout) else "connection_error")
+                error = e
+
+            if attempt >= self.max_retries:
+                self.circuit_breaker.record_failure()
+                raise error
+            if response is not None:
+                response.close()
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    def generate_content(self, payload):
+        """Calls generateContent and returns the decoded JSON response."""
+        return self.post("generateContent", payload).json()
+
+    def stream_generate_content(self, payload):
+        """
+        Calls streamGenerateContent with Server-Sent Events (alt=sse) and yields each
+        decoded JSON chunk as it arrives.
+        """
+        response = self.post("streamGenerateContent", payload, stream=True)
+        response.encoding = "utf-8"
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data:"):
+                    yield json.loads(line[len("data:"):].strip())
+        finally:
+            response.close()
+
+
+class AsyncGeminiClient(BaseGeminiClient):
+    """
+    asyncio counterpart of GeminiClient built on httpx.AsyncClient, so one worker's event
+    loop can keep hundreds of Gemini calls in flight. Same timeouts, retry/backoff and
+    circuit breaker semantics; failures are raised as the equivalent requests exceptions
+    so callers can share error handling with the sync path.
+    """
+
+    def __init__(self, api_key, pool_size=GEMINI_ASYNC_POOL_SIZE, **kwargs):
+        super().__init__(api_key, pool_size=pool_size, **kwargs)
+        self._client = None
+        self._client_loop = None
+
+    def _get_client(self):
+        """Creates the pooled httpx client lazily, inside the running event loop."""
+        import httpx # Only needed by the async (ASGI) entry point
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def post(self, method, payload, stream=False):
+        """
+        Async version of GeminiClient.post; returns the httpx.Response. With stream=True the
+        body is left unread, and the caller must close the response (aclose()).
+        """
+        import httpx
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError("Gemini upstream is unavailable (circuit open)")
+
+        client = self._get_client()
+        params = {"key": self.api_key}
+        if stream:
+            params["alt"] = "sse"
+        body = json.dumps(payload).encode("utf-8")
+        registry.observe("gemini_request_bytes", len(body))
+        attempt = 0
+        while True:
+            response = None
+            started = time.perf_counter()
+            try:
+                request = client.build_request("POST", self.endpoint(method), params=params, content=body,
+                                               headers=JSON_HEADERS)
+                response = await client.send(request, stream=stream)
+                record_attempt(started, response.status_code, None if stream else len(response.content))
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    self.circuit_breaker.record_success()
+                    if response.status_code >= 400:
+                        await response.aclose()
+                        raise requests.exceptions.HTTPError(f"{response.status_code} from Gemini", response=response)
+                    return response
+                error = requests.exceptions.HTTPError(f"{response.status_code} from Gemini", response=response)
+            except httpx.TimeoutException as e:
+                record_attempt(started, "timeout")
+                error = requests.exceptions.Timeout(str(e))
+            except httpx.TransportError as e:
+                record_attempt(started, "connection_error")
+                error = requests.exceptions.ConnectionError(str(e))
+
+            if attempt >= self.max_retries:
+                self.circuit_breaker.record_failure()
+                raise error
+            if response is not None:
+                await response.aclose()
+            await asyncio.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    async def generate_content(self, payload):
+        """Calls generateContent and returns the decoded JSON response."""
+        response = await self.post("generateContent", payload)
+        return response.json()
+
+    async def stream_generate_content(self, payload):
+        """
+        Async version of GeminiClient.stream_generate_content: yields each decoded JSON chunk
+        of the SSE stream as it arrives.
+        """
+        import httpx
+        response = await self.post("streamGenerateContent", payload, stream=True)
+        try:
+            async for line in response.aiter_lines():
+                if line and line.startswith("data:"):
+                    yield json.loads(line[len("data:"):].strip())
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e))
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+        finally:
+            await response.aclose()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
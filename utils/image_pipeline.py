@@ -0,0 +1,142 @@
+# image_pipeline.py
+import base64
+import hashlib
+import os
+
+IMAGE_MAX_SIDE = int(os.environ.get("IMAGE_MAX_SIDE", 1024)) # Longest side sent to Gemini, in pixels
+IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", 85))
+IMAGE_PASSTHROUGH_BYTES = 512 * 1024 # Small JPEG/PNG/WebP uploads within bounds are sent untouched
+IMAGE_MAX_UPLOAD_BYTES = int(os.environ.get("IMAGE_MAX_UPLOAD_BYTES", 16 * 1024 * 1024)) # Whole request body; larger ones get 413
+
+# Magic-number prefixes of the formats Gemini accepts
+_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+def sniff_mime_type(data):
+    """Detects the real image type from its first bytes (None if unrecognised)."""
+    for signature, mime_type in _SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp" and data[8:12] in (b"heic", b"heix", b"mif1", b"msf1", b"heim", b"heis"):
+        return "image/heic" if data[8:12] != b"mif1" else "image/heif"
+    return None
+
+
+def _jpeg_dimensions(data):
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF: # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9: # Markers without a length
+            i += 2
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC): # Start of frame
+            return int.from_bytes(data[i + 7:i + 9], "big"), int.from_bytes(data[i + 5:i + 7], "big")
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+def _webp_dimensions(data):
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30:
+        return int.from_bytes(data[26:28], "little") & 0x3FFF, int.from_bytes(data[28:30], "little") & 0x3FFF
+    if chunk == b"VP8L" and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(data) >= 30:
+        return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    return None
+
+
+def image_dimensions(data, mime_type):
+    """(width, height) read from the JPEG/PNG/WebP header without decoding the pixels; None if unknown."""
+    if mime_type == "image/jpeg":
+        return _jpeg_dimensions(data)
+    if mime_type == "image/png" and len(data) >= 24 and data[12:16] == b"IHDR":
+        return int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+    if mime_type == "image/webp":
+        return _webp_dimensions(data)
+    return None
+
+
+def downscale_image(data, max_side=IMAGE_MAX_SIDE, quality=IMAGE_JPEG_QUALITY):
+    """
+    Decodes the image in memory, shrinks it so its longest side is at most max_side and
+    re-encodes it as JPEG. Returns the JPEG bytes, or None if OpenCV can't decode it
+    (e.g. HEIC) or isn't installed.
+    """
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        return None
+
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    height, width = img.shape[:2]
+    scale = max_side / float(max(height, width))
+    if scale < 1.0:
+        img = cv2.resize(img, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes() if ok else None
+
+
+class ImageUpload:
+    """
+    A food photo held in memory. The content hash (for response caching) is computed from
+    the original bytes right away; the downscaled Gemini payload is only built when a
+    request actually reaches the API, and then reused.
+    """
+
+    def __init__(self, data, filename=None):
+        self.data = data
+        self.filename = filename
+        self.sha256 = hashlib.sha256(data).hexdigest()
+        self._prepared = None
+
+    @classmethod
+    def from_upload(cls, file_storage):
+        """Reads a werkzeug FileStorage that app.UploadRequest kept in memory (no temp file)."""
+        if not (file_storage and file_storage.filename):
+            return None
+        data = file_storage.read()
+        return cls(data, file_storage.filename) if data else None
+
+    @classmethod
+    def from_path(cls, image_path):
+        if not os.path.exists(image_path):
+            return None
+        with open(image_path, "rb") as f:
+            return cls(f.read(), os.path.basename(image_path))
+
+    def prepared(self):
+        """Returns (bytes, mime_type) bounded in resolution and size for the Gemini payload."""
+        if self._prepared is None:
+            mime_type = sniff_mime_type(self.data)
+            size = image_dimensions(self.data, mime_type) if len(self.data) <= IMAGE_PASSTHROUGH_BYTES else None
+            if size is not None and max(size) <= IMAGE_MAX_SIDE:
+                self._prepared = (self.data, mime_type)
+            else:
+                jpeg = downscale_image(self.data)
+                if jpeg is not None:
+                    self._prepared = (jpeg, "image/jpeg")
+                else:
+                    self._prepared = (self.data, mime_type or "image/jpeg")
+        return self._prepared
+
+    def inline_data(self):
+        """The Gemini inline_data part for this image."""
+        data, mime_type = self.prepared()
+        return {"mime_type": mime_type, "data": base64.b64encode(data).decode("utf-8")}
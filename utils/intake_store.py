@@ -0,0 +1,261 @@
+# intake_store.py
+"""
+Nutrition values of the replies a user received, kept as typed numeric records for intake
+analytics.
+
+extract_nutrition() reads the "Nutritional Info" blocks the system prompt asks for (Protein /
+Carbohydrates / Fats / Fiber / Calories) out of a reply, one record per meal option or food.
+IntakeStore appends the records to a per-user file of fixed-width binary records
+(data/intake/user_<id>.bin); np.fromfile loads it as a structured array whose fields are the
+columns, so summaries are computed with vectorized operations and text is never parsed again.
+Files only grow, so each process caches the loaded arrays and reads just the new tail.
+
+A reply with several options counts as one meal: each of its records is weighted 1/options.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+import numpy as np
+
+try:
+    import fcntl # Cross-process locking (Linux/macOS); Windows falls back to the in-process lock only
+except ImportError:
+    fcntl = None
+
+INTAKE_DIR = "data/intake"
+INTAKE_CACHE_USERS = int(os.environ.get("INTAKE_CACHE_USERS", 256)) # Users whose records stay loaded, per process
+NUTRIENT_FIELDS = ["protein_g", "carbs_g", "fat_g", "fiber_g", "calories_kcal"] # Same names as data/nutrition
+MIN_FIELDS = 3 # Values a block needs to count as a record; missing ones are stored as NaN
+INTAKE_DTYPE = np.dtype([("ts", "<i8"), ("options", "u1")] + [(field, "<f4") for field in NUTRIENT_FIELDS])
+
+NUTRIENT_LABELS = {"protein": "protein_g", "carbohydrate": "carbs_g", "carbohydrates": "carbs_g", "carbs": "carbs_g",
+                   "fat": "fat_g", "fats": "fat_g", "fiber": "fiber_g", "fibre": "fiber_g",
+                   "calorie": "calories_kcal", "calories": "calories_kcal"}
+# "Protein: 12g", "- Calories: ~1,200 kcal", "Fiber: 6-8 g" (a range counts as its midpoint)
+NUTRIENT_LINE = re.compile(
+    r"^[\s#>•-]*(?P<label>protein|carbohydrates?|carbs|fats?|fib(?:er|re)|calories?)\s*[:=]\s*(?:~|approx\.?|about)?\s*"
+    r"(?P<low>\d[\d,]*(?:\.\d+)?)(?:\s*(?:-|–|to)\s*(?P<high>\d[\d,]*(?:\.\d+)?))?",
+    re.IGNORECASE | re.MULTILINE)
+
+ACTIVITY_FACTOR = 1.375 # Lightly active; the profile does not record activity
+GOAL_CALORIE_ADJUSTMENT = {"weight loss": -500, "muscle gain": 300}
+PROTEIN_G_PER_KG = {"muscle gain": 1.6} # Otherwise DEFAULT_PROTEIN_G_PER_KG
+DEFAULT_PROTEIN_G_PER_KG = 1.2
+FAT_CALORIE_SHARE = 0.3
+FIBER_G_PER_1000_KCAL = 14
+
+
+def _value(text):
+    return float(text.replace(",", ""))
+
+
+def extract_nutrition(text):
+    """
+    Typed records ({field: float or None}) from the Nutritional Info blocks of a reply, in order.
+    A block ends where a nutrient repeats; blocks with fewer than MIN_FIELDS values are ignored.
+    """
+    blocks, current = [], {}
+    for match in NUTRIENT_LINE.finditer((text or "").replace("*", "")):
+        field = NUTRIENT_LABELS[match.group("label").lower()]
+        if field in current:
+            blocks.append(current)
+            current = {}
+        low = _value(match.group("low"))
+        current[field] = (low + _value(match.group("high"))) / 2 if match.group("high") else low
+    blocks.append(current)
+    return [{field: block.get(field) for field in NUTRIENT_FIELDS} for block in blocks if len(block) >= MIN_FIELDS]
+
+
+def to_records(records, timestamp=None):
+    """Extracted records (one reply) as an INTAKE_DTYPE array."""
+    array = np.zeros(len(records), dtype=INTAKE_DTYPE)
+    array["ts"] = int(time.time() if timestamp is None else timestamp)
+    array["options"] = min(len(records), 255)
+    for field in NUTRIENT_FIELDS:
+        array[field] = [np.nan if record[field] is None else record[field] for record in records]
+    return array
+
+
+def daily_targets(profile):
+    """
+    Daily calories (Mifflin-St Jeor at a light activity level, adjusted for the goal) and
+    macros derived from them; None if the profile lacks age, height or weight.
+    """
+    try:
+        age, height, weight = float(profile.get("age")), float(profile.get("height_cm")), float(profile.get("weight_kg"))
+    except (TypeError, ValueError):
+        return None
+    gender = str(profile.get("gender") or "").lower()
+    sex_offset = {"male": 5, "female": -161}.get(gender, -78) # Midpoint when not given
+    goal = str(profile.get("goal") or "").lower()
+    calories = (10 * weight + 6.25 * height - 5 * age + sex_offset) * ACTIVITY_FACTOR + GOAL_CALORIE_ADJUSTMENT.get(goal, 0)
+    protein = weight * PROTEIN_G_PER_KG.get(goal, DEFAULT_PROTEIN_G_PER_KG)
+    fat = calories * FAT_CALORIE_SHARE / 9
+    carbs = max(0.0, (calories - protein * 4 - fat * 9) / 4)
+    return {"protein_g": round(protein, 1), "carbs_g": round(carbs, 1), "fat_g": round(fat, 1),
+            "fiber_g": round(calories / 1000 * FIBER_G_PER_1000_KCAL, 1), "calories_kcal": round(calories)}
+
+
+def _by_field(values):
+    return {field: round(float(value), 1) for field, value in zip(NUTRIENT_FIELDS, values)}
+
+
+def summarize_intake(records, targets=None, weeks=4, tz_offset_minutes=0, now=None):
+    """
+    Daily and weekly totals, daily averages (over days with at least one meal) and their
+    difference from `targets` for the `weeks` weeks ending today. Days are counted in the
+    user's time zone (minutes east of UTC).
+    """
+    now = time.time() if now is None else now
+    offset = tz_offset_minutes * 60
+    days = weeks * 7
+    first_day = int((now + offset) // 86400) - days + 1
+
+    day = (records["ts"] + offset) // 86400 - first_day
+    in_window = (day >= 0) & (day < days)
+    day = day[in_window]
+    weight = 1.0 / records["options"][in_window] # Each reply counts as one meal
+    meals = np.bincount(day, weights=weight, minlength=days)
+    daily = np.stack([np.bincount(day, weights=np.nan_to_num(records[field][in_window].astype(np.float64)) * weight,
+                                  minlength=days) for field in NUTRIENT_FIELDS])
+    active = meals > 0
+    weekly = daily.reshape(len(NUTRIENT_FIELDS), weeks, 7).sum(axis=2)
+    weekly_active = active.reshape(weeks, 7).sum(axis=1)
+    target = np.array([targets[field] for field in NUTRIENT_FIELDS], dtype=np.float64) if targets else None
+
+    def average(totals, active_days):
+        if not active_days:
+            return None, None
+        mean = totals / active_days
+        return _by_field(mean), _by_field(mean - target) if target is not None else None
+
+    def day_label(index):
+        return date.fromordinal(date(1970, 1, 1).toordinal() + first_day + index).isoformat()
+
+    daily_average, goal_delta = average(daily.sum(axis=1), int(active.sum()))
+    weekly_rows = []
+    for w in range(weeks):
+        week_average, week_delta = average(weekly[:, w], int(weekly_active[w]))
+        weekly_rows.append({"week_start": day_label(w * 7), "active_days": int(weekly_active[w]),
+                            "totals": _by_field(weekly[:, w]), "daily_average": week_average, "goal_delta": week_delta})
+    return {
+        "from": day_label(0),
+        "to": day_label(days - 1),
+        "targets": targets,
+        "active_days": int(active.sum()),
+        "daily_average": daily_average,
+        "goal_delta": goal_delta,
+        "weekly": weekly_rows,
+        "daily": [{"date": day_label(i), "meals": round(float(meals[i]), 2), **_by_field(daily[:, i])}
+                  for i in np.flatnonzero(active)],
+    }
+
+
+class IntakeStore:
+    """Append-only per-user record files, with an LRU of loaded arrays per process."""
+
+    def __init__(self, directory=INTAKE_DIR, cache_users=INTAKE_CACHE_USERS):
+        self.directory = directory
+        self.cache_users = cache_users
+        self._lock = threading.Lock()
+        self._cache = OrderedDict() # path -> records array
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id):
+        return os.path.join(self.directory, f"user_{re.sub(r'[^A-Za-z0-9_-]', '_', str(user_id))}.bin")
+
+    def append(self, user_id, records, timestamp=None):
+        """Appends the records of one reply (from extract_nutrition); returns how many were stored."""
+        if not records:
+            return 0
+        data = to_records(records, timestamp).tobytes()
+        with self._lock, open(self._path(user_id), "ab") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX) # Whole records only, even with several workers appending
+            f.write(data)
+        return len(records)
+
+    def load(self, user_id):
+        """All of the user's records as an INTAKE_DTYPE array (oldest first)."""
+        path = self._path(user_id)
+        try:
+            count = os.path.getsize(path) // INTAKE_DTYPE.itemsize
+        except OSError:
+            return np.zeros(0, dtype=INTAKE_DTYPE)
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None:
+                self._cache.move_to_end(path)
+        if cached is not None and len(cached) == count:
+            return cached
+        loaded = 0 if cached is None or len(cached) > count else len(cached)
+        with open(path, "rb") as f:
+            f.seek(loaded * INTAKE_DTYPE.itemsize)
+            tail = np.fromfile(f, dtype=INTAKE_DTYPE, count=count - loaded)
+        records = np.concatenate([cached, tail]) if loaded else tail
+        with self._lock:
+            self._cache[path] = records
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.cache_users:
+                self._cache.popitem(last=False)
+        return records
+
+    @staticmethod
+    def _liked_replies(feedback_rows):
+        """(timestamp, reply) of each rated message whose latest rating is a like, oldest first."""
+        messages = {} # message_id -> [first timestamp, reply, latest rating]
+        for row in feedback_rows:
+            try:
+                timestamp = datetime.fromisoformat(row.get("timestamp") or "").timestamp()
+            except ValueError:
+                continue
+            message_id = row.get("message_id") or f"{timestamp}:{row.get('message_content')}"
+            if message_id in messages:
+                messages[message_id][2] = row.get("feedback_type")
+            else:
+                messages[message_id] = [timestamp, row.get("message_content"), row.get("feedback_type")]
+        liked = [(timestamp, reply) for timestamp, reply, rating in messages.values() if rating == "like"]
+        return sorted(liked, key=lambda item: item[0])
+
+    def backfill_from_feedback(self, feedback_manager, user_ids):
+        """
+        Seeds intake records from the liked replies in the users' feedback logs, with the original
+        timestamps; each message counts once however often it was rated. Users who already have
+        records from /chat keep them, merged with the liked replies from before the first one
+        (later replies were recorded when they were sent). Meant to run before the workers start,
+        since the file is rewritten in place. Returns (users, records) added.
+        """
+        users = added = 0
+        for user_id in user_ids:
+            liked = []
+            for timestamp, reply in self._liked_replies(feedback_manager.get_user_feedback(user_id)):
+                records = extract_nutrition(reply)
+                if records:
+                    liked.append((timestamp, records))
+            if not liked:
+                continue
+            path = self._path(user_id)
+            with self._lock, open(path, "a+b") as f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                existing = np.fromfile(f, dtype=INTAKE_DTYPE)
+                recorded_from = existing["ts"].min() if len(existing) else np.inf
+                arrays = [to_records(records, timestamp) for timestamp, records in liked if timestamp < recorded_from]
+                if arrays:
+                    backfilled = np.concatenate(arrays)
+                    f.seek(0)
+                    f.truncate()
+                    f.write(np.concatenate([backfilled, existing]).tobytes())
+                    users += 1
+                    added += len(backfilled)
+                self._cache.pop(path, None)
+        return users, added
+
+
+# Shared store used by /chat and /api/user/intake
+intake_store = IntakeStore()
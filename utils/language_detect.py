@@ -0,0 +1,238 @@
+"""
+Offline language identification for chat messages.
+A naive-Bayes classifier over character 1-3-grams: each language's log-probabilities for a
+shared n-gram vocabulary are stored as one uint8 matrix (data/langid/ngram_profiles.npz), so
+scoring a message is a dict lookup per n-gram plus one NumPy row-gather and sum. Letters are
+first sorted by Unicode script, which settles single-script languages (Thai, Korean, Tamil...)
+outright and limits the rest to the languages written in that script.
+
+The table is generated from the Apache-2.0 n-gram profiles that ship with the langdetect
+package (Wikipedia abstracts, 55 languages). Fetch the sdist outside the repo, then build:
+    pip download --no-deps --no-binary :all: langdetect==1.0.9 -d /tmp/langdetect
+    tar -xzf /tmp/langdetect/langdetect-1.0.9.tar.gz -C /tmp/langdetect
+    python -m utils.language_detect build /tmp/langdetect/langdetect-1.0.9/langdetect/profiles
+"""
+import bisect
+import json
+import math
+import os
+import sys
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+LANGID_PROFILES = "data/langid/ngram_profiles.npz"
+LANGID_CACHE_SIZE = int(os.environ.get("LANGID_CACHE_SIZE", 4096)) # Memoized messages per process
+NGRAM_ORDERS = (1, 2, 3)
+TOP_NGRAMS_PER_LANGUAGE = 300 # Most frequent n-grams of each language that enter the shared vocabulary
+LOGPROB_FLOOR = -9.0 # log P for n-grams a language never uses; quantized to 0
+LOGPROB_STEP = -LOGPROB_FLOOR / 255
+MIN_NGRAMS = 3 # Fewer known n-grams than this is too little evidence; use the default
+PRIOR_BONUS = 150 # Quantized log-prob units (about 5 nats) in favour of the expected language; decides short, ambiguous texts
+
+# Default UI locale (templates/index.html language selector) for each detected language;
+# only these languages are candidates, so profiles the UI can't use (Somali, Afrikaans...) never win
+LANGUAGE_LOCALES = {
+    "en": "en-US", "hi": "hi-IN", "es": "es-ES", "fr": "fr-FR", "de": "de-DE", "ja": "ja-JP", "zh-cn": "zh-CN",
+    "zh-tw": "zh-TW", "ko": "ko-KR", "pt": "pt-BR", "ru": "ru-RU", "ar": "ar-SA", "it": "it-IT", "nl": "nl-NL",
+    "sv": "sv-SE", "pl": "pl-PL", "tr": "tr-TR", "th": "th-TH", "vi": "vi-VN", "id": "id-ID", "ms": "ms-MY",
+    "tl": "fil-PH", "da": "da-DK", "fi": "fi-FI", "no": "no-NO", "he": "he-IL", "el": "el-GR", "hu": "hu-HU",
+    "cs": "cs-CZ", "sk": "sk-SK", "ro": "ro-RO", "bg": "bg-BG", "uk": "uk-UA", "hr": "hr-HR", "sr": "sr-RS",
+    "sl": "sl-SI", "et": "et-EE", "lv": "lv-LV", "lt": "lt-LT", "is": "is-IS", "cy": "cy-GB", "fa": "fa-IR",
+    "ur": "ur-PK", "bn": "bn-BD", "gu": "gu-IN", "kn": "kn-IN", "ml": "ml-IN", "mr": "mr-IN", "pa": "pa-IN",
+    "ta": "ta-IN", "te": "te-IN",
+}
+
+# (first code point, script); a code point belongs to the last range starting at or before it
+_SCRIPT_RANGES = [
+    (0x0000, "latin"), (0x0250, "other"), (0x0370, "greek"), (0x0400, "cyrillic"), (0x0530, "other"),
+    (0x0590, "hebrew"), (0x0600, "arabic"), (0x0700, "other"), (0x0750, "arabic"), (0x0780, "other"),
+    (0x0900, "devanagari"), (0x0980, "bengali"), (0x0A00, "gurmukhi"), (0x0A80, "gujarati"), (0x0B00, "other"),
+    (0x0B80, "tamil"), (0x0C00, "telugu"), (0x0C80, "kannada"), (0x0D00, "malayalam"), (0x0D80, "other"),
+    (0x0E00, "thai"), (0x0E80, "other"), (0x1100, "hangul"), (0x1200, "other"), (0x1E00, "latin"),
+    (0x1F00, "greek"), (0x2000, "other"), (0x3040, "kana"), (0x3100, "other"), (0x3130, "hangul"),
+    (0x3190, "other"), (0x3400, "han"), (0x4DC0, "other"), (0x4E00, "han"), (0xA000, "other"),
+    (0xAC00, "hangul"), (0xD7B0, "other"), (0xFB50, "arabic"), (0xFE00, "other"), (0xFE70, "arabic"),
+    (0xFF00, "other"),
+]
+_SCRIPT_STARTS = [start for start, _ in _SCRIPT_RANGES]
+
+
+@lru_cache(maxsize=8192)
+def char_script(char):
+    return _SCRIPT_RANGES[bisect.bisect_right(_SCRIPT_STARTS, ord(char)) - 1][1]
+
+
+# Same character folding the langdetect profiles were counted with
+_CHAR_FOLDS = {"ș": "ş", "ț": "ţ", "ی": "ي"} # Romanian comma-below, Farsi yeh
+
+
+def normalize_text(text):
+    """Lowercased letters only, words separated by single spaces."""
+    chars = []
+    for char in unicodedata.normalize("NFC", text.lower()):
+        if not char.isalpha():
+            char = " "
+        elif "Ạ" <= char <= "ỿ":
+            char = "ể" # Vietnamese letters with stacked marks share one class in the profiles
+        elif "぀" <= char <= "ゟ":
+            char = "あ" # Hiragana
+        elif "゠" <= char <= "ヿ":
+            char = "ア" # Katakana
+        elif "가" <= char <= "힯":
+            char = "가" # Hangul syllables
+        chars.append(_CHAR_FOLDS.get(char, char))
+    return " ".join("".join(chars).split())
+
+
+def extract_ngrams(normalized):
+    """Character 1-3-grams of each word, padded with spaces at word edges."""
+    ngrams = []
+    for word in normalized.split(" "):
+        padded = f" {word} "
+        for n in NGRAM_ORDERS:
+            for i in range(len(padded) - n + 1):
+                gram = padded[i:i + n]
+                if gram != " " and not (n > 1 and gram.strip() == ""):
+                    ngrams.append(gram)
+    return ngrams
+
+
+class LanguageDetector:
+    """Detects the language of a short text in tens of microseconds; results are memoized."""
+
+    def __init__(self, profiles_path=LANGID_PROFILES, cache_size=LANGID_CACHE_SIZE, default="en",
+                 languages=tuple(LANGUAGE_LOCALES)):
+        self.default = default
+        self.allowed = set(languages)
+        self.languages = []
+        self.vocab = {}
+        self.matrix = None
+        self.by_script = {}
+        if os.path.exists(profiles_path):
+            self.load(profiles_path)
+        else:
+            print(f"Language profiles not found at {profiles_path}; language detection defaults to '{default}'.")
+        self.detect = lru_cache(maxsize=cache_size)(self._detect)
+
+    def load(self, profiles_path):
+        with np.load(profiles_path) as table:
+            self.languages = json.loads(bytes(table["languages"]).decode("utf-8"))
+            scripts = json.loads(bytes(table["scripts"]).decode("utf-8"))
+            vocab = bytes(table["vocab"]).decode("utf-8").split("\n")
+            self.matrix = table["matrix"]
+        self.vocab = {gram: i for i, gram in enumerate(vocab)}
+        self.by_script = {}
+        for index, script in enumerate(scripts):
+            if self.languages[index] in self.allowed:
+                self.by_script.setdefault(script, []).append(index)
+
+    def _script_rule(self, normalized, script):
+        """Letters that settle the language before any scoring (languages missing from the profiles)."""
+        if script == "cyrillic" and ("ђ" in normalized or "ћ" in normalized):
+            return "sr"
+        if script == "latin" and ("þ" in normalized or "ð" in normalized):
+            return "is"
+        return None
+
+    def _detect(self, text, expected=None):
+        """expected: the language the user most likely writes in (e.g. their preferred one); defaults to self.default."""
+        expected = expected or self.default
+        normalized = normalize_text(text or "")
+        letters = [char_script(char) for char in normalized if char != " "]
+        if not letters or self.matrix is None:
+            return self.default
+        counts = {}
+        for script in letters:
+            counts[script] = counts.get(script, 0) + 1
+        script = max(counts, key=counts.get)
+        if script == "han" and counts.get("kana"):
+            script = "kana" # Japanese mixes kanji with kana; Chinese never uses kana
+
+        rule = self._script_rule(normalized, script)
+        if rule:
+            return rule
+        candidates = self.by_script.get(script)
+        if not candidates:
+            return self.default
+        if len(candidates) == 1:
+            return self.languages[candidates[0]]
+
+        rows = [self.vocab[gram] for gram in extract_ngrams(normalized) if gram in self.vocab]
+        candidate_languages = [self.languages[index] for index in candidates]
+        if len(rows) < MIN_NGRAMS:
+            return expected if expected in candidate_languages else candidate_languages[0]
+        scores = self.matrix[np.ix_(rows, candidates)].sum(axis=0, dtype=np.int32)
+        if expected in candidate_languages:
+            scores[candidate_languages.index(expected)] += PRIOR_BONUS
+        return candidate_languages[int(np.argmax(scores))]
+
+    def detect_locale(self, text, preferred_locale=None):
+        """
+        UI locale for the text's language (e.g. 'hi-IN'). If the user's preferred locale is a
+        regional variant of the same language (es-MX for Spanish), that variant is kept.
+        """
+        expected = preferred_locale.lower().split("-")[0] if preferred_locale else None
+        if expected == "zh":
+            expected = preferred_locale.lower()
+        elif expected == "fil":
+            expected = "tl"
+        language = self.detect(text, expected)
+        if preferred_locale and preferred_locale.lower().split("-")[0] == language.split("-")[0]:
+            return preferred_locale
+        return LANGUAGE_LOCALES.get(language, preferred_locale or "en-US")
+
+
+def build_profiles(langdetect_profiles_dir, output_path=LANGID_PROFILES, top_n=TOP_NGRAMS_PER_LANGUAGE):
+    """Builds the quantized n-gram table from langdetect's JSON profiles (one file per language)."""
+    logprobs = {}
+    scripts = {}
+    vocab = set()
+    for language in sorted(os.listdir(langdetect_profiles_dir)):
+        with open(os.path.join(langdetect_profiles_dir, language), encoding="utf-8") as f:
+            profile = json.load(f)
+        freq = {}
+        for gram, count in profile["freq"].items():
+            lowered = gram.lower()
+            if len(lowered) == len(gram): # Skip the odd letter whose lowercase form is longer ('İ')
+                freq[lowered] = freq.get(lowered, 0) + count
+        totals = profile["n_words"]
+        logprobs[language] = {gram: math.log(count / totals[len(gram) - 1]) for gram, count in freq.items()}
+        vocab.update(sorted(freq, key=freq.get, reverse=True)[:top_n])
+        letters = {}
+        for gram, count in freq.items():
+            if len(gram) == 1 and gram.isalpha():
+                script = char_script(gram)
+                letters[script] = letters.get(script, 0) + count
+        scripts[language] = max(letters, key=letters.get)
+
+    languages = sorted(logprobs)
+    vocab = sorted(vocab)
+    matrix = np.zeros((len(vocab), len(languages)), dtype=np.uint8)
+    for column, language in enumerate(languages):
+        for row, gram in enumerate(vocab):
+            logprob = max(logprobs[language].get(gram, LOGPROB_FLOOR), LOGPROB_FLOOR)
+            matrix[row, column] = round((logprob - LOGPROB_FLOOR) / LOGPROB_STEP)
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    np.savez_compressed(
+        output_path,
+        languages=np.frombuffer(json.dumps(languages).encode("utf-8"), dtype=np.uint8),
+        scripts=np.frombuffer(json.dumps([scripts[language] for language in languages]).encode("utf-8"), dtype=np.uint8),
+        vocab=np.frombuffer("\n".join(vocab).encode("utf-8"), dtype=np.uint8),
+        matrix=matrix,
+    )
+    print(f"Wrote {len(languages)} languages x {len(vocab)} n-grams to {output_path}")
+
+
+# Shared detector used by app.google_detect_language
+language_detector = LanguageDetector()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "build":
+        sys.exit("Usage: python -m utils.language_detect build path/to/langdetect/profiles")
+    build_profiles(sys.argv[2])
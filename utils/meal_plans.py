@@ -0,0 +1,205 @@
+# meal_plans.py
+"""
+Multi-day meal plans. Each day is one Gemini call asking for a JSON list of meals; the days
+are requested concurrently on a shared pool (at most MEAL_PLAN_CONCURRENCY calls in flight per
+process), so a week takes about as long as one call. The assembled plan is stored in
+data/meals/meal_plans.db and later reads are served from there without calling Gemini.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from utils.gemini_api import gemini_client, extract_response_text, friendly_error_message, EMPTY_REPLY_MESSAGE
+from utils.message_store import compress_text, decompress_text
+
+MEAL_PLAN_DB = "data/meals/meal_plans.db"
+MEAL_PLAN_CONCURRENCY = int(os.environ.get("MEAL_PLAN_CONCURRENCY", 7)) # Gemini calls in flight for plans, per process
+MEAL_PLAN_MAX_DAYS = 7
+MEAL_PLAN_KEEP = int(os.environ.get("MEAL_PLAN_KEEP", 20)) # Plans kept per user; older ones are deleted
+MEAL_PLAN_NOTES_CHARS = 300 # Limit the user's free-text requests sent with every day
+MEALS = ["Breakfast", "Lunch", "Snack", "Dinner"]
+NUTRIENT_FIELDS = ["protein_g", "carbs_g", "fat_g", "fiber_g", "calories_kcal"] # Same names as data/nutrition
+# Days are generated independently, so each gets its own cuisine to keep the week varied
+DAY_CUISINES = ["Indian", "Mediterranean", "East Asian", "Mexican", "Middle Eastern", "Italian", "Continental"]
+
+MEAL_PLAN_PROMPT = """
+You are a helpful and knowledgeable AI Nutrition Assistant writing one day of a {days}-day meal plan for the user described in the message.
+
+Reply with JSON only, in this form:
+{{"meals": [{{"meal": "Breakfast", "name": "...", "description": "...", "protein_g": 0, "carbs_g": 0, "fat_g": 0, "fiber_g": 0, "calories_kcal": 0}}]}}
+
+- Include exactly one entry for each of: {meals}, in that order.
+- Tailor the meals to the user's profile (diet, goal, medical conditions) and never include items the user disliked.
+- Nutrient values are per serving, as plain numbers without units.
+- Write "name" and "description" in the language with the BCP-47 tag {language}; keep the JSON keys and "meal" values in English.
+"""
+
+
+def build_day_payload(day, days, context, language="en-US", notes=""):
+    """generateContent body for one day; the system instruction is the same for every day of a plan."""
+    message = f"{context}\n"
+    if notes:
+        message += f"Requests for this plan: {notes}\n"
+    message += f"Write day {day} of {days}, based on {DAY_CUISINES[(day - 1) % len(DAY_CUISINES)]} cuisine."
+    system_text = MEAL_PLAN_PROMPT.format(days=days, meals=", ".join(MEALS), language=language).strip()
+    return {
+        "systemInstruction": {"parts": [{"text": system_text}]},
+        "contents": [{"role": "user", "parts": [{"text": message}]}],
+        "generationConfig": {"responseMimeType": "application/json"},
+    }
+
+
+def _number(value):
+    """20, "20", "20g" or "20.5 kcal" -> float; None if there is no number."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    match = re.match(r"\s*(\d+(?:\.\d+)?)", str(value or ""))
+    return float(match.group(1)) if match else None
+
+
+def parse_day(text):
+    """The meals of a day from Gemini's JSON reply; raises ValueError if there are none."""
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip()) # Tolerate a fenced reply
+    data = json.loads(text)
+    items = data.get("meals") if isinstance(data, dict) else data
+    meals = []
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict) or not item.get("name"):
+            continue
+        meal = {"meal": str(item.get("meal") or ""), "name": str(item["name"]),
+                "description": str(item.get("description") or "")}
+        meal.update({field: _number(item.get(field)) for field in NUTRIENT_FIELDS})
+        meals.append(meal)
+    if not meals:
+        raise ValueError("The reply contains no meals")
+    return meals
+
+
+def day_totals(meals):
+    return {field: round(sum(meal[field] or 0 for meal in meals), 1) for field in NUTRIENT_FIELDS}
+
+
+class MealPlanStore:
+    """
+    Generated plans, one row each: the plan as zlib-compressed JSON plus the columns needed to
+    list a user's plans (indexed on user and creation time) without decoding any of them.
+    """
+
+    def __init__(self, db_path=MEAL_PLAN_DB, keep=MEAL_PLAN_KEEP):
+        self.db_path = db_path
+        self.keep = keep
+        self._local = threading.local()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS meal_plans ("
+                     "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, created_at TEXT NOT NULL, "
+                     "day_count INTEGER NOT NULL, status TEXT NOT NULL, body BLOB NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_meal_plans_user ON meal_plans(user_id, created_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def save(self, plan):
+        """Stores the plan and deletes the user's plans beyond the newest `keep`."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR REPLACE INTO meal_plans (id, user_id, created_at, day_count, status, body) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (plan["id"], plan["user_id"], plan["created_at"], len(plan["days"]), plan["status"],
+                          compress_text(json.dumps(plan, ensure_ascii=False))))
+            conn.execute("DELETE FROM meal_plans WHERE user_id = ? AND id NOT IN "
+                         "(SELECT id FROM meal_plans WHERE user_id = ? ORDER BY created_at DESC, rowid DESC LIMIT ?)",
+                         (plan["user_id"], plan["user_id"], self.keep))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, plan_id, user_id):
+        """The stored plan if it belongs to user_id, else None."""
+        row = self._connect().execute("SELECT body FROM meal_plans WHERE id = ? AND user_id = ?",
+                                      (plan_id, user_id)).fetchone()
+        return json.loads(decompress_text(row[0])) if row else None
+
+    def summaries(self, user_id):
+        """The user's plans, newest first, without their contents."""
+        rows = self._connect().execute(
+            "SELECT id, created_at, day_count, status FROM meal_plans WHERE user_id = ? ORDER BY created_at DESC, rowid DESC",
+            (user_id,)
+        ).fetchall()
+        return [{"id": plan_id, "created_at": created_at, "days": day_count, "status": status}
+                for plan_id, created_at, day_count, status in rows]
+
+
+class MealPlanner:
+    """Fans the days of a plan out to Gemini on a bounded thread pool and stores the result."""
+
+    def __init__(self, store, client=gemini_client, concurrency=MEAL_PLAN_CONCURRENCY):
+        self.store = store
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="meal-plan")
+
+    def _generate_day(self, payload):
+        """{'meals', 'totals'} for one day, or {'meals': [], 'error'} if the call or the reply failed."""
+        try:
+            text = extract_response_text(self.client.generate_content(payload))
+            if not text:
+                return {"meals": [], "error": EMPTY_REPLY_MESSAGE}
+            meals = parse_day(text)
+            return {"meals": meals, "totals": day_totals(meals)}
+        except ValueError as e: # Includes json.JSONDecodeError
+            print(f"Unreadable meal plan reply: {e}")
+            return {"meals": [], "error": EMPTY_REPLY_MESSAGE}
+        except Exception as e:
+            return {"meals": [], "error": friendly_error_message(e)}
+
+    def generate(self, user_id, context, days=MEAL_PLAN_MAX_DAYS, language="en-US", notes=""):
+        """
+        Generates a plan of `days` days for the user described by `context` (profile and
+        preferences, see app.format_user_context). The plan is stored unless every day failed;
+        its status is 'complete', 'partial' or 'failed'.
+        """
+        started = time.perf_counter()
+        notes = (notes or "").strip()[:MEAL_PLAN_NOTES_CHARS]
+        futures = [self._executor.submit(self._generate_day, build_day_payload(day, days, context, language, notes))
+                   for day in range(1, days + 1)]
+        plan_days = [{"day": day, **future.result()} for day, future in enumerate(futures, start=1)]
+        failed = sum(1 for day in plan_days if "error" in day)
+        plan = {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "language": language,
+            "notes": notes,
+            "status": "complete" if not failed else ("failed" if failed == days else "partial"),
+            "days": plan_days,
+            "generation_seconds": round(time.perf_counter() - started, 2),
+        }
+        if plan["status"] != "failed":
+            self.store.save(plan)
+        return plan
+
+    def get(self, plan_id, user_id):
+        return self.store.get(plan_id, user_id)
+
+    def summaries(self, user_id):
+        return self.store.summaries(user_id)
+
+
+# Shared planner used by the /api/meal_plans routes
+meal_planner = MealPlanner(MealPlanStore())
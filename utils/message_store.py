@@ -0,0 +1,157 @@
+# message_store.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+MESSAGE_STORE = os.environ.get("MESSAGE_STORE", "sqlite") # 'sqlite' (shared by workers) or 'memory'
+MESSAGE_STORE_DB = "data/cache/recent_messages.db"
+MESSAGE_STORE_TTL = int(os.environ.get("MESSAGE_STORE_TTL", 24 * 60 * 60)) # Seconds a reply stays rateable
+MESSAGE_STORE_MAX_ENTRIES = int(os.environ.get("MESSAGE_STORE_MAX_ENTRIES", 50000))
+
+
+def compress_text(text):
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def decompress_text(blob):
+    return zlib.decompress(blob).decode("utf-8")
+
+
+class MemoryMessageStore:
+    """
+    Per-process store of recent bot replies, bounded by entry count (oldest evicted first)
+    and TTL. Replies are kept zlib-compressed. Only suitable for a single worker.
+    """
+
+    def __init__(self, max_entries=MESSAGE_STORE_MAX_ENTRIES, ttl=MESSAGE_STORE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict() # message_id -> (expires_at, compressed content)
+        self._lock = threading.Lock()
+
+    def put(self, message_id, content):
+        with self._lock:
+            self._entries[message_id] = (time.time() + self.ttl, compress_text(content))
+            self._entries.move_to_end(message_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _take(self, message_id, remove):
+        with self._lock:
+            entry = self._entries.pop(message_id, None) if remove else self._entries.get(message_id)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return decompress_text(entry[1])
+
+    def get(self, message_id, default=None):
+        content = self._take(message_id, remove=False)
+        return default if content is None else content
+
+    def pop(self, message_id, default=None):
+        content = self._take(message_id, remove=True)
+        return default if content is None else content
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteMessageStore:
+    """
+    Recent bot replies in a SQLite file shared by all workers, so /feedback finds the reply
+    no matter which worker served /chat. Reply bodies are stored once per content hash
+    (cached answers are often identical) and zlib-compressed; messages expire after `ttl`
+    and the oldest are trimmed beyond `max_entries`.
+    """
+
+    def __init__(self, db_path=MESSAGE_STORE_DB, max_entries=MESSAGE_STORE_MAX_ENTRIES, ttl=MESSAGE_STORE_TTL,
+                 eviction_interval=200):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.eviction_interval = eviction_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts_since_eviction = 0
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS contents (hash TEXT PRIMARY KEY, body BLOB NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS messages ("
+                     "message_id TEXT PRIMARY KEY, content_hash TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_expires ON messages(expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_content ON messages(content_hash)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, message_id, content):
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR IGNORE INTO contents (hash, body) VALUES (?, ?)",
+                         (content_hash, compress_text(content)))
+            conn.execute("INSERT OR REPLACE INTO messages (message_id, content_hash, expires_at) VALUES (?, ?, ?)",
+                         (message_id, content_hash, time.time() + self.ttl))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        with self._lock:
+            self._puts_since_eviction += 1
+            run_eviction = self._puts_since_eviction >= self.eviction_interval
+            if run_eviction:
+                self._puts_since_eviction = 0
+        if run_eviction:
+            self.evict()
+
+    def get(self, message_id, default=None):
+        row = self._connect().execute(
+            "SELECT c.body FROM messages m JOIN contents c ON c.hash = m.content_hash "
+            "WHERE m.message_id = ? AND m.expires_at > ?", (message_id, time.time())
+        ).fetchone()
+        return decompress_text(row[0]) if row else default
+
+    def pop(self, message_id, default=None):
+        content = self.get(message_id)
+        self._connect().execute("DELETE FROM messages WHERE message_id = ?", (message_id,))
+        return default if content is None else content
+
+    def evict(self):
+        """Drops expired messages, trims to max_entries (oldest first) and removes orphaned bodies."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM messages WHERE expires_at <= ?", (time.time(),))
+            overflow = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute("DELETE FROM messages WHERE message_id IN "
+                             "(SELECT message_id FROM messages ORDER BY expires_at LIMIT ?)", (overflow,))
+            conn.execute("DELETE FROM contents WHERE hash NOT IN (SELECT content_hash FROM messages)")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM messages WHERE expires_at > ?",
+                                       (time.time(),)).fetchone()[0]
+
+
+def create_message_store(store=MESSAGE_STORE):
+    """Builds the configured store for replies awaiting feedback."""
+    if store == "memory":
+        return MemoryMessageStore()
+    return SQLiteMessageStore()
@@ -0,0 +1,274 @@
+# metrics.py
+"""
+Lightweight request instrumentation: counters and histograms kept in process memory (a dict
+update under a lock per observation), per-stage timers that also feed the Server-Timing
+response header, and Prometheus text rendering for /metrics.
+
+Each process flushes its cumulative values to a SQLite file every METRICS_FLUSH_INTERVAL
+seconds (one row per series and process), and /metrics sums the rows of all processes, so a
+scrape of any gunicorn worker reports the whole instance.
+"""
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+METRICS_STORE = os.environ.get("METRICS_STORE", "sqlite") # 'sqlite' (aggregated across workers) or 'memory'
+METRICS_DB = "data/cache/metrics.db"
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5)) # Seconds
+METRICS_RETENTION = 24 * 60 * 60 # Rows of processes that stopped flushing are dropped after this long
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0) # Seconds
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+CHARS_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+TOKENS_BUCKETS = (0, 50, 100, 250, 500, 750, 1000, 1500, 2000, 4000)
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    """{'route': '/chat'} -> 'route="/chat"' (sorted, escaped as the text format requires)."""
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in sorted(labels.items()))
+
+
+def _le(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def _sample_order(sample):
+    """Sorts a family's samples by series, with histogram buckets in ascending `le` order."""
+    name, labels, _ = sample
+    series, _, le = labels.partition('le="')
+    return (name, series, float(le.rstrip('"')) if le else 0.0)
+
+
+class MetricsRegistry:
+    """Metric families are declared once (name, type, help, buckets); series are created on first use."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.families = {} # name -> (type, help, buckets)
+        self._counters = {} # (name, label string) -> value
+        self._histograms = {} # (name, label string) -> [bucket counts..., sum, count]
+        self._collectors = [] # Callables returning [(counter name, labels dict, value)], read at flush time
+
+    def counter(self, name, help_text):
+        self.families[name] = (COUNTER, help_text, None)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.families[name] = (HISTOGRAM, help_text, tuple(buckets) + (float("inf"),))
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, format_labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = self.families[name][2]
+        key = (name, format_labels(labels))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        """This process's cumulative samples as (sample name, label string, value)."""
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, list(series)) for key, series in self._histograms.items()]
+        rows = [(name, labels, value) for (name, labels), value in counters]
+        for collector in self._collectors:
+            try:
+                rows += [(name, format_labels(labels), value) for name, labels, value in collector()]
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        for (name, labels), series in histograms:
+            cumulative = 0
+            for bound, count in zip(self.families[name][2], series):
+                cumulative += count
+                bucket_labels = f'{labels},le="{_le(bound)}"' if labels else f'le="{_le(bound)}"'
+                rows.append((f"{name}_bucket", bucket_labels, cumulative))
+            rows.append((f"{name}_sum", labels, series[-2]))
+            rows.append((f"{name}_count", labels, series[-1]))
+        return rows
+
+    def _family(self, sample_name):
+        if sample_name in self.families:
+            return sample_name
+        for suffix in ("_bucket", "_sum", "_count"):
+            if sample_name.endswith(suffix) and sample_name[:-len(suffix)] in self.families:
+                return sample_name[:-len(suffix)]
+        return sample_name
+
+    def render(self, rows):
+        """Prometheus text exposition (version 0.0.4) of (sample name, label string, value) rows."""
+        by_family = {}
+        for name, labels, value in rows:
+            by_family.setdefault(self._family(name), []).append((name, labels, value))
+        lines = []
+        for family in sorted(by_family):
+            metric_type, help_text, _ = self.families.get(family, ("untyped", "", None))
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {metric_type}")
+            for name, labels, value in sorted(by_family[family], key=_sample_order):
+                value = int(value) if float(value).is_integer() else value
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class SharedMetricsStore:
+    """Latest cumulative samples of every process, in a SQLite file shared by all workers."""
+
+    def __init__(self, db_path=METRICS_DB):
+        self.db_path = db_path
+        self.process_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}" # Survives pid reuse
+        self._local = threading.local()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS samples (process TEXT NOT NULL, name TEXT NOT NULL, labels TEXT NOT NULL, "
+            "value REAL NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (process, name, labels))"
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def write(self, rows):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO samples (process, name, labels, value, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(self.process_id, name, labels, value, now) for name, labels, value in rows]
+            )
+            conn.execute("DELETE FROM samples WHERE updated_at < ?", (now - METRICS_RETENTION,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def aggregate(self):
+        return self._connect().execute(
+            "SELECT name, labels, SUM(value) FROM samples GROUP BY name, labels ORDER BY name, labels"
+        ).fetchall()
+
+
+class Metrics:
+    """The registry plus (optionally) the shared store it is flushed to."""
+
+    def __init__(self, store=METRICS_STORE):
+        self.registry = MetricsRegistry()
+        self.shared = SharedMetricsStore() if store == "sqlite" else None
+        self._flusher = None
+
+    def flush(self):
+        if self.shared is not None:
+            self.shared.write(self.registry.samples())
+
+    def start_flusher(self, interval=METRICS_FLUSH_INTERVAL):
+        """Starts a daemon thread that flushes this process's samples every `interval` seconds."""
+        if self.shared is None or self._flusher is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Metrics flush failed: {e}")
+
+        self._flusher = threading.Thread(target=run, name="metrics-flusher", daemon=True)
+        self._flusher.start()
+
+    def render(self):
+        """Prometheus text for the whole instance (all workers), or this process alone with METRICS_STORE=memory."""
+        if self.shared is None:
+            return self.registry.render(self.registry.samples())
+        self.flush() # Include this process's latest values
+        return self.registry.render(self.shared.aggregate())
+
+
+metrics = Metrics()
+registry = metrics.registry
+
+registry.counter("app_requests_total", "HTTP requests by route, method and status code.")
+registry.histogram("app_request_seconds", "Time to produce the response headers, by route.")
+registry.histogram("app_response_bytes", "Response body size (non-streaming responses).", BYTES_BUCKETS)
+registry.histogram("app_stage_seconds", "Time spent in each stage of request handling.")
+registry.counter("gemini_responses_total", "Gemini HTTP attempts by outcome (status code, timeout, connection_error).")
+registry.histogram("gemini_request_seconds", "Latency of each Gemini HTTP attempt, retries included separately.")
+registry.histogram("gemini_request_bytes", "Gemini request payload size.", BYTES_BUCKETS)
+registry.histogram("gemini_response_bytes", "Gemini response body size (non-streaming calls).", BYTES_BUCKETS)
+registry.histogram("gemini_prompt_chars", "Characters of prompt text sent to Gemini.", CHARS_BUCKETS)
+registry.histogram("conversation_history_tokens", "Estimated tokens of earlier turns sent with a chat message.", TOKENS_BUCKETS)
+registry.counter("response_cache_lookups_total", "Gemini response cache lookups by result.")
+registry.counter("translation_strings_total", "Strings passed to the translator, by where the translation came from.")
+registry.counter("password_operations_total", "bcrypt checks, hashes and upgrades, and calls rejected or timed out.")
+registry.counter("emails_total", "Outbox emails by outcome.")
+
+
+# --- Per-request stage timing (Server-Timing) ---
+
+_stage_timings = contextvars.ContextVar("stage_timings", default=None)
+
+
+def start_request_timing():
+    """Starts collecting stage durations for the current request (thread or asyncio task)."""
+    _stage_timings.set([])
+
+
+@contextmanager
+def stage(name):
+    """Times a block: observed in app_stage_seconds and listed in the request's Server-Timing header."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe("app_stage_seconds", elapsed, stage=name)
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def server_timing_header(total=None):
+    """'route;dur=0.1, gemini;dur=812.4, total;dur=815.0' (milliseconds; repeated stages are summed)."""
+    durations = {}
+    for name, elapsed in _stage_timings.get() or ():
+        durations[name] = durations.get(name, 0.0) + elapsed
+    if total is not None:
+        durations["total"] = total
+    return ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in durations.items())
+
+
+def record_request(route, method, status, elapsed, body_bytes=None):
+    registry.inc("app_requests_total", route=route, method=method, status=status)
+    registry.observe("app_request_seconds", elapsed, route=route)
+    if body_bytes is not None:
+        registry.observe("app_response_bytes", body_bytes, route=route)
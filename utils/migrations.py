@@ -0,0 +1,158 @@
+# migrations.py
+"""
+Schema migrations for the on-disk data, run explicitly once per deploy instead of on every
+process start (the Procfile runs it before gunicorn starts the workers):
+    python -m utils.migrations            # apply whatever is pending
+    python -m utils.migrations --status   # show the recorded and expected versions
+
+Applied versions are recorded in data/schema.db. Each migration is idempotent, and
+concurrent runs are serialized by a write lock on that database, so running the command
+twice (or from two deploy hosts) is harmless.
+"""
+import os
+import re
+import sqlite3
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.user_repository import USER_CSV, USER_DB, EXPECTED_COLUMNS
+
+SCHEMA_DB = "data/schema.db" # Kept apart from the data files so its lock doesn't block the migrations themselves
+FEEDBACK_DIR = "data/feedback"
+LEGACY_FEEDBACK_CSV = os.path.join(FEEDBACK_DIR, "user_feedback.csv")
+
+
+def migrate_users_csv_columns(csv_path=USER_CSV):
+    """Creates users.csv if missing, or rewrites it with EXPECTED_COLUMNS (keeping existing data) if its header differs."""
+    import pandas as pd # Only the migration needs pandas
+
+    if not os.path.exists(csv_path):
+        pd.DataFrame(columns=EXPECTED_COLUMNS).to_csv(csv_path, index=False)
+        return f"created {csv_path}"
+    df = pd.read_csv(csv_path)
+    if list(df.columns) == EXPECTED_COLUMNS:
+        return "columns already up to date"
+    new_df = pd.DataFrame(columns=EXPECTED_COLUMNS)
+    for col in EXPECTED_COLUMNS:
+        new_df[col] = df[col] if col in df.columns else None
+    tmp_path = f"{csv_path}.{os.getpid()}.tmp"
+    new_df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, csv_path)
+    return f"rewrote {csv_path} with {len(EXPECTED_COLUMNS)} columns"
+
+
+def import_users_into_sqlite(csv_path=USER_CSV, db_path=USER_DB):
+    """Seeds an empty users.db from the legacy users.csv."""
+    from utils.user_repository import SQLiteUserRepository
+
+    repo = SQLiteUserRepository(db_path)
+    if repo.count() > 0:
+        return "users table already populated"
+    if not os.path.exists(csv_path):
+        return f"{csv_path} not found; nothing to import"
+    return f"imported {repo.import_csv(csv_path)} users from {csv_path}"
+
+
+def split_legacy_feedback(legacy_csv_path=LEGACY_FEEDBACK_CSV, feedback_dir=FEEDBACK_DIR):
+    """Splits the old shared user_feedback.csv into per-user logs and summaries."""
+    from utils.feedback_manager import FeedbackManager
+
+    migrated = FeedbackManager(feedback_dir).migrate_legacy_feedback(legacy_csv_path)
+    return f"moved {migrated} feedback rows into per-user files"
+
+
+def backfill_intake_records(feedback_dir=FEEDBACK_DIR):
+    """Extracts nutrition records from the liked replies already in the per-user feedback logs."""
+    from utils.feedback_manager import FeedbackManager
+    from utils.intake_store import intake_store
+
+    pattern = re.compile(r"^user_(?P<key>.+)_feedback\.csv$")
+    user_ids = [match.group("key") for match in map(pattern.match, sorted(os.listdir(feedback_dir))) if match]
+    users, records = intake_store.backfill_from_feedback(FeedbackManager(feedback_dir), user_ids)
+    return f"extracted {records} nutrition records for {users} users"
+
+
+# (version, name, function); append new migrations at the end, never renumber
+MIGRATIONS = [
+    (1, "users_csv_columns", migrate_users_csv_columns),
+    (2, "users_csv_to_sqlite", import_users_into_sqlite),
+    (3, "feedback_per_user_files", split_legacy_feedback),
+    (4, "intake_from_feedback", backfill_intake_records),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _connect(db_path):
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30.0, isolation_level=None)
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_migrations ("
+                 "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at REAL NOT NULL)")
+    return conn
+
+
+def current_version(db_path=SCHEMA_DB):
+    """Highest applied migration, or 0. Opens the database read-only, so it's cheap to call at startup."""
+    if not os.path.exists(db_path):
+        return 0
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=5.0)
+        try:
+            return conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()[0] or 0
+        finally:
+            conn.close()
+    except sqlite3.OperationalError: # No schema_migrations table yet
+        return 0
+
+
+def pending_migrations(db_path=SCHEMA_DB):
+    version = current_version(db_path)
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+def migrate(db_path=SCHEMA_DB):
+    """Applies every pending migration in order; returns the list of (version, name, result) applied."""
+    conn = _connect(db_path)
+    applied = []
+    try:
+        conn.execute("BEGIN IMMEDIATE") # Holds off a concurrent migrate until this one has finished
+        try:
+            done = {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+            for version, name, function in MIGRATIONS:
+                if version in done:
+                    continue
+                result = function()
+                conn.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                             (version, name, time.time()))
+                applied.append((version, name, result))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return applied
+
+
+def warn_if_pending(db_path=SCHEMA_DB):
+    """Startup check used by app.py: prints a warning instead of migrating inside every worker."""
+    version = current_version(db_path)
+    if version < SCHEMA_VERSION:
+        print(f"⚠️ Data schema is at version {version}, this code expects {SCHEMA_VERSION}. "
+              f"Run: python -m utils.migrations")
+    return version
+
+
+if __name__ == "__main__":
+    if "--status" in sys.argv[1:]:
+        version = current_version()
+        print(f"Schema version {version} (latest {SCHEMA_VERSION})")
+        for number, name, _ in MIGRATIONS:
+            print(f"  {number:>3} {name:<24} {'applied' if number <= version else 'pending'}")
+    else:
+        applied = migrate()
+        for number, name, result in applied:
+            print(f"Applied {number} {name}: {result}")
+        print(f"Schema is at version {SCHEMA_VERSION}" + ("" if applied else " (nothing to do)"))
@@ -0,0 +1,154 @@
+# nutrition_facts.py
+import csv
+import os
+import re
+
+NUTRITION_TABLE = os.environ.get("NUTRITION_TABLE", "data/nutrition/foods.csv")
+
+# "nutritional info for apple", "calories in a banana" (one serving; "2 bananas" goes to Gemini), "how much protein does paneer have", "apple nutrition", "apple"
+_QUERY_PATTERNS = [re.compile(pattern) for pattern in (
+    r"^(?:what(?:'s| is| are)\s+)?(?:the\s+)?(?:nutrition(?:al)?|nutrient)s?\s*(?:info(?:rmation)?|facts?|values?|"
+    r"breakdown|content|profile|details)?\s+(?:in|of|for|on|about)\s+(?P<food>.+)$",
+    r"^(?:what(?:'s| is| are)\s+)?(?:the\s+)?(?:calories|calorie count|macros|macronutrients)\s+(?:in|of|for)\s+(?P<food>.+)$",
+    r"^how (?:many|much) (?:calories|protein|carbs|carbohydrates|fat|fats|fiber|fibre)\s+(?:are |is )?"
+    r"(?:in|does|do)\s+(?P<food>.+?)(?:\s+(?:have|has|contain))?$",
+    r"^(?P<food>.+?)\s+(?:nutrition(?:al)?(?:\s+(?:info(?:rmation)?|facts?|values?))?|calories|macros|nutrients)$",
+    r"^(?P<food>.+)$",
+)]
+_LEADING_QUANTITY = re.compile(r"^(?:(?:a|an|the|one|1|some|per|100 ?g(?:rams?)?|a cup of|a bowl of|a slice of|one cup of)\s+)+")
+_MULTI_ITEM = re.compile(r",|\band\b|\bwith\b|&|\+")
+_NON_WORD = re.compile(r"[^\w\s'-]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_food_text(text):
+    text = _NON_WORD.sub(" ", text.lower())
+    return _SPACES.sub(" ", text).strip()
+
+
+def plural_forms(name):
+    """Common English plural spellings of the last word of a food name."""
+    head, _, last = name.rpartition(" ")
+    prefix = head + " " if head else ""
+    forms = {prefix + last + "s"}
+    if last.endswith(("s", "x", "ch", "sh", "o")):
+        forms.add(prefix + last + "es")
+    if last.endswith("y") and last[-2:-1] not in "aeiou":
+        forms.add(prefix + last[:-1] + "ies")
+    return forms
+
+
+def singular_forms(name):
+    """Candidate singular spellings for a possibly-plural food name."""
+    head, _, last = name.rpartition(" ")
+    prefix = head + " " if head else ""
+    forms = []
+    if last.endswith("ies"):
+        forms.append(prefix + last[:-3] + "y")
+    if last.endswith("es"):
+        forms.append(prefix + last[:-2])
+    if last.endswith("s") and not last.endswith("ss"):
+        forms.append(prefix + last[:-1])
+    return forms
+
+
+class NutritionFacts:
+    """
+    Local nutrient table for single-food questions ("nutritional info for apple"), so they're
+    answered in a few milliseconds instead of a Gemini round trip. Every name, synonym and
+    their plural forms point at the same row in one dict, so a lookup is a single hash probe.
+    """
+
+    def __init__(self, table_path=NUTRITION_TABLE):
+        self.table_path = table_path
+        self.foods = []
+        self.index = {}
+        self._mention_pattern = None
+        if os.path.exists(table_path):
+            self.load(table_path)
+        else:
+            print(f"Nutrition table not found at {table_path}; local nutrition answers are disabled.")
+
+    def load(self, table_path):
+        with open(table_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                food = {
+                    "name": row["name"].strip(),
+                    "serving": row["serving"].strip(),
+                    "protein_g": float(row["protein_g"]),
+                    "carbs_g": float(row["carbs_g"]),
+                    "fat_g": float(row["fat_g"]),
+                    "fiber_g": float(row["fiber_g"]),
+                    "calories_kcal": float(row["calories_kcal"]),
+                }
+                self.foods.append(food)
+                names = [food["name"]] + [s for s in row.get("synonyms", "").split("|") if s.strip()]
+                for name in names:
+                    name = normalize_food_text(name)
+                    # Explicit names win over generated plurals of other foods
+                    self.index[name] = food
+                    for plural in plural_forms(name):
+                        self.index.setdefault(plural, food)
+
+    def find_foods(self, text):
+        """Canonical names of every table food mentioned anywhere in text, in order of first mention."""
+        if not self.index or not text:
+            return []
+        if self._mention_pattern is None:
+            names = sorted(self.index, key=len, reverse=True) # Longest first: 'greek yogurt' before 'yogurt'
+            self._mention_pattern = re.compile(r"(?<!\w)(?:" + "|".join(map(re.escape, names)) + r")(?!\w)")
+        found = {}
+        for match in self._mention_pattern.finditer(normalize_food_text(text)):
+            found.setdefault(self.index[match.group(0)]["name"], None)
+        return list(found)
+
+    def lookup(self, name):
+        """Returns the table row for a food name (synonyms and plurals included), or None."""
+        name = normalize_food_text(name)
+        food = self.index.get(name)
+        if food is None:
+            for singular in singular_forms(name):
+                food = self.index.get(singular)
+                if food is not None:
+                    break
+        return food
+
+    def match_query(self, text):
+        """Returns the row if text asks about exactly one food in the table, else None."""
+        if not self.index or not text:
+            return None
+        text = normalize_food_text(text)
+        for pattern in _QUERY_PATTERNS:
+            match = pattern.match(text)
+            if not match:
+                continue
+            food_name = _LEADING_QUANTITY.sub("", match.group("food")).strip()
+            if not food_name or _MULTI_ITEM.search(food_name):
+                return None # "apple and banana" etc. need a real answer
+            food = self.lookup(food_name)
+            if food is not None:
+                return food
+        return None
+
+    @staticmethod
+    def format_answer(food):
+        """Same Nutritional Info layout the Gemini prompt asks for."""
+        return (
+            f"{food['name'].title()}, {food['serving']}\n"
+            f"Nutritional Info:\n"
+            f"Protein: {food['protein_g']:g}g\n"
+            f"Carbohydrates: {food['carbs_g']:g}g\n"
+            f"Fats: {food['fat_g']:g}g\n"
+            f"Fiber: {food['fiber_g']:g}g\n"
+            f"Calories: {food['calories_kcal']:g} kcal\n\n"
+            f"Values are typical averages per serving; actual amounts vary with size, variety and preparation."
+        )
+
+    def answer(self, text):
+        """The formatted local answer for a single-food query, or None to fall through to Gemini."""
+        food = self.match_query(text)
+        return self.format_answer(food) if food else None
+
+
+# Shared table used by /chat
+nutrition_facts = NutritionFacts()
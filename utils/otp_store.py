@@ -0,0 +1,136 @@
+# otp_store.py
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+OTP_STORE = os.environ.get("OTP_STORE", "sqlite") # 'sqlite' (shared by workers) or 'memory'
+OTP_DB = "data/otp.db"
+OTP_SWEEP_INTERVAL = int(os.environ.get("OTP_SWEEP_INTERVAL", 60)) # Seconds between expiry sweeps
+
+
+def _to_record(otp, expires_at, reset_token):
+    """Shape used by the auth routes: {otp, expiry (datetime), reset_token}."""
+    return {'otp': otp, 'expiry': datetime.fromtimestamp(expires_at), 'reset_token': reset_token}
+
+
+class MemoryOTPStore:
+    """
+    Per-process OTP / reset-token store. Expiry times sit in a min-heap, so each sweep pops
+    only the entries that are actually due (O(log n) each) instead of scanning everything.
+    Only suitable for a single worker.
+    """
+
+    def __init__(self):
+        self._entries = {} # email -> (expires_at, otp, reset_token)
+        self._heap = [] # (expires_at, email); stale items are skipped when popped
+        self._lock = threading.Lock()
+
+    def put(self, email, otp, ttl, reset_token=None):
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._entries[email] = (expires_at, otp, reset_token)
+            heapq.heappush(self._heap, (expires_at, email))
+
+    def get(self, email):
+        """Returns the live entry for email, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(email)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return _to_record(entry[1], entry[0], entry[2])
+
+    def pop(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def sweep(self):
+        """Removes expired entries; returns how many were dropped."""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expires_at, email = heapq.heappop(self._heap)
+                entry = self._entries.get(email)
+                if entry is not None and entry[0] == expires_at: # Not replaced by a newer OTP
+                    del self._entries[email]
+                    removed += 1
+        return removed
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteOTPStore:
+    """
+    OTP / reset-token store in a SQLite file shared by all workers, so send_otp and
+    verify_otp can land on different processes. The expires_at index makes each sweep an
+    index range delete of just the due rows.
+    """
+
+    def __init__(self, db_path=OTP_DB):
+        self.db_path = db_path
+        self._local = threading.local()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS otps ("
+                     "email TEXT PRIMARY KEY, otp TEXT, reset_token TEXT, expires_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_otps_expires ON otps(expires_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, email, otp, ttl, reset_token=None):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO otps (email, otp, reset_token, expires_at) VALUES (?, ?, ?, ?)",
+            (email, otp, reset_token, time.time() + ttl)
+        )
+
+    def get(self, email):
+        """Returns the live entry for email, or None if missing or expired."""
+        row = self._connect().execute(
+            "SELECT otp, expires_at, reset_token FROM otps WHERE email = ? AND expires_at > ?",
+            (email, time.time())
+        ).fetchone()
+        return _to_record(*row) if row else None
+
+    def pop(self, email):
+        self._connect().execute("DELETE FROM otps WHERE email = ?", (email,))
+
+    def sweep(self):
+        """Removes expired entries; returns how many were dropped."""
+        return self._connect().execute("DELETE FROM otps WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM otps").fetchone()[0]
+
+
+def start_otp_sweeper(store, interval=OTP_SWEEP_INTERVAL):
+    """Starts a daemon thread that drops expired OTPs every `interval` seconds."""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                store.sweep()
+            except Exception as e:
+                print(f"OTP sweep failed: {e}")
+
+    thread = threading.Thread(target=run, name="otp-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+
+def create_otp_store(store=OTP_STORE):
+    """Builds the configured OTP store."""
+    if store == "memory":
+        return MemoryOTPStore()
+    return SQLiteOTPStore()
@@ -0,0 +1,174 @@
+# password_hasher.py
+"""
+bcrypt hashing and verification off the request threads.
+Each check or hash costs a few hundred milliseconds of CPU, so they run in a small process
+pool sized separately from the web workers. Admission is bounded: once BCRYPT_MAX_PENDING
+operations are queued or running, new ones are refused straight away (the auth routes answer
+"try again in a moment") instead of piling up behind each other and taking /chat down with them.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.bcrypt_worker import hash_job, check_job
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12)) # Cost for new hashes; older, cheaper hashes are upgraded on login
+BCRYPT_WORKERS = int(os.environ.get("BCRYPT_WORKERS", 2)) # Hashing processes per app process; 0 hashes on the calling thread
+BCRYPT_MAX_PENDING = int(os.environ.get("BCRYPT_MAX_PENDING", 16)) # Queued + running operations before new ones are refused
+BCRYPT_TIMEOUT = float(os.environ.get("BCRYPT_TIMEOUT", 10)) # Seconds a request waits for its result
+METRICS_WINDOW = 60 # Seconds of completed operations used for the throughput and delay figures
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool is full or too slow; the caller should ask the user to retry."""
+
+
+def hash_rounds(hashed):
+    """Cost factor of a bcrypt hash ('$2b$12$...' -> 12), or None if it isn't one."""
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    hash()/check() block the calling request until the pool answers (or raise HasherBusy);
+    check_and_upgrade() additionally re-hashes a correct password whose stored cost is below
+    `rounds`, in the background, and hands the new hash to a callback.
+    """
+
+    def __init__(self, workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING, rounds=BCRYPT_ROUNDS,
+                 timeout=BCRYPT_TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.counters = {"hashes": 0, "checks": 0, "rejected": 0, "timeouts": 0, "upgrades": 0}
+        self._recent = deque() # (finished_at, queue_wait, run_time) of recent operations
+
+    def _get_executor(self):
+        # One pool per process: a pool inherited across a fork (gunicorn --preload) has no live workers
+        if self._executor is None or self._executor_pid != os.getpid():
+            # forkserver: by the time the pool starts this process runs sender, sweeper and flusher
+            # threads, and forking it could leave a worker stuck on a lock one of them held. The
+            # workers are forked from a clean server process that has only utils.bcrypt_worker loaded.
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["utils.bcrypt_worker"])
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=context)
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _admit(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.counters["rejected"] += 1
+                raise HasherBusy(f"{self.pending} password operations already pending")
+            self.pending += 1
+
+    def _record(self, counter, submitted, started, finished):
+        with self._lock:
+            self.pending -= 1
+            self.counters[counter] += 1
+            self._recent.append((finished, max(0.0, started - submitted), finished - started))
+            while self._recent and self._recent[0][0] < finished - METRICS_WINDOW:
+                self._recent.popleft()
+
+    def _submit(self, counter, job, *args):
+        """Admits and runs one job: returns (value, None) when hashing inline, else (None, future)."""
+        self._admit()
+        submitted = time.time()
+        if self.workers <= 0:
+            try:
+                value, started = job(*args)
+            except Exception:
+                with self._lock:
+                    self.pending -= 1
+                raise
+            self._record(counter, submitted, started, time.time())
+            return value, None
+        with self._lock:
+            try:
+                try:
+                    future = self._get_executor().submit(job, *args)
+                except BrokenProcessPool:
+                    self._executor = None # A worker died (OOM kill...); start a fresh pool
+                    future = self._get_executor().submit(job, *args)
+            except Exception:
+                self.pending -= 1
+                raise
+
+        def done(f):
+            if f.exception() is None:
+                self._record(counter, submitted, f.result()[1], time.time())
+            else:
+                with self._lock:
+                    self.pending -= 1
+        future.add_done_callback(done)
+        return None, future
+
+    def _run(self, counter, job, *args):
+        value, future = self._submit(counter, job, *args)
+        if future is None:
+            return value
+        try:
+            return future.result(timeout=self.timeout)[0]
+        except FutureTimeout:
+            with self._lock:
+                self.counters["timeouts"] += 1
+            raise HasherBusy("password operation timed out")
+
+    def hash(self, password, rounds=None):
+        return self._run("hashes", hash_job, password, rounds or self.rounds)
+
+    def check(self, password, hashed):
+        if not hashed or not password:
+            return False
+        return self._run("checks", check_job, password, hashed)
+
+    def check_and_upgrade(self, password, hashed, on_upgrade):
+        """
+        Verifies password against hashed. If it matches and the hash's cost is below the
+        configured rounds, a re-hash is queued (skipped while the pool is busy) and
+        on_upgrade(new_hash) is called with the result.
+        """
+        if not self.check(password, hashed):
+            return False
+        current = hash_rounds(hashed)
+        if current is not None and current < self.rounds:
+            try:
+                value, future = self._submit("upgrades", hash_job, password, self.rounds)
+            except HasherBusy:
+                return True # Upgrading can wait for a quieter login
+            if future is None:
+                on_upgrade(value)
+            else:
+                future.add_done_callback(lambda f: f.exception() is None and on_upgrade(f.result()[0]))
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            recent = list(self._recent)
+            stats["pending"] = self.pending
+        stats.update({"workers": self.workers, "max_pending": self.max_pending, "rounds": self.rounds})
+        waits = sorted(wait for _, wait, _ in recent)
+        runs = [run for _, _, run in recent]
+        stats["ops_per_second"] = round(len(recent) / METRICS_WINDOW, 2)
+        if waits:
+            stats["queue_wait_ms_p50"] = round(waits[len(waits) // 2] * 1000, 1)
+            stats["queue_wait_ms_p95"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1)
+            stats["run_ms_avg"] = round(sum(runs) / len(runs) * 1000, 1)
+        return stats
+
+
+# Shared hasher used by the auth routes
+password_hasher = PasswordHasher()
@@ -0,0 +1,176 @@
+# response_cache.py
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE_DB = "data/cache/gemini_responses.db"
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 24 * 60 * 60)) # Seconds
+RESPONSE_CACHE_MEMORY_SIZE = int(os.environ.get("RESPONSE_CACHE_MEMORY_SIZE", 512)) # Entries per process
+RESPONSE_CACHE_DISK_SIZE = int(os.environ.get("RESPONSE_CACHE_DISK_SIZE", 20000)) # Entries shared by all workers
+
+# Profile fields that go into the Gemini prompt and therefore change the answer
+PROFILE_PROMPT_FIELDS = ["age", "gender", "diet", "goal", "height_cm", "weight_kg", "bmi", "medical_conditions"]
+
+
+def normalize_query(text):
+    """Lowercases, collapses whitespace and drops trailing punctuation so trivial variants share a key."""
+    text = re.sub(r"\s+", " ", (text or "").strip().lower())
+    return text.rstrip(" .!?")
+
+
+def profile_fingerprint(profile, preferences=None):
+    """Stable hash of the profile fields (and liked/disliked meals and foods) that are sent to Gemini."""
+    profile = profile or {}
+    preferences = preferences or {}
+    material = {
+        "profile": {field: profile.get(field) for field in PROFILE_PROMPT_FIELDS},
+        "liked": preferences.get("liked_items", []),
+        "disliked": preferences.get("disliked_items", []),
+        "liked_foods": preferences.get("liked_foods", []),
+        "disliked_foods": preferences.get("disliked_foods", []),
+    }
+    encoded = json.dumps(material, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(user_text, profile=None, preferences=None, target_language="en-US", image_hash=None):
+    parts = [normalize_query(user_text), profile_fingerprint(profile, preferences),
+             target_language or "", image_hash or ""]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for Gemini responses:
+      1. an in-process LRU (OrderedDict) for millisecond hits within a worker, and
+      2. a SQLite table shared by all workers, bounded by TTL and entry count.
+    Both tiers honour the same TTL. Counters are available from stats().
+    """
+
+    def __init__(self, db_path=RESPONSE_CACHE_DB, ttl=RESPONSE_CACHE_TTL,
+                 memory_size=RESPONSE_CACHE_MEMORY_SIZE, disk_size=RESPONSE_CACHE_DISK_SIZE):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self._memory = OrderedDict() # key -> (expires_at, response)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes_since_eviction = 0
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0}
+        if db_path:
+            db_dir = os.path.dirname(db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            self._connect().execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._connect().execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _remember(self, key, expires_at, response):
+        with self._lock:
+            self._memory[key] = (expires_at, response)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Returns the cached response for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        if self.db_path:
+            try:
+                conn = self._connect()
+                row = conn.execute("SELECT response, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] > now:
+                    conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._remember(key, row[1], row[0])
+                    self._count("disk_hits")
+                    return row[0]
+            except sqlite3.Error as e:
+                print(f"Response cache read failed: {e}")
+
+        self._count("misses")
+        return None
+
+    def set(self, key, response):
+        now = time.time()
+        expires_at = now + self.ttl
+        self._remember(key, expires_at, response)
+        self._count("sets")
+        if not self.db_path:
+            return
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, response, expires_at, now)
+            )
+            with self._lock:
+                self._writes_since_eviction += 1
+                run_eviction = self._writes_since_eviction >= 100
+                if run_eviction:
+                    self._writes_since_eviction = 0
+            if run_eviction:
+                self.evict()
+        except sqlite3.Error as e:
+            print(f"Response cache write failed: {e}")
+
+    def evict(self):
+        """Drops expired rows, then the least recently used rows beyond disk_size."""
+        conn = self._connect()
+        removed = conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),)).rowcount
+        overflow = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.disk_size
+        if overflow > 0:
+            removed += conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                (overflow,)
+            ).rowcount
+        with self._lock:
+            self.counters["evictions"] += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.db_path:
+            self._connect().execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+# Shared cache used by ask_gemini
+response_cache = ResponseCache()
@@ -0,0 +1,203 @@
+# single_flight.py
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+SINGLE_FLIGHT_DB = "data/cache/single_flight.db"
+SINGLE_FLIGHT_LEASE_TIMEOUT = float(os.environ.get("SINGLE_FLIGHT_LEASE_TIMEOUT", 90)) # Seconds; > Gemini read timeout
+
+
+class _Call:
+    """An in-flight call that other threads in this process can wait on."""
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one upstream call.
+      - Within a process, followers wait on the leader's result (threads or asyncio tasks).
+      - Across gunicorn workers, the leader holds a lease row in a shared SQLite file;
+        other workers wait for the lease to end and then read the result through `lookup`
+        (the shared response cache), only calling upstream themselves if it isn't there.
+    Expired leases (a crashed leader) are taken over after `lease_timeout` seconds.
+    """
+
+    def __init__(self, db_path=SINGLE_FLIGHT_DB, lease_timeout=SINGLE_FLIGHT_LEASE_TIMEOUT, poll_interval=0.05):
+        self.db_path = db_path
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._calls = {} # key -> _Call (threads)
+        self._async_calls = {} # key -> asyncio.Future (event loop)
+        self.counters = {"leader_calls": 0, "coalesced_local": 0, "coalesced_remote": 0, "lease_timeouts": 0}
+        if db_path:
+            db_dir = os.path.dirname(db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            self._connect().execute(
+                "CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    # --- Cross-worker leases ---
+
+    def _try_acquire_lease(self, key):
+        """Returns an owner token if this worker now holds the lease for key, else None."""
+        owner = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        conn.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (key, now))
+        cursor = conn.execute("INSERT OR IGNORE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                              (key, owner, now + self.lease_timeout))
+        return owner if cursor.rowcount == 1 else None
+
+    def _release_lease(self, key, owner):
+        self._connect().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def _lease_held(self, key):
+        row = self._connect().execute("SELECT 1 FROM leases WHERE key = ? AND expires_at > ?",
+                                      (key, time.time())).fetchone()
+        return row is not None
+
+    def _run_as_leader(self, key, fn, lookup):
+        if not self.db_path:
+            self._count("leader_calls")
+            return fn()
+        try:
+            owner = self._try_acquire_lease(key)
+        except sqlite3.Error as e:
+            print(f"Single-flight lease failed, calling directly: {e}")
+            self._count("leader_calls")
+            return fn()
+
+        if owner:
+            try:
+                self._count("leader_calls")
+                return fn()
+            finally:
+                self._release_lease(key, owner)
+
+        # Another worker is already calling upstream for this key: wait for it to finish
+        deadline = time.monotonic() + self.lease_timeout
+        while self._lease_held(key):
+            if time.monotonic() >= deadline:
+                self._count("lease_timeouts")
+                break
+            time.sleep(self.poll_interval)
+        result = lookup(key) if lookup else None
+        if result is not None:
+            self._count("coalesced_remote")
+            return result
+        self._count("leader_calls")
+        return fn()
+
+    async def _run_as_leader_async(self, key, coro_fn, lookup):
+        if not self.db_path:
+            self._count("leader_calls")
+            return await coro_fn()
+        try:
+            owner = await asyncio.to_thread(self._try_acquire_lease, key)
+        except sqlite3.Error as e:
+            print(f"Single-flight lease failed, calling directly: {e}")
+            self._count("leader_calls")
+            return await coro_fn()
+
+        if owner:
+            try:
+                self._count("leader_calls")
+                return await coro_fn()
+            finally:
+                await asyncio.to_thread(self._release_lease, key, owner)
+
+        deadline = time.monotonic() + self.lease_timeout
+        while await asyncio.to_thread(self._lease_held, key):
+            if time.monotonic() >= deadline:
+                self._count("lease_timeouts")
+                break
+            await asyncio.sleep(self.poll_interval)
+        result = await asyncio.to_thread(lookup, key) if lookup else None
+        if result is not None:
+            self._count("coalesced_remote")
+            return result
+        self._count("leader_calls")
+        return await coro_fn()
+
+    # --- Public API ---
+
+    def do(self, key, fn, lookup=None):
+        """Runs fn() once per key across concurrent callers and returns its result to all of them."""
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.counters["coalesced_local"] += 1
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_as_leader(key, fn, lookup)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def do_async(self, key, coro_fn, lookup=None):
+        """asyncio version of do(); coro_fn is a zero-argument coroutine function."""
+        future = self._async_calls.get(key)
+        if future is not None:
+            self._count("coalesced_local")
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        try:
+            result = await self._run_as_leader_async(key, coro_fn, lookup)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception() # Mark as retrieved when nobody else is waiting
+            raise
+        finally:
+            self._async_calls.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["in_flight"] = len(self._calls) + len(self._async_calls)
+        return stats
+
+
+# Shared coalescing layer used by ask_gemini
+single_flight = SingleFlight()
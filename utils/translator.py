@@ -0,0 +1,217 @@
+# translator.py
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from secrets_config import GOOGLE_TRANSLATE_API_KEY
+
+TRANSLATE_BACKEND = os.environ.get("TRANSLATE_BACKEND", "google" if GOOGLE_TRANSLATE_API_KEY else "local")
+TRANSLATE_API_BASE = os.environ.get("TRANSLATE_API_BASE", "https://translation.googleapis.com/language/translate/v2")
+TRANSLATE_TIMEOUT = (5, 20) # (connect, read) seconds
+TRANSLATE_MAX_BATCH = 128 # Strings per Cloud Translation request (API limit)
+TRANSLATION_CACHE_DB = "data/cache/translations.db"
+TRANSLATION_CACHE_TTL = int(os.environ.get("TRANSLATION_CACHE_TTL", 30 * 24 * 60 * 60)) # Seconds
+TRANSLATION_EVICT_EVERY = 100 # Cached strings written between sweeps of expired rows
+
+# Regional variants that translate differently; every other tag is reduced to its primary language
+_KEEP_REGION = {"zh-cn", "zh-tw", "pt-pt", "pt-br"}
+
+
+def translation_language(tag):
+    """Maps a BCP-47 tag from the UI ('hi-IN', 'es-MX') to the code the translation API expects ('hi', 'es')."""
+    if not tag:
+        return None
+    tag = tag.replace("_", "-")
+    if tag.lower() in _KEEP_REGION:
+        language, region = tag.split("-")
+        return f"{language.lower()}-{region.upper()}"
+    return tag.split("-")[0].lower()
+
+
+def same_language(source, target):
+    return bool(source) and translation_language(source).split("-")[0] == translation_language(target).split("-")[0]
+
+
+class LocalTranslateBackend:
+    """
+    Offline stand-in used in development and tests: returns texts unchanged and reports
+    English. Counts calls so batching and caching can be checked without network access.
+    """
+    name = "local"
+
+    def __init__(self):
+        self.calls = 0
+        self.strings = 0
+
+    def translate_batch(self, texts, target, source=None):
+        self.calls += 1
+        self.strings += len(texts)
+        return list(texts)
+
+    def detect(self, text):
+        return "en"
+
+
+class GoogleTranslateBackend:
+    """Cloud Translation API v2 over a pooled keep-alive session; up to TRANSLATE_MAX_BATCH strings per call."""
+    name = "google"
+
+    def __init__(self, api_key=GOOGLE_TRANSLATE_API_KEY, base_url=TRANSLATE_API_BASE):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        import requests # Only the real backend talks HTTP
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def translate_batch(self, texts, target, source=None):
+        payload = {"q": list(texts), "target": target, "format": "text"}
+        if source:
+            payload["source"] = source
+        response = self.session.post(self.base_url, params={"key": self.api_key}, json=payload,
+                                     timeout=TRANSLATE_TIMEOUT)
+        response.raise_for_status()
+        return [item["translatedText"] for item in response.json()["data"]["translations"]]
+
+    def detect(self, text):
+        response = self.session.post(f"{self.base_url}/detect", params={"key": self.api_key}, json={"q": text},
+                                     timeout=TRANSLATE_TIMEOUT)
+        response.raise_for_status()
+        return response.json()["data"]["detections"][0][0]["language"]
+
+
+class TranslationCache:
+    """Translations in a SQLite file shared by all workers, keyed on (text hash, source, target)."""
+
+    def __init__(self, db_path=TRANSLATION_CACHE_DB, ttl=TRANSLATION_CACHE_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "text_hash TEXT NOT NULL, source TEXT NOT NULL, target TEXT NOT NULL, translated TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, PRIMARY KEY (text_hash, source, target))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_expires ON translations(expires_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, texts, source, target):
+        """Returns {text: translation} for the texts that are cached."""
+        hashes = {self.text_hash(text): text for text in texts}
+        found = {}
+        conn = self._connect()
+        hash_list = list(hashes)
+        for start in range(0, len(hash_list), 500): # Stay under SQLite's bound-parameter limit
+            chunk = hash_list[start:start + 500]
+            rows = conn.execute(
+                f"SELECT text_hash, translated FROM translations WHERE source = ? AND target = ? AND expires_at > ? "
+                f"AND text_hash IN ({','.join('?' * len(chunk))})",
+                [source, target, time.time()] + chunk
+            ).fetchall()
+            for text_hash, translated in rows:
+                found[hashes[text_hash]] = translated
+        return found
+
+    def set_many(self, translations, source, target):
+        expires_at = time.time() + self.ttl
+        self._connect().executemany(
+            "INSERT OR REPLACE INTO translations (text_hash, source, target, translated, expires_at) VALUES (?, ?, ?, ?, ?)",
+            [(self.text_hash(text), source, target, translated, expires_at) for text, translated in translations.items()]
+        )
+        with self._lock:
+            self._writes_since_eviction += len(translations)
+            run_eviction = self._writes_since_eviction >= TRANSLATION_EVICT_EVERY
+            if run_eviction:
+                self._writes_since_eviction = 0
+        if run_eviction:
+            self.evict()
+
+    def evict(self):
+        """Drops expired translations; returns how many."""
+        return self._connect().execute("DELETE FROM translations WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+class TranslationService:
+    """
+    Pluggable translator. Texts already in the target language are returned as-is, cached
+    translations come from the shared cache, and the remaining unique strings go to the
+    backend in batches of up to max_batch per request.
+    """
+
+    def __init__(self, backend, cache=None, max_batch=TRANSLATE_MAX_BATCH):
+        self.backend = backend
+        self.cache = cache
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self.counters = {"strings": 0, "cache_hits": 0, "backend_calls": 0, "backend_strings": 0}
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self.counters[name] += value
+
+    def translate_many(self, texts, target_language, source_language=None):
+        """Translates a list of strings into target_language; returns them in the same order."""
+        target = translation_language(target_language)
+        if not texts or not target or same_language(source_language, target_language):
+            return list(texts)
+        source = translation_language(source_language)
+        source_key = source or "auto"
+        unique = [text for text in dict.fromkeys(texts) if text and text.strip()]
+        translated = self.cache.get_many(unique, source_key, target) if self.cache else {}
+        self._count(strings=len(texts), cache_hits=len(translated))
+
+        missing = [text for text in unique if text not in translated]
+        for start in range(0, len(missing), self.max_batch):
+            batch = missing[start:start + self.max_batch]
+            results = dict(zip(batch, self.backend.translate_batch(batch, target, source)))
+            self._count(backend_calls=1, backend_strings=len(batch))
+            if self.cache:
+                self.cache.set_many(results, source_key, target)
+            translated.update(results)
+        return [translated.get(text, text) for text in texts]
+
+    def translate(self, text, target_language, source_language=None):
+        return self.translate_many([text], target_language, source_language)[0]
+
+    def detect(self, text):
+        return self.backend.detect(text)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["backend"] = self.backend.name
+        return stats
+
+
+def create_translation_service(backend=TRANSLATE_BACKEND):
+    """
+    Builds the configured translator ('google' needs GOOGLE_TRANSLATE_API_KEY; 'local' is the
+    offline stand-in). The stand-in isn't cached, so switching to a real backend never serves its output.
+    """
+    if backend == "google" and GOOGLE_TRANSLATE_API_KEY:
+        return TranslationService(GoogleTranslateBackend(), TranslationCache())
+    return TranslationService(LocalTranslateBackend())
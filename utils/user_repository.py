@@ -0,0 +1,308 @@
+# user_repository.py
+import os
+import re
+import sys
+import sqlite3
+import threading
+
+USER_CSV = "data/users.csv"
+USER_DB = "data/users.db"
+USER_STORE = os.environ.get("USER_STORE", "sqlite")  # 'sqlite' or 'csv'
+
+# Define the expected columns for the users.csv file
+# Added 'height_cm', 'weight_kg', 'bmi', 'medical_conditions', and 'preferred_language'
+EXPECTED_COLUMNS = ["user_id", "name", "email", "hashed_password", "age", "gender", "diet", "goal",
+                    "height_cm", "weight_kg", "bmi", "medical_conditions", "preferred_language"]
+
+
+class UserRepository:
+    """
+    In-process cache of users.csv with hash indexes on user_id and email.
+    The file is only re-parsed when its mtime/size changes (e.g. another worker wrote it),
+    so lookups on the request path are O(1) dict hits instead of a full pd.read_csv.
+    """
+
+    def __init__(self, csv_file_path=USER_CSV):
+        self.csv_file_path = csv_file_path
+        self.generation = 0  # Bumped every time the cache is (re)built
+        self._lock = threading.RLock()
+        self._signature = None
+        self._users_by_id = {}
+        self._user_id_by_email = {}
+
+    def _file_signature(self):
+        """Returns (mtime_ns, size) of the CSV, or None if it does not exist."""
+        try:
+            stat = os.stat(self.csv_file_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, signature):
+        users_by_id = {}
+        user_id_by_email = {}
+        if signature is not None:
+            import pandas as pd # Only the legacy CSV store needs pandas; keep it off the startup path
+            df = pd.read_csv(self.csv_file_path)
+            df = df.astype(object).where(pd.notna(df), None)  # NaN -> None for templates/JSON
+            for record in df.to_dict('records'):
+                for col in EXPECTED_COLUMNS:
+                    record.setdefault(col, None)
+                users_by_id[record['user_id']] = record
+                if record.get('email'):
+                    user_id_by_email[record['email']] = record['user_id']
+
+        self._users_by_id = users_by_id
+        self._user_id_by_email = user_id_by_email
+        self._signature = signature
+        self.generation += 1
+
+    def _refresh(self):
+        """Reloads the cache if the file changed since it was last read."""
+        signature = self._file_signature()
+        if signature != self._signature:
+            self._load(signature)
+
+    def _write(self):
+        """Writes the cached users back to disk atomically and re-arms the mtime check."""
+        import pandas as pd
+        df = pd.DataFrame(list(self._users_by_id.values()), columns=EXPECTED_COLUMNS)
+        tmp_path = f"{self.csv_file_path}.{os.getpid()}.tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.csv_file_path)
+        self._signature = self._file_signature()
+        self.generation += 1
+
+    def invalidate(self):
+        """Forces the next lookup to re-read the CSV."""
+        with self._lock:
+            self._signature = None
+            self._users_by_id = {}
+            self._user_id_by_email = {}
+
+    def get_by_id(self, user_id):
+        """Returns a copy of the user's row as a dict, or None if not found."""
+        with self._lock:
+            self._refresh()
+            user = self._users_by_id.get(user_id)
+            return dict(user) if user is not None else None
+
+    def get_by_email(self, email):
+        """Returns a copy of the user's row as a dict, or None if not found."""
+        with self._lock:
+            self._refresh()
+            user_id = self._user_id_by_email.get(email)
+            if user_id is None:
+                return None
+            return dict(self._users_by_id[user_id])
+
+    def email_exists(self, email):
+        with self._lock:
+            self._refresh()
+            return email in self._user_id_by_email
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self._users_by_id)
+
+    def next_user_id(self):
+        """Generates the next sequential user id (user_1, user_2, ...)."""
+        return f"user_{self.count() + 1}"
+
+    def add_user(self, user_data):
+        """
+        Adds a new user row, allocating a user_id if none is given.
+        Returns the stored record, or None if the email is already registered.
+        """
+        with self._lock:
+            self._refresh()
+            if user_data.get('email') in self._user_id_by_email:
+                return None
+            record = {col: user_data.get(col) for col in EXPECTED_COLUMNS}
+            if not record['user_id']:
+                record['user_id'] = self.next_user_id()
+            self._users_by_id[record['user_id']] = record
+            if record.get('email'):
+                self._user_id_by_email[record['email']] = record['user_id']
+            self._write()
+            return dict(record)
+
+    def update_user(self, user_id, fields):
+        """Updates the given columns of one user. Returns False if the user does not exist."""
+        with self._lock:
+            self._refresh()
+            record = self._users_by_id.get(user_id)
+            if record is None:
+                return False
+            for col, value in fields.items():
+                if col not in EXPECTED_COLUMNS:
+                    continue
+                if col == 'email' and record.get('email') != value:
+                    self._user_id_by_email.pop(record.get('email'), None)
+                    if value:
+                        self._user_id_by_email[value] = user_id
+                record[col] = value
+            self._write()
+            return True
+
+
+class SQLiteUserRepository:
+    """
+    SQLite-backed user store with the same API as UserRepository.
+    Runs in WAL mode with indexes on user_id and email, so lookups and single-row
+    updates are O(log N) and writes from several gunicorn workers are serialized
+    by SQLite instead of racing on a full CSV rewrite.
+    """
+
+    COLUMN_TYPES = {"age": "INTEGER", "height_cm": "REAL", "weight_kg": "REAL", "bmi": "REAL"}
+    USER_ID_PATTERN = re.compile(r"^user_(\d+)$")
+
+    def __init__(self, db_path=USER_DB, csv_import_path=None):
+        self.db_path = db_path
+        self._local = threading.local()
+        is_new = not os.path.exists(db_path)
+        self._initialize_db()
+        # One-shot migration: seed a freshly created database from the legacy CSV
+        if is_new and csv_import_path and os.path.exists(csv_import_path):
+            imported = self.import_csv(csv_import_path)
+            print(f"Imported {imported} users from {csv_import_path} into {db_path}")
+
+    def _connect(self):
+        """Returns this thread's connection (sqlite3 connections are not shared across threads)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def _initialize_db(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        columns = ",\n".join(
+            f"{col} {self.COLUMN_TYPES.get(col, 'TEXT')}" + (" UNIQUE NOT NULL" if col == 'user_id' else "")
+            for col in EXPECTED_COLUMNS
+        )
+        conn = self._connect()
+        # seq drives user_id allocation ("user_<seq>"), so concurrent registrations never collide
+        conn.execute(f"CREATE TABLE IF NOT EXISTS users (seq INTEGER PRIMARY KEY AUTOINCREMENT,\n{columns})")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users(email)")
+
+    @staticmethod
+    def _row_to_dict(row):
+        if row is None:
+            return None
+        return {col: row[col] for col in EXPECTED_COLUMNS}
+
+    def get_by_id(self, user_id):
+        row = self._connect().execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return self._row_to_dict(row)
+
+    def get_by_email(self, email):
+        row = self._connect().execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        return self._row_to_dict(row)
+
+    def email_exists(self, email):
+        return self._connect().execute("SELECT 1 FROM users WHERE email = ?", (email,)).fetchone() is not None
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def add_user(self, user_data):
+        """
+        Inserts a new user, allocating user_<seq> atomically if no user_id is given.
+        Returns the stored record, or None if the email is already registered.
+        """
+        record = {col: user_data.get(col) for col in EXPECTED_COLUMNS}
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if record['user_id']:
+                self._insert(conn, record)
+            else:
+                record['user_id'] = f"pending_{os.getpid()}_{threading.get_ident()}"
+                seq = self._insert(conn, record)
+                record['user_id'] = f"user_{seq}"
+                conn.execute("UPDATE users SET user_id = ? WHERE seq = ?", (record['user_id'], seq))
+            conn.execute("COMMIT")
+        except sqlite3.IntegrityError:
+            conn.execute("ROLLBACK")
+            return None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get_by_id(record['user_id'])
+
+    def _insert(self, conn, record, seq=None):
+        cols = ["seq"] + EXPECTED_COLUMNS
+        placeholders = ", ".join("?" for _ in cols)
+        cursor = conn.execute(
+            f"INSERT INTO users ({', '.join(cols)}) VALUES ({placeholders})",
+            [seq] + [record[col] for col in EXPECTED_COLUMNS]
+        )
+        return cursor.lastrowid
+
+    def upsert_user(self, user_data):
+        """Inserts the user or updates every provided column of the existing row, atomically."""
+        record = {col: user_data.get(col) for col in EXPECTED_COLUMNS}
+        match = self.USER_ID_PATTERN.match(str(record['user_id']))
+        seq = int(match.group(1)) if match else None
+        cols = ["seq"] + EXPECTED_COLUMNS
+        updates = ", ".join(f"{col} = excluded.{col}" for col in EXPECTED_COLUMNS if col != 'user_id')
+        conn = self._connect()
+        conn.execute(
+            f"INSERT INTO users ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)}) "
+            f"ON CONFLICT(user_id) DO UPDATE SET {updates}",
+            [seq] + [record[col] for col in EXPECTED_COLUMNS]
+        )
+
+    def update_user(self, user_id, fields):
+        """Updates the given columns of one user. Returns False if the user does not exist."""
+        fields = {col: value for col, value in fields.items() if col in EXPECTED_COLUMNS and col != 'user_id'}
+        if not fields:
+            return self.get_by_id(user_id) is not None
+        assignments = ", ".join(f"{col} = ?" for col in fields)
+        cursor = self._connect().execute(
+            f"UPDATE users SET {assignments} WHERE user_id = ?", list(fields.values()) + [user_id]
+        )
+        return cursor.rowcount > 0
+
+    def import_csv(self, csv_path):
+        """Imports (upserts) every row of a legacy users.csv in one transaction. Returns the row count."""
+        import pandas as pd
+        df = pd.read_csv(csv_path)
+        df = df.astype(object).where(pd.notna(df), None)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            records = df.to_dict('records')
+            for record in records:
+                self.upsert_user(record)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(records)
+
+
+def create_user_repository(store=USER_STORE):
+    """Builds the configured user store ('sqlite' by default, 'csv' for the legacy file)."""
+    if store == 'csv':
+        return UserRepository(USER_CSV)
+    return SQLiteUserRepository(USER_DB) # Seeded from users.csv by `python -m utils.migrations` (Procfile)
+
+
+# Shared repository used by all routes
+user_repo = create_user_repository()
+
+
+if __name__ == '__main__':
+    # One-shot importer: python -m utils.user_repository [path/to/users.csv]
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else USER_CSV
+    count = SQLiteUserRepository(USER_DB).import_csv(csv_path)
+    print(f"Imported {count} users from {csv_path} into {USER_DB}")